@@ -0,0 +1,249 @@
+"""Локальные заглушки Bot API и OpenAI chat completions для нагрузочных прогонов"""
+import asyncio
+import json
+import random
+import re
+import time
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl
+
+from bot.http_server import HTTPServer, Request, Response
+
+
+def _json_response(payload: dict, status: int = 200) -> Response:
+    return Response(status, json.dumps(payload, ensure_ascii=False).encode(), content_type="application/json")
+
+
+def _parse_params(request: Request) -> Dict[str, str]:
+    """PTB шлет параметры как form-urlencoded, остальные клиенты - как JSON"""
+    if not request.body:
+        return {}
+    if request.headers.get("content-type", "").startswith("application/json"):
+        return json.loads(request.body)
+    return dict(parse_qsl(request.body.decode()))
+
+
+class SentMessage:
+    __slots__ = ("chat_id", "text", "reply_to_message_id", "message_id", "received_at")
+
+    def __init__(self, chat_id, text: str, reply_to_message_id: Optional[int], message_id: int, received_at: float):
+        self.chat_id = chat_id
+        self.text = text
+        self.reply_to_message_id = reply_to_message_id
+        self.message_id = message_id
+        self.received_at = received_at
+
+
+class FakeTelegramServer:
+    """Заглушка Bot API: отвечает на getMe/sendMessage/editMessageText и записывает отправленное
+
+    latency - средняя задержка ответа, error_rate - доля ответов 429 с retry_after.
+    """
+
+    def __init__(self, token: str = "123456:BENCH", username: str = "bench_bot", bot_id: int = 123456,
+                 latency: float = 0.03, jitter: float = 0.02, error_rate: float = 0.0, retry_after: int = 1):
+        self.token = token
+        self.username = username
+        self.bot_id = bot_id
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.server = HTTPServer("127.0.0.1", 0, name="fake-telegram")
+        self.sent: List[SentMessage] = []
+        self.edits = 0
+        self.errors = 0
+        # Обновления для getUpdates (прогоны с отдельным процессом, например супервизором)
+        self.pending_updates: List[dict] = []
+        self._updates_added = asyncio.Event()
+        self._message_ids = iter(range(1_000_000, 10**9))
+        for method, handler in {
+            "getMe": self._get_me,
+            "sendMessage": self._send_message,
+            "editMessageText": self._edit_message_text,
+            "setWebhook": self._ok,
+            "deleteWebhook": self._ok,
+            "getUpdates": self._get_updates,
+        }.items():
+            self.server.route("POST", f"/bot{token}/{method}", handler)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.bound_port}/bot"
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
+
+    async def _delay(self) -> Optional[Response]:
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            return _json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+        return None
+
+    def _message(self, chat_id, text: str, message_id: int) -> dict:
+        chat_id = int(chat_id) if str(chat_id).lstrip("-").isdigit() else chat_id
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id if isinstance(chat_id, int) else -1, "type": "supergroup"},
+            "from": {"id": self.bot_id, "is_bot": True, "first_name": "bench", "username": self.username},
+            "text": text,
+        }
+
+    async def _get_me(self, request: Request) -> Response:
+        return _json_response({"ok": True, "result": {
+            "id": self.bot_id, "is_bot": True, "first_name": "bench", "username": self.username,
+            "can_join_groups": True, "can_read_all_group_messages": True, "supports_inline_queries": False,
+        }})
+
+    async def _send_message(self, request: Request) -> Response:
+        error = await self._delay()
+        if error:
+            return error
+        params = _parse_params(request)
+        message_id = next(self._message_ids)
+        reply_to = params.get("reply_to_message_id")
+        if not reply_to and params.get("reply_parameters"):
+            # Начиная с Bot API 7.0 PTB передает ответ через reply_parameters
+            reply_parameters = params["reply_parameters"]
+            if isinstance(reply_parameters, str):
+                reply_parameters = json.loads(reply_parameters)
+            reply_to = reply_parameters.get("message_id")
+        self.sent.append(SentMessage(
+            params.get("chat_id"), params.get("text", ""), int(reply_to) if reply_to else None,
+            message_id, time.monotonic()
+        ))
+        return _json_response({"ok": True, "result": self._message(params.get("chat_id"), params.get("text", ""), message_id)})
+
+    async def _edit_message_text(self, request: Request) -> Response:
+        error = await self._delay()
+        if error:
+            return error
+        params = _parse_params(request)
+        self.edits += 1
+        return _json_response({"ok": True, "result": self._message(
+            params.get("chat_id"), params.get("text", ""), int(params.get("message_id", 0))
+        )})
+
+    def push_update(self, update: dict):
+        """Кладет обновление в выдачу getUpdates"""
+        self.pending_updates.append(update)
+        self._updates_added.set()
+
+    async def _get_updates(self, request: Request) -> Response:
+        # Обычно обновления подаются напрямую в update_queue, и список пуст
+        offset = int(_parse_params(request).get("offset") or 0)
+        self.pending_updates = [u for u in self.pending_updates if u["update_id"] >= offset]
+        if not self.pending_updates:
+            self._updates_added.clear()
+            try:
+                await asyncio.wait_for(self._updates_added.wait(), 1)
+            except asyncio.TimeoutError:
+                pass
+        return _json_response({"ok": True, "result": self.pending_updates[:100]})
+
+    async def _ok(self, request: Request) -> Response:
+        return _json_response({"ok": True, "result": True})
+
+
+class FakeOpenAIServer:
+    """Заглушка /v1/chat/completions с настраиваемой задержкой и долей ошибок 500
+
+    При stream=true первый фрагмент приходит через first_token_share от задержки,
+    остальные слова - равномерно за оставшееся время, как у настоящего API.
+    """
+
+    def __init__(self, latency: float = 0.8, jitter: float = 0.3, error_rate: float = 0.0,
+                 first_token_share: float = 0.2):
+        self.latency = latency
+        self.first_token_share = first_token_share
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.server = HTTPServer("127.0.0.1", 0, name="fake-openai")
+        self.server.route("POST", "/v1/chat/completions", self._completions)
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.bound_port}/v1"
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
+
+    async def _completions(self, request: Request) -> Response:
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            latency = max(0.0, random.gauss(self.latency, self.jitter))
+            payload = json.loads(request.body)
+            streaming = bool(payload.get("stream"))
+            await asyncio.sleep(latency * self.first_token_share if streaming else latency)
+            if self.error_rate and random.random() < self.error_rate:
+                self.errors += 1
+                return _json_response({"error": {"message": "fake overload", "type": "server_error"}}, status=500)
+
+            prompt_tokens = sum(len(m.get("content", "")) for m in payload.get("messages", [])) // 4
+            phrases = [
+                "Ясно, понятно. Короче, че надо?",
+                "Слышь, ты кто вообще такой?",
+                "Короче, решил я тут пофилософствовать...",
+            ]
+            text = random.choice(phrases)
+            completion_tokens = 20
+            # Пакетный запрос комментариев просит ответить N пронумерованными строками
+            batch = re.search(r"ровно (\d+) строк", payload.get("messages", [{}])[-1].get("content", ""))
+            if batch:
+                count = int(batch.group(1))
+                text = "\n".join(f"{index}. {random.choice(phrases)}" for index in range(1, count + 1))
+                completion_tokens *= count
+            if streaming:
+                self.in_flight += 1  # Уменьшится, когда поток допишется
+                return Response(200, self._stream(payload, text, latency * (1 - self.first_token_share)),
+                                content_type="text/event-stream")
+            return _json_response({
+                "id": f"chatcmpl-bench-{self.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload.get("model", "bench"),
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+        finally:
+            self.in_flight -= 1
+
+    async def _stream(self, payload: dict, text: str, duration: float):
+        """События SSE с фрагментами ответа"""
+        try:
+            words = text.split(" ")
+            for index, word in enumerate(words):
+                if index:
+                    await asyncio.sleep(duration / (len(words) - 1))
+                chunk = {
+                    "id": f"chatcmpl-bench-{self.requests}",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": payload.get("model", "bench"),
+                    "choices": [{"index": 0, "finish_reason": None,
+                                 "delta": {"content": word if index == 0 else " " + word}}],
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode()
+            yield b"data: [DONE]\n\n"
+        finally:
+            self.in_flight -= 1
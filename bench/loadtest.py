@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""Офлайн нагрузочный прогон TelegramBotHandler с заглушками Bot API и OpenAI
+
+Поднимает локальные FakeTelegramServer и FakeOpenAIServer, настраивает на них
+настоящие TelegramBotHandler и SchedulerManager и подает синтетические сообщения
+из нескольких групп в update_queue приложения с заданной частотой. В конце
+печатает пропускную способность, перцентили задержки ответов и память.
+
+Примеры:
+    python -m bench.loadtest --chats 50 --rate 100 --duration 30
+    python -m bench.loadtest --llm-latency 3 --llm-error-rate 0.1 --no-rate-limit --json report.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+import tracemalloc
+import types
+from typing import Dict, List
+
+# Переменные окружения нужны до импорта bot.config
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:BENCH")
+os.environ.setdefault("OPENAI_API_KEY", "bench-key")
+os.environ.setdefault("TELEGRAM_CHANNEL_ID", "-1000000000000")
+
+from loguru import logger
+from telegram import Update
+
+import bot.config as bot_config
+from bench.fakes import FakeOpenAIServer, FakeTelegramServer
+from bench.report import latency_summary, max_rss_mb
+from bot.chatgpt_client import ChatGPTClient, close_shared_http_client
+from bot.response_cache import ResponseCache
+from bot.scheduler import SchedulerManager
+from bot.telegram_handler import TelegramBotHandler
+
+
+CHAT_BASE_ID = -1000000000000
+PHRASES = ["ну че как", "короче", "ясно, понятно", "кто тут", "а что если мы все живем в матрице", "лол"]
+
+
+def make_config(telegram: FakeTelegramServer, args) -> types.SimpleNamespace:
+    """Копия bot.config, направленная на заглушки"""
+    config = types.SimpleNamespace(**{name: getattr(bot_config, name) for name in dir(bot_config) if name.isupper()})
+    config.BOT_TOKEN = telegram.token
+    config.TELEGRAM_API_BASE_URL = telegram.base_url
+    config.CHANNEL_ID = str(CHAT_BASE_ID)
+    config.ALLOW_ALL_CHATS = True
+    config.UPDATE_MODE = "polling"
+    # По умолчанию не пишем состояние на диск, чтобы прогоны не влияли друг на друга
+    config.STATE_DB_PATH = args.state_db or ""
+    config.RECORD_UPDATES_PATH = args.record or ""
+    if args.streaming:
+        config.STREAMING_REPLIES = True
+    if args.workers is not None:
+        config.UPDATE_WORKERS = args.workers
+    if args.no_rate_limit:
+        config.TELEGRAM_GLOBAL_RATE = 1e6
+        config.TELEGRAM_CHAT_RATE = 1e6
+        config.TELEGRAM_GROUP_RATE_PER_MINUTE = 1e8
+        config.TELEGRAM_CHAT_BURST = 1e6
+    return config
+
+
+def make_update(update_id: int, chat_index: int, user_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"user{user_id}"},
+            "chat": {"id": CHAT_BASE_ID - chat_index, "type": "supergroup", "title": f"bench {chat_index}"},
+            "date": int(time.time()),
+            "text": text,
+        },
+    }
+
+
+async def run(args) -> Dict[str, object]:
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    telegram = FakeTelegramServer(latency=args.tg_latency, error_rate=args.tg_error_rate)
+    openai = FakeOpenAIServer(latency=args.llm_latency, jitter=args.llm_jitter, error_rate=args.llm_error_rate)
+    await telegram.start()
+    await openai.start()
+
+    response_cache = None
+    if args.response_cache:
+        response_cache = ResponseCache(
+            max_entries=bot_config.RESPONSE_CACHE_SIZE,
+            ttl=bot_config.RESPONSE_CACHE_TTL,
+            reuse_probability=args.response_cache,
+            max_variants=bot_config.RESPONSE_CACHE_VARIANTS,
+        )
+    chatgpt_client = ChatGPTClient(base_url=openai.base_url, response_cache=response_cache)
+    handler = TelegramBotHandler(make_config(telegram, args), chatgpt_client)
+    await handler.initialize()
+    application = handler.application
+    await application.start()
+
+    scheduler = SchedulerManager(handler, chatgpt_client)
+    scheduler.set_channel_id(handler.channel_id)
+
+    # Замер времени обработки каждого сообщения обработчиком
+    handler_latencies: List[float] = []
+    original_handle = handler.handle_channel_message
+
+    async def timed_handle(update, context):
+        started = time.perf_counter()
+        try:
+            await original_handle(update, context)
+        finally:
+            handler_latencies.append(time.perf_counter() - started)
+
+    handler.handle_channel_message = timed_handle
+
+    # Замер каждого поста по расписанию (генерация + отправка), пропуски активных чатов не считаются
+    scheduled_latencies: List[float] = []
+    original_post = scheduler.post_to_chat
+
+    async def timed_post(chat_id):
+        if handler.is_chat_active(chat_id):
+            return await original_post(chat_id)
+        started = time.monotonic()
+        await original_post(chat_id)
+        scheduled_latencies.append(time.monotonic() - started)
+
+    scheduler.post_to_chat = timed_post
+
+    mention_sent_at: Dict[int, float] = {}
+    scheduler_runs = 0
+    total = int(args.rate * args.duration)
+    update_ids = itertools.count(1)
+
+    async def scheduled_posts():
+        nonlocal scheduler_runs
+        while True:
+            await asyncio.sleep(args.scheduler_interval)
+            await scheduler.post_random_content()
+            scheduler_runs += 1
+
+    scheduler_task = asyncio.create_task(scheduled_posts()) if args.scheduler_interval else None
+
+    logger.info(f"Sending {total} updates from {args.chats} chats at {args.rate}/s")
+    started = time.monotonic()
+    for i in range(total):
+        # Открытая модель нагрузки: сообщения идут по расписанию, не дожидаясь ответов
+        delay = started + i / args.rate - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        update_id = next(update_ids)
+        chat_index = random.randrange(args.chats)
+        user_id = 1000 + random.randrange(args.users)
+        if random.random() < args.mention_ratio:
+            text = f"@{telegram.username} {random.choice(PHRASES)}"
+            mention_sent_at[update_id] = time.monotonic()
+        else:
+            text = random.choice(PHRASES)
+        update = Update.de_json(make_update(update_id, chat_index, user_id, text), application.bot)
+        await application.update_queue.put(update)
+    ingest_elapsed = time.monotonic() - started
+
+    # Ждем, пока обработчики закончат, но не дольше drain секунд
+    deadline = time.monotonic() + args.drain
+    while time.monotonic() < deadline:
+        if len(handler_latencies) >= total and application.update_queue.empty() and handler.sender.queue_depth == 0:
+            break
+        await asyncio.sleep(0.1)
+    elapsed = time.monotonic() - started
+
+    if scheduler_task:
+        scheduler_task.cancel()
+
+    mention_latencies = [
+        message.received_at - mention_sent_at[message.reply_to_message_id]
+        for message in telegram.sent
+        if message.reply_to_message_id in mention_sent_at
+    ]
+
+    report = {
+        "updates_sent": total,
+        "updates_handled": len(handler_latencies),
+        "ingest_rate_per_s": round(total / ingest_elapsed, 1) if ingest_elapsed else None,
+        "throughput_per_s": round(len(handler_latencies) / elapsed, 1) if elapsed else None,
+        "elapsed_s": round(elapsed, 2),
+        **latency_summary(handler_latencies, "handler"),
+        "mentions": len(mention_sent_at),
+        "mention_replies": len(mention_latencies),
+        **latency_summary(mention_latencies, "mention_reply"),
+        "comments": sum(1 for message in telegram.sent if message.reply_to_message_id is None) - len(scheduled_latencies),
+        "scheduler_runs": scheduler_runs,
+        **latency_summary(scheduled_latencies, "scheduled_post"),
+        "openai_requests": openai.requests,
+        "openai_errors": openai.errors,
+        "openai_max_in_flight": openai.max_in_flight,
+        "telegram_sent": len(telegram.sent),
+        "telegram_429": telegram.errors,
+        "telegram_edits": telegram.edits,
+        "update_filter": handler.update_filter.stats(),
+        "sender": handler.sender.stats(),
+        "admission": handler.chatgpt_client.admission.stats(),
+        "openai_client": handler.chatgpt_client.stats(),
+        "comment_batcher": handler.comment_batcher.stats() if handler.comment_batcher else None,
+        "tracked_chats": len(handler.chats),
+        "max_rss_mb": max_rss_mb(),
+    }
+    if args.tracemalloc:
+        report["tracemalloc_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+        tracemalloc.stop()
+
+    # Остановка как по SIGTERM: недоделанное за stop_timeout секунд попадает в отчет
+    stop_started = time.monotonic()
+    report["shutdown_dropped"] = await handler.stop(args.stop_timeout)
+    report["shutdown_s"] = round(time.monotonic() - stop_started, 2)
+    await close_shared_http_client()
+    await telegram.stop()
+    await openai.stop()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=20, help="Сколько групп пишут одновременно")
+    parser.add_argument("--users", type=int, default=200, help="Сколько разных пользователей")
+    parser.add_argument("--rate", type=float, default=50, help="Сообщений в секунду суммарно")
+    parser.add_argument("--duration", type=float, default=10, help="Сколько секунд подавать нагрузку")
+    parser.add_argument("--drain", type=float, default=30, help="Сколько секунд ждать завершения после нагрузки")
+    parser.add_argument("--stop-timeout", type=float, default=10, help="Сколько секунд дается на остановку (SHUTDOWN_DRAIN_TIMEOUT)")
+    parser.add_argument("--mention-ratio", type=float, default=0.1, help="Доля сообщений с упоминанием бота")
+    parser.add_argument("--workers", type=int, help="Переопределить UPDATE_WORKERS")
+    parser.add_argument("--scheduler-interval", type=float, default=0, help="Раз в сколько секунд запускать пост по расписанию (0 - не запускать)")
+    parser.add_argument("--llm-latency", type=float, default=0.8)
+    parser.add_argument("--llm-jitter", type=float, default=0.3)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--tg-latency", type=float, default=0.03)
+    parser.add_argument("--tg-error-rate", type=float, default=0.0, help="Доля ответов 429 от Bot API")
+    parser.add_argument("--no-rate-limit", action="store_true", help="Отключить лимиты очереди отправки")
+    parser.add_argument("--streaming", action="store_true", help="Потоковые ответы на упоминания с правками сообщения")
+    parser.add_argument("--response-cache", type=float, default=0,
+                        help="Включить кэш ответов с этой вероятностью повторного использования (0 - выключен)")
+    parser.add_argument("--state-db", help="Сохранять состояние чатов в этот SQLite-файл")
+    parser.add_argument("--record", help="Записать поданные обновления в журнал для bench.replay (.jsonl.gz)")
+    parser.add_argument("--tracemalloc", action="store_true", help="Замерить пик памяти Python-объектов (медленнее)")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", help="Сохранить отчет в файл")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(lambda message: print(message, end=""), level=args.log_level)
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
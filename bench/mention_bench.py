@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Микробенчмарк определения обращения к боту: прежний is_bot_mentioned против MentionDetector
+
+Примеры:
+    python -m bench.mention_bench
+    python -m bench.mention_bench --messages 20000 --mention-ratio 0.05 --alias пидарбот
+"""
+import argparse
+import json
+import random
+import time
+from typing import List, Optional
+
+from loguru import logger
+from telegram import Message
+
+from bot.mention import MentionDetector
+
+BOT_ID = 123456
+BOT_USERNAME = "Bench_Bot"
+PHRASES = ["ну че как", "короче", "ясно, понятно", "кто тут", "а что если мы все живем в матрице", "лол"]
+
+
+def legacy_is_bot_mentioned(message: Message, bot_id: int, bot_username: Optional[str]) -> bool:
+    """Реализация из TelegramBotHandler до MentionDetector (для сравнения)"""
+    if not message.text:
+        return False
+    if message.from_user and message.from_user.id == bot_id:
+        return False
+    text_lower = message.text.lower()
+    if bot_username:
+        bot_mentions = [
+            f"@{bot_username}",
+            f"@{bot_username.lower()}",
+            f"@{(bot_username.lower())}",
+        ]
+        for mention in bot_mentions:
+            if mention in text_lower:
+                logger.info(f"Bot mentioned via @username: {mention}")
+                return True
+    if message.reply_to_message:
+        reply_to = message.reply_to_message
+        if reply_to.from_user and reply_to.from_user.id == bot_id:
+            logger.info("Bot mentioned via reply to bot's message")
+            return True
+    if message.entities:
+        for entity in message.entities:
+            if entity.type == "mention" and bot_username:
+                mention_text = message.text[entity.offset:entity.offset + entity.length].lower()
+                if f"@{bot_username.lower()}" in mention_text:
+                    logger.info("Bot mentioned via entity")
+                    return True
+    return False
+
+
+def synthetic_messages(count: int, mention_ratio: float, reply_ratio: float, long_ratio: float) -> List[Message]:
+    """Сообщения группы: обычные, длинные, с упоминанием бота или другого пользователя, ответы боту"""
+    messages = []
+    for i in range(count):
+        text = random.choice(PHRASES)
+        if random.random() < long_ratio:
+            text = " ".join(random.choice(PHRASES) for _ in range(60))
+        entities = []
+        roll = random.random()
+        if roll < mention_ratio:
+            mention = f"@{BOT_USERNAME}"
+            entities.append({"type": "mention", "offset": 0, "length": len(mention)})
+            text = f"{mention} {text}"
+        elif roll < mention_ratio * 3:
+            mention = f"@user{random.randrange(1000)}"
+            entities.append({"type": "mention", "offset": 0, "length": len(mention)})
+            text = f"{mention} {text}"
+        payload = {
+            "message_id": i + 1,
+            "date": int(time.time()),
+            "chat": {"id": -1000000000000, "type": "supergroup"},
+            "from": {"id": 1000 + random.randrange(500), "is_bot": False, "first_name": "user"},
+            "text": text,
+        }
+        if entities:
+            payload["entities"] = entities
+        if random.random() < reply_ratio:
+            payload["reply_to_message"] = {
+                "message_id": 1, "date": int(time.time()),
+                "chat": {"id": -1000000000000, "type": "supergroup"},
+                "from": {"id": random.choice([BOT_ID, 1001]), "is_bot": False, "first_name": "x"},
+                "text": "раньше",
+            }
+        messages.append(Message.de_json(payload, None))
+    return messages
+
+
+def measure(check, messages: List[Message], rounds: int) -> dict:
+    started = time.perf_counter()
+    hits = 0
+    for _ in range(rounds):
+        for message in messages:
+            hits += check(message)
+    elapsed = time.perf_counter() - started
+    calls = rounds * len(messages)
+    return {"calls": calls, "hits": hits // rounds, "ns_per_call": round(elapsed / calls * 1e9, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--mention-ratio", type=float, default=0.1)
+    parser.add_argument("--reply-ratio", type=float, default=0.05)
+    parser.add_argument("--long-ratio", type=float, default=0.1, help="Доля длинных сообщений (~1.5 КБ)")
+    parser.add_argument("--alias", action="append", default=[], help="Прозвище бота (можно несколько)")
+    args = parser.parse_args()
+
+    # Логи обнаружения в прежней реализации не должны попадать в замер вывода
+    logger.remove()
+    random.seed(1)
+    messages = synthetic_messages(args.messages, args.mention_ratio, args.reply_ratio, args.long_ratio)
+    detector = MentionDetector(BOT_ID, BOT_USERNAME, args.alias)
+
+    legacy = measure(lambda m: legacy_is_bot_mentioned(m, BOT_ID, BOT_USERNAME), messages, args.rounds)
+    current = measure(detector.is_mentioned, messages, args.rounds)
+    mismatches = sum(
+        legacy_is_bot_mentioned(m, BOT_ID, BOT_USERNAME) != detector.is_mentioned(m) for m in messages
+    )
+    print(json.dumps({
+        "messages": len(messages),
+        "legacy": legacy,
+        "detector": current,
+        "speedup": round(legacy["ns_per_call"] / current["ns_per_call"], 2),
+        "mismatches": mismatches,
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
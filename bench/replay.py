@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""Воспроизведение журнала обновлений (RECORD_UPDATES_PATH) через настоящий TelegramBotHandler
+
+Обновления подаются в update_queue приложения с записанными интервалами (--speed 1), ускоренно
+(--speed 10) или без пауз (--speed 0). Bot API и OpenAI заменены заглушками из bench.fakes,
+случайности зафиксированы --seed, поэтому отчеты разных версий бота по одному журналу сравнимы:
+--baseline печатает изменение каждой метрики относительно сохраненного отчета.
+
+Примеры:
+    python -m bench.replay data/updates.jsonl.gz
+    python -m bench.replay data/updates.jsonl.gz --speed 0 --json before.json
+    python -m bench.replay data/updates.jsonl.gz --speed 0 --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+from telegram import Update
+
+from bench.fakes import FakeOpenAIServer, FakeTelegramServer
+from bench.loadtest import make_config
+from bench.report import latency_summary, max_rss_mb
+from bot.chatgpt_client import ChatGPTClient, close_shared_http_client
+from bot.telegram_handler import TelegramBotHandler
+from bot.update_recorder import read_update_log
+
+
+def load_log(path: str, limit: Optional[int] = None) -> Tuple[dict, List[Tuple[float, dict]]]:
+    """Бот из заголовка журнала и записи (время, обновление) по порядку"""
+    bot = {}
+    entries: List[Tuple[float, dict]] = []
+    for entry in read_update_log(path):
+        if "bot" in entry:
+            # После перезапуска заголовок повторяется; бот тот же, берем первый
+            bot = bot or entry["bot"]
+        elif "u" in entry:
+            entries.append((entry["t"], entry["u"]))
+            if limit and len(entries) >= limit:
+                break
+    return bot, entries
+
+
+def _message_key(update: dict) -> Optional[Tuple[int, int]]:
+    for kind in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        message = update.get(kind)
+        if message is not None:
+            return message["chat"]["id"], message["message_id"]
+    return None
+
+
+async def run(args) -> Dict[str, object]:
+    random.seed(args.seed)
+    bot, entries = load_log(args.log, args.limit)
+    if not entries:
+        raise SystemExit(f"No updates in {args.log}")
+
+    # Заглушка Bot API представляется записанным ботом, чтобы упоминания и ответы ему распознавались
+    telegram = FakeTelegramServer(
+        username=bot.get("username") or "bench_bot",
+        bot_id=bot.get("id") or 123456,
+        latency=args.tg_latency,
+    )
+    openai = FakeOpenAIServer(latency=args.llm_latency, jitter=args.llm_jitter)
+    await telegram.start()
+    await openai.start()
+
+    config = make_config(telegram, args)
+    handler = TelegramBotHandler(config, ChatGPTClient(base_url=openai.base_url))
+    await handler.initialize()
+    application = handler.application
+    await application.start()
+
+    handler_latencies: List[float] = []
+    original_handle = handler.handle_channel_message
+
+    async def timed_handle(update, context):
+        started = time.perf_counter()
+        try:
+            await original_handle(update, context)
+        finally:
+            handler_latencies.append(time.perf_counter() - started)
+
+    handler.handle_channel_message = timed_handle
+
+    # Когда каждое сообщение попало в очередь - для задержки ответов на него
+    fed_at: Dict[Tuple[int, int], float] = {}
+    first_recorded = entries[0][0]
+    recorded_duration = entries[-1][0] - first_recorded
+    max_lag = 0.0
+    logger.info(f"Replaying {len(entries)} updates recorded over {recorded_duration:.1f}s at speed {args.speed or 'max'}")
+    started = time.monotonic()
+    for recorded_at, payload in entries:
+        if args.speed > 0:
+            due = started + (recorded_at - first_recorded) / args.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+        key = _message_key(payload)
+        if key is not None:
+            fed_at[key] = time.monotonic()
+        await application.update_queue.put(Update.de_json(payload, application.bot))
+    feed_elapsed = time.monotonic() - started
+
+    # Ждем, пока обработчики и очередь отправки закончат, но не дольше drain секунд. Обновление готово,
+    # когда процессор его закончил: отброшенные фильтром до обработчика не доходят, но тоже проходят через процессор
+    processor = application.update_processor
+    deadline = time.monotonic() + args.drain
+    while time.monotonic() < deadline:
+        if (processor.processed + processor.dropped >= len(entries) and processor.pending == 0
+                and application.update_queue.empty() and handler.sender.queue_depth == 0):
+            break
+        await asyncio.sleep(0.1)
+    elapsed = time.monotonic() - started
+
+    # chat_id в заглушке - как пришел в запросе (в форме это строка)
+    replies = ((message.received_at, (int(message.chat_id), message.reply_to_message_id)) for message in telegram.sent
+               if message.reply_to_message_id is not None)
+    reply_latencies = [received_at - fed_at[key] for received_at, key in replies if key in fed_at]
+    report = {
+        "log": args.log,
+        "speed": args.speed,
+        "updates": len(entries),
+        "chats": len({key[0] for key in fed_at}),
+        "recorded_duration_s": round(recorded_duration, 2),
+        "feed_elapsed_s": round(feed_elapsed, 2),
+        "feed_max_lag_ms": round(max_lag * 1000, 1),
+        "elapsed_s": round(elapsed, 2),
+        "updates_handled": len(handler_latencies),
+        "updates_filtered": sum(handler.update_filter.dropped),
+        "throughput_per_s": round(processor.processed / elapsed, 1) if elapsed else None,
+        **latency_summary(handler_latencies, "handler"),
+        "replies": len(reply_latencies),
+        **latency_summary(reply_latencies, "reply"),
+        "messages_sent": len(telegram.sent),
+        "openai_requests": openai.requests,
+        "update_filter": handler.update_filter.stats(),
+        "max_rss_mb": max_rss_mb(),
+    }
+
+    report["shutdown_dropped"] = await handler.stop(args.stop_timeout)
+    await close_shared_http_client()
+    await telegram.stop()
+    await openai.stop()
+    return report
+
+
+def compare(report: dict, baseline: dict) -> List[str]:
+    """Строки "метрика: было -> стало (+N%)" для числовых метрик, есть в обоих отчетах"""
+    lines = []
+    for key, value in report.items():
+        old = baseline.get(key)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+            continue
+        change = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+        lines.append(f"{key:<24}{old:>12} -> {value:<12}{change}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("log", help="Журнал обновлений (.jsonl.gz из RECORD_UPDATES_PATH)")
+    parser.add_argument("--speed", type=float, default=1, help="Во сколько раз быстрее записи (0 - без пауз)")
+    parser.add_argument("--limit", type=int, help="Воспроизвести только первые N обновлений")
+    parser.add_argument("--seed", type=int, default=1, help="Seed случайностей бота и заглушек")
+    parser.add_argument("--drain", type=float, default=30, help="Сколько секунд ждать завершения после подачи")
+    parser.add_argument("--stop-timeout", type=float, default=10, help="Сколько секунд дается на остановку")
+    parser.add_argument("--workers", type=int, help="Переопределить UPDATE_WORKERS")
+    parser.add_argument("--llm-latency", type=float, default=0.8)
+    parser.add_argument("--llm-jitter", type=float, default=0.3)
+    parser.add_argument("--tg-latency", type=float, default=0.03)
+    parser.add_argument("--no-rate-limit", action="store_true", help="Отключить лимиты очереди отправки")
+    parser.add_argument("--streaming", action="store_true", help="Потоковые ответы на упоминания с правками сообщения")
+    parser.add_argument("--baseline", help="Отчет прошлого прогона (--json) для сравнения")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", help="Сохранить отчет в файл")
+    args = parser.parse_args()
+    # Состояние на диск не пишется, журнал не пополняется: прогоны не должны влиять друг на друга
+    args.state_db = None
+    args.record = None
+
+    logger.remove()
+    logger.add(lambda message: print(message, end=""), level=args.log_level)
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nCompared to {args.baseline}:")
+        print("\n".join(compare(report, baseline)))
+
+
+if __name__ == "__main__":
+    main()
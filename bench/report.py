@@ -0,0 +1,27 @@
+"""Общие функции для отчетов нагрузочных прогонов"""
+import resource
+import sys
+from typing import Dict, List, Optional
+
+from bot.metrics import percentile
+
+
+def latency_summary(values: List[float], prefix: str = "latency") -> Dict[str, Optional[float]]:
+    """p50/p95/p99/max в миллисекундах"""
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        f"{prefix}_count": len(values),
+        f"{prefix}_p50_ms": ms(percentile(values, 50)),
+        f"{prefix}_p95_ms": ms(percentile(values, 95)),
+        f"{prefix}_p99_ms": ms(percentile(values, 99)),
+        f"{prefix}_max_ms": ms(max(values) if values else None),
+    }
+
+
+def max_rss_mb() -> float:
+    """Пиковый RSS процесса в мегабайтах"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # На macOS ru_maxrss в байтах, на Linux - в килобайтах
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Нагрузочный прогон вебхука: отправляет записанные обновления на эндпоинт и меряет updates/s
+
+Примеры:
+    python -m bench.webhook_load --self-host --count 20000
+    python -m bench.webhook_load --url http://127.0.0.1:8080/telegram --file updates.jsonl --secret s3cr3t
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import types
+from collections import Counter
+from typing import List
+
+import httpx
+
+from bench.report import latency_summary
+from bot.update_recorder import read_update_log
+from bot.webhook import WebhookServer, make_chat_prefilter
+
+
+def synthetic_updates(count: int, chats: int = 50) -> List[bytes]:
+    """Генерирует обновления, похожие на настоящие сообщения из групп"""
+    payloads = []
+    for i in range(count):
+        chat_id = -1000000000000 - random.randrange(chats)
+        payloads.append(json.dumps({
+            "update_id": i + 1,
+            "message": {
+                "message_id": i + 1,
+                "from": {"id": 1000 + random.randrange(500), "is_bot": False, "first_name": "user"},
+                "chat": {"id": chat_id, "type": "supergroup", "title": "bench"},
+                "date": int(time.time()),
+                "text": random.choice(["ну че как", "короче", "ясно, понятно", "кто тут"]),
+            },
+        }, ensure_ascii=False, separators=(",", ":")).encode())
+    return payloads
+
+
+def load_updates(path: str) -> List[bytes]:
+    """Читает записанные обновления: по одному JSON-объекту на строку или журнал RECORD_UPDATES_PATH (.gz)"""
+    if path.endswith(".gz"):
+        return [json.dumps(entry["u"], ensure_ascii=False).encode() for entry in read_update_log(path) if "u" in entry]
+    with open(path, "rb") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+async def run_load(url: str, payloads: List[bytes], concurrency: int, secret: str = None) -> dict:
+    headers = {"Content-Type": "application/json"}
+    if secret:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = secret
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    position = 0
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def worker():
+            nonlocal position
+            while position < len(payloads):
+                body = payloads[position]
+                position += 1
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, content=body, headers=headers)
+                    statuses[response.status_code] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "updates": len(payloads),
+        "elapsed_s": round(elapsed, 3),
+        "updates_per_s": round(len(payloads) / elapsed, 1) if elapsed else None,
+        **latency_summary(latencies),
+        "statuses": dict(statuses),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Адрес вебхука (по умолчанию - локальный сервер из --self-host)")
+    parser.add_argument("--file", help="JSONL с записанными обновлениями или журнал RECORD_UPDATES_PATH (.gz)")
+    parser.add_argument("--count", type=int, default=5000, help="Сколько синтетических обновлений отправить без --file")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--secret", help="Значение X-Telegram-Bot-Api-Secret-Token")
+    parser.add_argument("--self-host", action="store_true", help="Поднять WebhookServer в этом же процессе")
+    parser.add_argument("--allowed-chat", type=int, action="append", help="Разрешенный чат для префильтра в --self-host")
+    args = parser.parse_args()
+
+    payloads = load_updates(args.file) if args.file else synthetic_updates(args.count)
+
+    server = None
+    queue: asyncio.Queue = asyncio.Queue()
+    url = args.url
+    if args.self_host:
+        # Заглушка приложения: вебхук кладет обновления в очередь, которую никто не разбирает
+        application = types.SimpleNamespace(bot=None, update_queue=queue)
+        prefilter = make_chat_prefilter(set(args.allowed_chat)) if args.allowed_chat else None
+        server = WebhookServer(application, "127.0.0.1", 0, "/telegram", secret_token=args.secret, prefilter=prefilter)
+        await server.start()
+        url = f"http://127.0.0.1:{server.server.bound_port}/telegram"
+    if not url:
+        parser.error("--url or --self-host is required")
+
+    try:
+        report = await run_load(url, payloads, args.concurrency, args.secret)
+    finally:
+        if server:
+            report_server = server.stats()
+            await server.stop()
+
+    if server:
+        report["server"] = report_server
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,119 @@
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from loguru import logger
+
+from bot.logging_setup import log_sampler
+from bot.metrics import ADMISSION_SHED, OPENAI_PENDING
+
+
+# Классы запросов к OpenAI в порядке ценности: при перегрузке первыми отбрасываются последние
+KIND_MENTION = "mention"
+KIND_CONVERSATION = "conversation"
+KIND_SCHEDULED = "scheduled"
+KIND_BACKGROUND = "background"  # Догенерация пула контента
+
+KIND_PRIORITIES = {
+    KIND_MENTION: 0,
+    KIND_CONVERSATION: 1,
+    KIND_SCHEDULED: 2,
+    KIND_BACKGROUND: 3,
+}
+
+
+class AdmissionRejected(Exception):
+    """Запрос не принят: очередь к OpenAI выше порога для его класса"""
+
+    def __init__(self, kind: str, pending: int):
+        super().__init__(f"{kind} request shed at {pending} pending requests")
+        self.kind = kind
+        self.pending = pending
+
+
+class AdmissionController:
+    """Допуск запросов к OpenAI с учетом их ценности
+
+    Считает запросы в полете и ожидающие свободного слота. Для каждого класса задан
+    порог общего числа таких запросов: выше него запрос сразу отклоняется, и
+    вызывающий код отдает заготовленный ответ без ожидания. Свободные слоты
+    достаются ожидающим в порядке приоритета класса, а не в порядке прихода.
+    """
+
+    def __init__(self, max_concurrent: int, limits: Optional[Dict[str, int]] = None):
+        self.max_concurrent = max_concurrent
+        self.limits = limits or {}
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []  # Куча (priority, seq, future)
+        self._queued = 0
+        self._seq = itertools.count()
+
+        # Метрики
+        self.admitted: Dict[str, int] = {kind: 0 for kind in KIND_PRIORITIES}
+        self.shed: Dict[str, int] = {kind: 0 for kind in KIND_PRIORITIES}
+
+        OPENAI_PENDING.set_callback(lambda: self.pending)
+
+    @property
+    def pending(self) -> int:
+        """Запросы в полете и в очереди"""
+        return self.in_flight + self._queued
+
+    def admit(self, kind: str) -> bool:
+        """Проверяет порог класса, не занимая слот"""
+        limit = self.limits.get(kind)
+        return limit is None or self.pending < limit
+
+    @asynccontextmanager
+    async def slot(self, kind: str) -> AsyncIterator[None]:
+        """Занимает слот для запроса; при перегрузке бросает AdmissionRejected"""
+        if not self.admit(kind):
+            self.shed[kind] = self.shed.get(kind, 0) + 1
+            ADMISSION_SHED.inc(kind=kind)
+            if log_sampler.allow("admission_shed", "WARNING"):
+                logger.warning("Shedding {} request: {} pending OpenAI requests", kind, self.pending)
+            raise AdmissionRejected(kind, self.pending)
+
+        self.admitted[kind] = self.admitted.get(kind, 0) + 1
+        await self._acquire(KIND_PRIORITIES.get(kind, len(KIND_PRIORITIES)))
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: int):
+        if self.in_flight < self.max_concurrent and not self._waiters:
+            self.in_flight += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._queued += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот уже передан нам, но ждать его перестали - отдаем следующему
+                self._release()
+            raise
+        finally:
+            self._queued -= 1
+
+    def _release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Слот переходит ожидающему, in_flight не меняется
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Снимок состояния для логов и нагрузочных тестов"""
+        return {
+            "in_flight": self.in_flight,
+            "queued": self._queued,
+            "admitted": dict(self.admitted),
+            "shed": dict(self.shed),
+        }
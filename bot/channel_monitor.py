@@ -1,52 +1,214 @@
+import math
 import time
+from collections import OrderedDict
 from typing import List, Optional
 from loguru import logger
 
 
+class ActivitySettings:
+    """Параметры модели активности, общие для всех чатов"""
+
+    __slots__ = ("window", "bucket", "ewma_tau", "min_rate", "min_participants", "min_interval",
+                 "quiet_factor", "quiet_min", "max_participants")
+
+    def __init__(self, window: float = 300, bucket: float = 10, ewma_tau: float = 1800, min_rate: float = 1.0,
+                 min_participants: int = 2, min_interval: float = 60, quiet_factor: float = 10,
+                 quiet_min: float = 600, max_participants: int = 256):
+        self.window = window  # Окно для скорости и участников (секунды)
+        self.bucket = bucket  # Шаг кольцевого буфера (секунды)
+        self.ewma_tau = ewma_tau  # Постоянная времени долгосрочной скорости (секунды)
+        self.min_rate = min_rate  # Ниже этой скорости (сообщений в минуту) обсуждение не комментируем
+        self.min_participants = min_participants
+        self.min_interval = min_interval  # Не чаще одного комментария в столько секунд
+        self.quiet_factor = quiet_factor  # Тихо, если пауза длиннее типичной во столько раз
+        self.quiet_min = quiet_min
+        self.max_participants = max_participants
+
+
+DEFAULT_ACTIVITY = ActivitySettings()
+
+
 class ChannelMonitor:
-    """Мониторит активность в канале"""
-    
-    def __init__(self, activity_timeout: int = 3600):
+    """Мониторит активность в канале
+
+    Сообщения за последние window секунд считаются в кольцевом буфере корзин по
+    bucket секунд с общей суммой, участники окна - в OrderedDict по времени
+    последнего сообщения, долгосрочная скорость - экспоненциальным средним.
+    Все обновления выполняются за амортизированное O(1) на сообщение.
+    """
+
+    __slots__ = ("activity_timeout", "bot_user_id", "settings", "last_user_message_time", "message_counter",
+                 "last_response_time", "_counts", "_head", "_window_total", "_ewma_rate", "_participants")
+
+    def __init__(self, activity_timeout: int = 3600, bot_id: Optional[int] = None,
+                 settings: Optional[ActivitySettings] = None):
         self.activity_timeout = activity_timeout
+        self.bot_user_id = bot_id
+        self.settings = settings or DEFAULT_ACTIVITY
         self.last_user_message_time: Optional[float] = None
-        self.message_counter = 0
-        self.bot_user_id = None
-        
+        self.message_counter = 0  # Сообщений с последнего комментария бота
+        self.last_response_time: Optional[float] = None
+
+        self._counts: List[int] = [0] * max(1, math.ceil(self.settings.window / self.settings.bucket))
+        self._head = 0  # Номер последней корзины (время // bucket)
+        self._window_total = 0
+        self._ewma_rate = 0.0  # Сообщений в секунду на момент последнего сообщения
+        self._participants: "OrderedDict[int, float]" = OrderedDict()
+
     def set_bot_id(self, bot_id: int):
         """Устанавливает ID бота для исключения его сообщений из подсчета"""
         self.bot_user_id = bot_id
         logger.info(f"Bot ID set: {bot_id}")
-    
-    def update_last_activity(self, user_id: int):
-        """Обновляет время последней активности"""
-        if user_id != self.bot_user_id:
-            self.last_user_message_time = time.time()
-            self.message_counter += 1
-            logger.debug(f"Activity updated. Counter: {self.message_counter}")
-    
-    def is_channel_active(self) -> bool:
+
+    def _advance(self, now: float):
+        """Сдвигает кольцевой буфер до текущей корзины, обнуляя устаревшие"""
+        bucket = int(now // self.settings.bucket)
+        steps = bucket - self._head
+        if steps <= 0:
+            return
+        size = len(self._counts)
+        if steps >= size:
+            self._counts = [0] * size
+            self._window_total = 0
+        else:
+            for index in range(self._head + 1, bucket + 1):
+                slot = index % size
+                self._window_total -= self._counts[slot]
+                self._counts[slot] = 0
+        self._head = bucket
+
+    def _expire_participants(self, now: float):
+        horizon = now - self.settings.window
+        while self._participants:
+            user_id, seen = next(iter(self._participants.items()))
+            if seen >= horizon and len(self._participants) <= self.settings.max_participants:
+                break
+            del self._participants[user_id]
+
+    def update_last_activity(self, user_id: int, now: Optional[float] = None):
+        """Учитывает сообщение пользователя"""
+        if user_id == self.bot_user_id:
+            return
+        now = time.time() if now is None else now
+
+        if self.last_user_message_time is not None:
+            elapsed = max(0.0, now - self.last_user_message_time)
+            self._ewma_rate *= math.exp(-elapsed / self.settings.ewma_tau)
+        self._ewma_rate += 1 / self.settings.ewma_tau
+
+        self._advance(now)
+        self._counts[self._head % len(self._counts)] += 1
+        self._window_total += 1
+
+        self._participants[user_id] = now
+        self._participants.move_to_end(user_id)
+        self._expire_participants(now)
+
+        self.last_user_message_time = now
+        self.message_counter += 1
+        logger.debug("Activity updated. Counter: {}", self.message_counter)
+
+    def messages_per_minute(self, now: Optional[float] = None) -> float:
+        """Скорость за окно (сообщений в минуту)"""
+        self._advance(time.time() if now is None else now)
+        return self._window_total * 60 / self.settings.window
+
+    def participants(self, now: Optional[float] = None) -> int:
+        """Сколько разных пользователей писали за окно"""
+        self._expire_participants(time.time() if now is None else now)
+        return len(self._participants)
+
+    def quiet_after(self) -> float:
+        """Через сколько секунд тишины чат считается тихим
+
+        Для бойкого чата - quiet_factor типичных пауз между сообщениями, но не меньше
+        quiet_min и не больше activity_timeout.
+        """
+        if self._ewma_rate <= 1 / self.settings.ewma_tau:
+            return self.activity_timeout
+        typical_gap = 1 / self._ewma_rate
+        return min(self.activity_timeout, max(self.settings.quiet_min, self.settings.quiet_factor * typical_gap))
+
+    def is_channel_active(self, now: Optional[float] = None) -> bool:
         """Проверяет, активен ли канал"""
         if self.last_user_message_time is None:
             return False
-        
-        time_since_last_message = time.time() - self.last_user_message_time
-        is_active = time_since_last_message < self.activity_timeout
-        logger.debug(f"Channel active: {is_active}, time since last: {time_since_last_message}s")
+
+        time_since_last_message = (time.time() if now is None else now) - self.last_user_message_time
+        is_active = time_since_last_message < self.quiet_after()
+        logger.debug("Channel active: {}, time since last: {}s", is_active, time_since_last_message)
         return is_active
-    
-    def should_bot_respond(self, threshold_min: int, threshold_max: int) -> bool:
-        """Проверяет, должен ли бот ответить (по количеству сообщений)"""
-        if not self.is_channel_active():
+
+    def required_messages(self, threshold_min: int, threshold_max: int, rate: float) -> int:
+        """Сколько сообщений должно накопиться до комментария
+
+        В медленном чате хватает threshold_min, в быстром порог растет со скоростью
+        (сообщений за min_interval), но не выше threshold_max.
+        """
+        return int(min(threshold_max, max(threshold_min, rate * self.settings.min_interval / 60)))
+
+    def should_bot_respond(self, threshold_min: int, threshold_max: int, now: Optional[float] = None,
+                           min_participants: Optional[int] = None) -> bool:
+        """Проверяет, должен ли бот ответить (по скорости, участникам и накопленным сообщениям)
+
+        min_participants переопределяет порог из настроек (в канале пишет один автор).
+        """
+        now = time.time() if now is None else now
+        if min_participants is None:
+            min_participants = self.settings.min_participants
+        if not self.is_channel_active(now) or self.message_counter < threshold_min:
+            return False
+        if self.last_response_time is not None and now - self.last_response_time < self.settings.min_interval:
             return False
-        
-        should_respond = threshold_min <= self.message_counter <= threshold_max
+
+        rate = self.messages_per_minute(now)
+        if rate < self.settings.min_rate or self.participants(now) < min_participants:
+            return False
+
+        should_respond = self.message_counter >= self.required_messages(threshold_min, threshold_max, rate)
         if should_respond:
-            logger.info(f"Bot should respond! Counter: {self.message_counter}")
-        
+            logger.info(f"Bot should respond! Counter: {self.message_counter}, rate: {rate:.1f}/min")
+
         return should_respond
-    
+
+    def mark_responded(self, now: Optional[float] = None):
+        """Запоминает комментарий бота и сбрасывает счетчик сообщений"""
+        self.last_response_time = time.time() if now is None else now
+        self.reset_counter()
+
     def reset_counter(self):
         """Сбрасывает счетчик сообщений"""
         self.message_counter = 0
         logger.debug("Counter reset")
 
+    def snapshot(self) -> dict:
+        """Сериализуемый снимок для StateStore (корзины окна - только непустые)"""
+        size = len(self._counts)
+        return {
+            "last_user_message_time": self.last_user_message_time,
+            "message_counter": self.message_counter,
+            "last_response_time": self.last_response_time,
+            "ewma_rate": self._ewma_rate,
+            "buckets": [[index, self._counts[index % size]] for index in range(self._head - size + 1, self._head + 1)
+                        if self._counts[index % size]],
+            "participants": [[user_id, seen] for user_id, seen in self._participants.items()],
+        }
+
+    def restore(self, data: dict):
+        """Восстанавливает состояние из снимка"""
+        self.last_user_message_time = data.get("last_user_message_time")
+        self.message_counter = data.get("message_counter", 0)
+        self.last_response_time = data.get("last_response_time")
+        self._ewma_rate = data.get("ewma_rate", 0.0)
+        buckets = data.get("buckets", [])
+        if buckets:
+            self._head = max(index for index, _ in buckets)
+            for index, count in buckets:
+                if index <= self._head - len(self._counts):
+                    continue
+                self._counts[index % len(self._counts)] += count
+                self._window_total += count
+        for user_id, seen in data.get("participants", []):
+            self._participants[user_id] = seen
+        # Устаревшие корзины и участники отбросятся при первом обращении
+        self._advance(time.time())
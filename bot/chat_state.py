@@ -0,0 +1,154 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional
+from loguru import logger
+
+from bot.channel_monitor import ActivitySettings, ChannelMonitor
+from bot.context_buffer import ContextBuffer
+
+
+class ChatState:
+    """Состояние одного чата: мониторинг активности и контекст"""
+
+    def __init__(self, chat_id: int, activity_timeout: int, threshold_min: int, threshold_max: int,
+                 max_context_messages: int = 3, bot_id: Optional[int] = None,
+                 activity: Optional[ActivitySettings] = None):
+        self.chat_id = chat_id
+        self.monitor = ChannelMonitor(activity_timeout=activity_timeout, bot_id=bot_id, settings=activity)
+        self.threshold_min = threshold_min
+        self.threshold_max = threshold_max
+
+        # История последних сообщений для контекста
+        self.context = ContextBuffer(max_context_messages)
+
+        self.last_seen = time.monotonic()
+
+    def add_context_message(self, text: str, author: str = "", timestamp: Optional[float] = None):
+        """Добавляет сообщение в историю для контекста"""
+        self.context.append(author, text, timestamp)
+
+    def should_respond(self, single_author: bool = False) -> bool:
+        """Проверяет, пора ли боту прокомментировать обсуждение в этом чате
+
+        single_author - канал: все посты от одного автора, порог участников не применяется.
+        """
+        return self.monitor.should_bot_respond(self.threshold_min, self.threshold_max,
+                                               min_participants=1 if single_author else None)
+
+    def snapshot(self) -> dict:
+        """Сериализуемый снимок состояния для StateStore"""
+        return {
+            "monitor": self.monitor.snapshot(),
+            "recent_messages": self.context.snapshot(),
+            "saved_at": time.time(),
+        }
+
+    def restore(self, data: dict):
+        """Восстанавливает состояние из снимка"""
+        # Снимки старого формата хранили поля монитора на верхнем уровне
+        self.monitor.restore(data.get("monitor", data))
+        self.context.restore(data.get("recent_messages", []))
+        # last_seen монотонное, поэтому переносим только возраст снимка
+        age = max(0.0, time.time() - data.get("saved_at", time.time()))
+        self.last_seen = time.monotonic() - age
+
+
+class ChatStateRegistry:
+    """Реестр состояний чатов с ленивым созданием и вытеснением неактивных
+
+    Состояния хранятся в OrderedDict в порядке последнего обращения, поэтому
+    поиск, обновление и вытеснение самого старого чата выполняются за O(1).
+    """
+
+    def __init__(self, activity_timeout: int, threshold_min: int, threshold_max: int,
+                 max_context_messages: int = 3, idle_timeout: float = 7200, max_chats: int = 5000,
+                 activity: Optional[ActivitySettings] = None):
+        self.activity_timeout = activity_timeout
+        self.threshold_min = threshold_min
+        self.threshold_max = threshold_max
+        self.max_context_messages = max_context_messages
+        self.idle_timeout = idle_timeout
+        self.max_chats = max_chats
+        self.activity = activity
+        self.bot_id: Optional[int] = None
+        self._states: "OrderedDict[int, ChatState]" = OrderedDict()
+
+    def set_bot_id(self, bot_id: int):
+        """Устанавливает ID бота для всех текущих и будущих чатов"""
+        self.bot_id = bot_id
+        for state in self._states.values():
+            state.monitor.set_bot_id(bot_id)
+
+    def get(self, chat_id: int) -> Optional[ChatState]:
+        """Возвращает состояние чата без создания и без обновления времени обращения"""
+        return self._states.get(chat_id)
+
+    def _new_state(self, chat_id: int) -> ChatState:
+        return ChatState(
+            chat_id,
+            activity_timeout=self.activity_timeout,
+            threshold_min=self.threshold_min,
+            threshold_max=self.threshold_max,
+            max_context_messages=self.max_context_messages,
+            bot_id=self.bot_id,
+            activity=self.activity,
+        )
+
+    def get_or_create(self, chat_id: int) -> ChatState:
+        """Возвращает состояние чата, создавая его при первом обращении"""
+        now = time.monotonic()
+        state = self._states.get(chat_id)
+        if state is None:
+            state = self._new_state(chat_id)
+            self._states[chat_id] = state
+            logger.debug("Chat state created for {} (total: {})", chat_id, len(self._states))
+        else:
+            self._states.move_to_end(chat_id)
+        state.last_seen = now
+        self.evict_idle(now)
+        return state
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Удаляет чаты, к которым давно не обращались, и лишние сверх лимита"""
+        now = time.monotonic() if now is None else now
+        evicted = 0
+        # Самые старые чаты всегда в начале, поэтому проверяем только голову
+        while self._states:
+            chat_id, state = next(iter(self._states.items()))
+            if len(self._states) <= self.max_chats and now - state.last_seen < self.idle_timeout:
+                break
+            del self._states[chat_id]
+            evicted += 1
+        if evicted:
+            logger.debug(f"Evicted {evicted} idle chat states (total: {len(self._states)})")
+        return evicted
+
+    def snapshot(self, chat_id: int) -> Optional[dict]:
+        """Снимок состояния чата (None, если чат уже вытеснен)"""
+        state = self._states.get(chat_id)
+        return state.snapshot() if state is not None else None
+
+    def restore(self, snapshots: Dict[int, dict]) -> int:
+        """Загружает сохраненные состояния (самые свежие первыми) при старте"""
+        restored = []
+        for chat_id, data in snapshots.items():
+            if chat_id in self._states or len(restored) >= self.max_chats:
+                continue
+            state = self._new_state(chat_id)
+            state.restore(data)
+            restored.append(state)
+        # В OrderedDict самые старые должны быть в начале
+        restored.sort(key=lambda state: state.last_seen)
+        for state in restored:
+            self._states[state.chat_id] = state
+        self.evict_idle()
+        return len(restored)
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._states
+
+    def __iter__(self) -> Iterator[ChatState]:
+        return iter(list(self._states.values()))
@@ -1,113 +1,500 @@
-from openai import OpenAI
-from loguru import logger
+import asyncio
 import random
-from bot.config import OPENAI_API_KEY, OPENAI_MODEL, JOKE_PROMPT, MEME_PROMPT, COMMENT_PROMPT_TEMPLATE, MENTION_PROMPT_TEMPLATE, STETHEM_QUOTES
+import re
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+from loguru import logger
+
+from bot.admission import (
+    AdmissionController, AdmissionRejected, KIND_MENTION, KIND_CONVERSATION, KIND_SCHEDULED, KIND_BACKGROUND,
+)
+from bot.circuit_breaker import CircuitBreaker, CircuitOpenError
+from bot.logging_setup import log_sampler
+from bot.response_cache import ResponseCache, make_key
+from bot.metrics import (
+    OPENAI_REQUEST_SECONDS, OPENAI_FIRST_TOKEN_SECONDS, OPENAI_TOKENS, OPENAI_ERRORS, OPENAI_PATHS, percentile,
+)
+from bot.config import (
+    OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_MODEL, JOKE_PROMPT, MEME_PROMPT, COMMENT_PROMPT_TEMPLATE, MENTION_PROMPT_TEMPLATE, STETHEM_QUOTES,
+    COMMENT_BATCH_PROMPT_TEMPLATE,
+    MENTION_FALLBACKS,
+    OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE_CONNECTIONS, OPENAI_MAX_CONCURRENT_REQUESTS,
+    OPENAI_REQUEST_TIMEOUT, OPENAI_CONNECT_TIMEOUT, OPENAI_MAX_RETRIES,
+    ADMISSION_MENTION_LIMIT, ADMISSION_CONVERSATION_LIMIT, ADMISSION_SCHEDULED_LIMIT, ADMISSION_BACKGROUND_LIMIT,
+    OPENAI_CIRCUIT_FAILURE_RATE, OPENAI_CIRCUIT_SLOW_CALL, OPENAI_CIRCUIT_WINDOW, OPENAI_CIRCUIT_MIN_CALLS,
+    OPENAI_CIRCUIT_OPEN_SECONDS, OPENAI_HEDGE_ENABLED, OPENAI_HEDGE_KINDS, OPENAI_HEDGE_PERCENTILE,
+    OPENAI_HEDGE_MIN_DELAY, OPENAI_HEDGE_MIN_SAMPLES,
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_REUSE_PROBABILITY,
+    RESPONSE_CACHE_VARIANTS, RESPONSE_CACHE_DB_PATH,
+)
+
+
+# Общий для всех экземпляров клиента пул соединений и допуск запросов,
+# чтобы несколько ChatGPTClient в одном процессе не открывали свои пулы
+_shared_http_client: Optional[httpx.AsyncClient] = None
+_shared_admission: Optional[AdmissionController] = None
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+_shared_response_cache: Optional[ResponseCache] = None
+
+# Строка ответа на пакетный запрос: "3. текст" или "3) текст"
+_NUMBERED_LINE = re.compile(r"^\s*(\d+)\s*[.)]\s*(.+?)\s*$", re.MULTILINE)
+
+
+def get_shared_http_client() -> httpx.AsyncClient:
+    """Возвращает общий HTTP-клиент с ограниченным пулом соединений"""
+    global _shared_http_client
+    if _shared_http_client is None or _shared_http_client.is_closed:
+        _shared_http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(OPENAI_REQUEST_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        )
+    return _shared_http_client
+
+
+def make_admission_controller(max_concurrent: int = OPENAI_MAX_CONCURRENT_REQUESTS) -> AdmissionController:
+    """Создает контроллер допуска с порогами из конфигурации"""
+    return AdmissionController(max_concurrent, limits={
+        KIND_MENTION: ADMISSION_MENTION_LIMIT,
+        KIND_CONVERSATION: ADMISSION_CONVERSATION_LIMIT,
+        KIND_SCHEDULED: ADMISSION_SCHEDULED_LIMIT,
+        KIND_BACKGROUND: ADMISSION_BACKGROUND_LIMIT,
+    })
+
+
+def get_shared_admission() -> AdmissionController:
+    """Возвращает общий контроллер допуска, ограничивающий число одновременных запросов к OpenAI"""
+    global _shared_admission
+    if _shared_admission is None:
+        _shared_admission = make_admission_controller()
+    return _shared_admission
+
+
+def get_circuit_breaker(model: str) -> CircuitBreaker:
+    """Возвращает предохранитель модели, общий для всех экземпляров клиента"""
+    breaker = _circuit_breakers.get(model)
+    if breaker is None:
+        breaker = _circuit_breakers[model] = CircuitBreaker(
+            model,
+            failure_rate=OPENAI_CIRCUIT_FAILURE_RATE,
+            slow_call_seconds=OPENAI_CIRCUIT_SLOW_CALL,
+            window_size=OPENAI_CIRCUIT_WINDOW,
+            min_calls=OPENAI_CIRCUIT_MIN_CALLS,
+            open_seconds=OPENAI_CIRCUIT_OPEN_SECONDS,
+        )
+    return breaker
+
+
+def get_shared_response_cache() -> Optional[ResponseCache]:
+    """Возвращает общий кэш ответов (None, если кэш выключен)"""
+    global _shared_response_cache
+    if _shared_response_cache is None and RESPONSE_CACHE_ENABLED:
+        _shared_response_cache = ResponseCache(
+            max_entries=RESPONSE_CACHE_SIZE,
+            ttl=RESPONSE_CACHE_TTL,
+            reuse_probability=RESPONSE_CACHE_REUSE_PROBABILITY,
+            max_variants=RESPONSE_CACHE_VARIANTS,
+            disk_path=RESPONSE_CACHE_DB_PATH,
+        )
+    return _shared_response_cache
+
+
+async def close_shared_http_client():
+    """Закрывает общий пул соединений"""
+    global _shared_http_client
+    if _shared_http_client is not None and not _shared_http_client.is_closed:
+        await _shared_http_client.aclose()
+    _shared_http_client = None
 
 
 class ChatGPTClient:
-    def __init__(self):
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None, max_concurrent_requests: Optional[int] = None,
+                 base_url: Optional[str] = None, api_key: Optional[str] = None,
+                 admission: Optional[AdmissionController] = None, response_cache: Optional[ResponseCache] = None):
+        self.client = AsyncOpenAI(
+            api_key=api_key or OPENAI_API_KEY,
+            base_url=base_url or OPENAI_BASE_URL,
+            http_client=http_client or get_shared_http_client(),
+            timeout=OPENAI_REQUEST_TIMEOUT,
+            max_retries=OPENAI_MAX_RETRIES,
+        )
         self.model = OPENAI_MODEL
+        self.request_timeout = OPENAI_REQUEST_TIMEOUT
+        # Свой лимит задается явно, иначе используется общий для процесса
+        if admission is None:
+            admission = make_admission_controller(max_concurrent_requests) if max_concurrent_requests else get_shared_admission()
+        self.admission = admission
+        self.breaker = get_circuit_breaker(self.model)
+        self.response_cache = response_cache if response_cache is not None else get_shared_response_cache()
+        
+        # Дублирующие запросы и последние задержки по каждому generate_* для их порога
+        self.hedge_enabled = OPENAI_HEDGE_ENABLED
+        self.hedge_kinds = set(OPENAI_HEDGE_KINDS)
+        self._latencies: Dict[str, Deque[float]] = {}
+        self.paths: Dict[str, int] = {}
         logger.info("ChatGPT client initialized")
-    
-    async def generate_joke(self) -> str:
-        """Генерирует пошлую шутку/анекдот"""
+
+    async def _complete(self, method: str, system_prompt: str, user_prompt: str, max_tokens: int,
+                        temperature: float = 0.9, timeout: Optional[float] = None, kind: str = KIND_SCHEDULED) -> str:
+        """Выполняет запрос к chat completions с ограничением параллелизма и таймаутом
+
+        method - имя вызывающего generate_* для метрик, kind - класс запроса для допуска.
+        При перегрузке бросает AdmissionRejected, при разомкнутом предохранителе -
+        CircuitOpenError, в обоих случаях не дожидаясь OpenAI.
+        """
+        if not self.breaker.allow():
+            self._count_path(method, "circuit_open")
+            raise CircuitOpenError(self.breaker.name)
+
+        request = {
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "timeout": timeout or self.request_timeout,
+        }
+        try:
+            hedge_delay = self._hedge_delay(method, kind)
+            if hedge_delay is None:
+                result, path = await self._attempt(method, kind, request), "primary"
+            else:
+                result, path = await self._hedged(method, kind, request, hedge_delay)
+        except AdmissionRejected:
+            self.breaker.release()
+            self._count_path(method, "shed")
+            raise
+        self._count_path(method, path)
+        return result
+
+    async def _attempt(self, method: str, kind: str, request: Dict[str, Any]) -> str:
+        """Один запрос к OpenAI с учетом в метриках и предохранителе"""
+        async with self.admission.slot(kind):
+            started = time.perf_counter()
+            try:
+                response = await self.client.chat.completions.create(model=self.model, **request)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                OPENAI_ERRORS.inc(method=method, error=type(e).__name__)
+                self.breaker.record(False, time.perf_counter() - started)
+                raise
+            finally:
+                OPENAI_REQUEST_SECONDS.observe(time.perf_counter() - started, method=method)
+
+        latency = time.perf_counter() - started
+        self.breaker.record(True, latency)
+        latencies = self._latencies.get(method)
+        if latencies is None:
+            latencies = self._latencies[method] = deque(maxlen=200)
+        latencies.append(latency)
+
+        if response.usage:
+            OPENAI_TOKENS.inc(response.usage.prompt_tokens, method=method, kind="prompt")
+            OPENAI_TOKENS.inc(response.usage.completion_tokens, method=method, kind="completion")
+        return response.choices[0].message.content.strip()
+
+    def _hedge_delay(self, method: str, kind: str) -> Optional[float]:
+        """Через сколько секунд дублировать запрос (None - не дублировать)"""
+        if not self.hedge_enabled or kind not in self.hedge_kinds or self.breaker.state != CircuitBreaker.CLOSED:
+            return None
+        latencies = self._latencies.get(method)
+        if not latencies or len(latencies) < OPENAI_HEDGE_MIN_SAMPLES:
+            return None
+        return max(OPENAI_HEDGE_MIN_DELAY, percentile(latencies, OPENAI_HEDGE_PERCENTILE))
+
+    async def _hedged(self, method: str, kind: str, request: Dict[str, Any], delay: float) -> Tuple[str, str]:
+        """Если первый запрос не ответил за delay секунд, параллельно отправляет второй и берет первый ответ"""
+        primary = asyncio.create_task(self._attempt(method, kind, request))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or self.breaker.state != CircuitBreaker.CLOSED or not self.admission.admit(kind):
+                return await primary, "primary"
+
+            secondary = asyncio.create_task(self._attempt(method, kind, request))
+            tasks.add(secondary)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result(), "hedge_primary_won" if task is primary else "hedge_won"
+            # Оба запроса завершились ошибкой
+            raise primary.exception()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _stream(self, method: str, system_prompt: str, user_prompt: str, max_tokens: int,
+                      temperature: float = 0.9, timeout: Optional[float] = None,
+                      kind: str = KIND_MENTION) -> AsyncIterator[str]:
+        """Потоковый запрос к chat completions: отдает фрагменты текста по мере генерации
+
+        Допуск и предохранитель те же, что у _complete; дублирующих запросов нет.
+        """
+        if not self.breaker.allow():
+            self._count_path(method, "circuit_open")
+            raise CircuitOpenError(self.breaker.name)
+
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "Ты гопник-матершинник из плохого района."},
-                    {"role": "user", "content": JOKE_PROMPT}
-                ],
-                temperature=0.9,
-                max_tokens=200
+            async with self.admission.slot(kind):
+                started = time.perf_counter()
+                first_chunk = True
+                stream = None
+                try:
+                    stream = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        timeout=timeout or self.request_timeout,
+                        stream=True
+                    )
+                    async for chunk in stream:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if not delta:
+                            continue
+                        if first_chunk:
+                            first_chunk = False
+                            OPENAI_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started, method=method)
+                        yield delta
+                except (asyncio.CancelledError, GeneratorExit):
+                    self.breaker.release()
+                    # Поток брошен на середине - закрываем соединение, чтобы оно не висело в пуле
+                    if stream is not None:
+                        await stream.response.aclose()
+                    raise
+                except Exception as e:
+                    OPENAI_ERRORS.inc(method=method, error=type(e).__name__)
+                    self.breaker.record(False, time.perf_counter() - started)
+                    raise
+                finally:
+                    OPENAI_REQUEST_SECONDS.observe(time.perf_counter() - started, method=method)
+        except AdmissionRejected:
+            self.breaker.release()
+            self._count_path(method, "shed")
+            raise
+
+        self.breaker.record(True, time.perf_counter() - started)
+        self._count_path(method, "stream")
+
+    def _log_error(self, what: str, error: Exception):
+        # При разомкнутом предохранителе такие ошибки идут на каждый запрос - пишем выборочно
+        if isinstance(error, CircuitOpenError):
+            if log_sampler.allow("circuit_open", "WARNING"):
+                logger.warning("Using fallback for {}: {}", what, error)
+            return
+        logger.error(f"Error generating {what}: {error}")
+
+    def _count_path(self, method: str, path: str):
+        self.paths[path] = self.paths.get(path, 0) + 1
+        OPENAI_PATHS.inc(method=method, path=path)
+
+    def stats(self) -> Dict[str, Any]:
+        """Как обслуживались запросы, состояние предохранителя и кэша ответов"""
+        return {
+            "paths": dict(self.paths),
+            "circuit": self.breaker.stats(),
+            "response_cache": self.response_cache.stats() if self.response_cache is not None else None,
+        }
+
+    async def generate_joke(self, timeout: Optional[float] = None, use_fallback: bool = True,
+                            kind: str = KIND_SCHEDULED) -> Optional[str]:
+        """Генерирует пошлую шутку/анекдот (без fallback при ошибке возвращает None)"""
+        try:
+            joke = await self._complete(
+                "joke",
+                "Ты гопник-матершинник из плохого района.",
+                JOKE_PROMPT,
+                max_tokens=200,
+                timeout=timeout,
+                kind=kind
             )
-            
-            joke = response.choices[0].message.content.strip()
-            logger.info(f"Generated joke: {joke[:50]}...")
+            logger.info("Generated joke: {}...", joke[:50])
             return joke
-            
+
+        except AdmissionRejected:
+            if not use_fallback:
+                return None
+            return "Эх, сегодня не до шуток... Твоя мать в отпуске, так что и я в отпуске от остроумия."
         except Exception as e:
-            logger.error(f"Error generating joke: {e}")
+            self._log_error("joke", e)
+            if not use_fallback:
+                return None
             return "Эх, сегодня не до шуток... Твоя мать в отпуске, так что и я в отпуске от остроумия."
-    
-    async def generate_meme_quote(self) -> str:
-        """Генерирует мемную цитату в стиле Стетхема"""
+
+    async def generate_meme_quote(self, timeout: Optional[float] = None, use_fallback: bool = True,
+                                  kind: str = KIND_SCHEDULED) -> Optional[str]:
+        """Генерирует мемную цитату в стиле Стетхема (без fallback при ошибке возвращает None)"""
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "Ты гопник-матершинник из плохого района в стиле Стетхема."},
-                    {"role": "user", "content": MEME_PROMPT}
-                ],
-                temperature=0.9,
-                max_tokens=150
+            quote = await self._complete(
+                "meme_quote",
+                "Ты гопник-матершинник из плохого района в стиле Стетхема.",
+                MEME_PROMPT,
+                max_tokens=150,
+                timeout=timeout,
+                kind=kind
             )
-            
-            quote = response.choices[0].message.content.strip()
-            logger.info(f"Generated meme quote: {quote[:50]}...")
+            logger.info("Generated meme quote: {}...", quote[:50])
             return quote
-            
+
+        except AdmissionRejected:
+            return random.choice(STETHEM_QUOTES) if use_fallback else None
         except Exception as e:
-            logger.error(f"Error generating meme quote: {e}")
+            self._log_error("meme quote", e)
+            if not use_fallback:
+                return None
             # Fallback на готовые цитаты
             return random.choice(STETHEM_QUOTES)
-    
+
     async def generate_random_content(self) -> str:
         """Генерирует случайный контент (шутка или мемная цитата)"""
         content_type = random.choice(["joke", "meme"])
-        
+
         if content_type == "joke":
             return await self.generate_joke()
         else:
             return await self.generate_meme_quote()
-    
-    async def generate_comment(self, conversation_context: str) -> str:
-        """Генерирует грубый комментарий на тему обсуждения"""
+
+    async def generate_comment(self, conversation_context: str, timeout: Optional[float] = None) -> Optional[str]:
+        """Генерирует грубый комментарий на тему обсуждения (None, если OpenAI перегружен)"""
         try:
             prompt = COMMENT_PROMPT_TEMPLATE.format(conversation_context=conversation_context)
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "Ты гопник-матершинник из плохого района."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.9,
-                max_tokens=150
+
+            comment = await self._complete(
+                "comment",
+                "Ты гопник-матершинник из плохого района.",
+                prompt,
+                max_tokens=150,
+                timeout=timeout,
+                kind=KIND_CONVERSATION
             )
-            
-            comment = response.choices[0].message.content.strip()
-            logger.info(f"Generated comment: {comment[:50]}...")
+            logger.info("Generated comment: {}...", comment[:50])
             return comment
-            
+
+        except AdmissionRejected:
+            # Комментарий необязателен - при перегрузке просто промолчим
+            return None
         except Exception as e:
-            logger.error(f"Error generating comment: {e}")
+            self._log_error("comment", e)
             return "Ясно, понятно. Короче, решил я пофилософствовать тут с вами, интеллигентами..."
-    
-    async def generate_mention_response(self, message_text: str, username: str = "пользователь") -> str:
-        """Генерирует грубый ответ на обращение пользователя"""
+
+    async def generate_comments(self, contexts: List[str], timeout: Optional[float] = None) -> Optional[List[Optional[str]]]:
+        """Генерирует комментарии к нескольким обсуждениям одним запросом
+
+        Возвращает список в порядке contexts; None на месте комментария, который модель
+        не вернула. Если OpenAI перегружен, возвращает None вместо списка.
+        """
+        try:
+            topics = "\n\n".join(f"{index}. {context}" for index, context in enumerate(contexts, 1))
+            prompt = COMMENT_BATCH_PROMPT_TEMPLATE.format(topics=topics, count=len(contexts))
+
+            text = await self._complete(
+                "comment_batch",
+                "Ты гопник-матершинник из плохого района.",
+                prompt,
+                max_tokens=120 * len(contexts),
+                timeout=timeout,
+                kind=KIND_CONVERSATION
+            )
+            comments: List[Optional[str]] = [None] * len(contexts)
+            for match in _NUMBERED_LINE.finditer(text):
+                index = int(match.group(1)) - 1
+                if 0 <= index < len(contexts) and comments[index] is None:
+                    comments[index] = match.group(2)
+            logger.info("Generated {}/{} batched comments", sum(c is not None for c in comments), len(contexts))
+            return comments
+
+        except AdmissionRejected:
+            return None
+        except Exception as e:
+            self._log_error("comment batch", e)
+            return ["Ясно, понятно. Короче, решил я пофилософствовать тут с вами, интеллигентами..."] * len(contexts)
+
+    async def stream_mention_response(self, message_text: str, username: str = "пользователь",
+                                      timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Генерирует ответ на обращение по частям (при ошибке до первого фрагмента - заготовка)"""
+        cache_key = make_key("mention_response", MENTION_PROMPT_TEMPLATE, message_text, username)
+        if self.response_cache is not None:
+            cached = self.response_cache.get("mention_response", cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        prompt = MENTION_PROMPT_TEMPLATE.format(
+            username=username,
+            message_text=message_text
+        )
+        produced = False
+        parts: List[str] = []
+        try:
+            async for delta in self._stream(
+                "mention_response",
+                "Ты гопник-матершинник из плохого района.",
+                prompt,
+                max_tokens=150,
+                timeout=timeout,
+                kind=KIND_MENTION
+            ):
+                produced = True
+                parts.append(delta)
+                yield delta
+            if self.response_cache is not None and parts:
+                self.response_cache.put(cache_key, "".join(parts))
+
+        except AdmissionRejected:
+            if not produced:
+                yield random.choice(MENTION_FALLBACKS)
+        except Exception as e:
+            self._log_error("mention response", e)
+            # Если часть ответа уже показана, оставляем ее как есть
+            if not produced:
+                yield MENTION_FALLBACKS[0]
+
+    async def generate_mention_response(self, message_text: str, username: str = "пользователь",
+                                        timeout: Optional[float] = None) -> str:
+        """Генерирует грубый ответ на обращение пользователя (повторные обращения - через кэш)"""
+        cache_key = make_key("mention_response", MENTION_PROMPT_TEMPLATE, message_text, username)
+        if self.response_cache is not None:
+            cached = self.response_cache.get("mention_response", cache_key)
+            if cached is not None:
+                return cached
+
         try:
             prompt = MENTION_PROMPT_TEMPLATE.format(
                 username=username,
                 message_text=message_text
             )
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "Ты гопник-матершинник из плохого района."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.9,
-                max_tokens=150
+
+            response_text = await self._complete(
+                "mention_response",
+                "Ты гопник-матершинник из плохого района.",
+                prompt,
+                max_tokens=150,
+                timeout=timeout,
+                kind=KIND_MENTION
             )
-            
-            response_text = response.choices[0].message.content.strip()
-            logger.info(f"Generated mention response: {response_text[:50]}...")
+            logger.info("Generated mention response: {}...", response_text[:50])
+            if self.response_cache is not None:
+                self.response_cache.put(cache_key, response_text)
             return response_text
-            
-        except Exception as e:
-            logger.error(f"Error generating mention response: {e}")
-            return "Ясно, понятно. Короче, решил я тут пофилософствовать с вами, интеллигентами..."
 
+        except AdmissionRejected:
+            # Очередь к OpenAI переполнена - отвечаем заготовкой сразу, а не через минуту
+            return random.choice(MENTION_FALLBACKS)
+        except Exception as e:
+            self._log_error("mention response", e)
+            return MENTION_FALLBACKS[0]
@@ -0,0 +1,118 @@
+import time
+from collections import deque
+from typing import Any, Deque, Dict
+from loguru import logger
+
+from bot.metrics import OPENAI_CIRCUIT_STATE
+
+
+class CircuitOpenError(Exception):
+    """Запрос не отправлен: предохранитель разомкнут после серии ошибок"""
+
+    def __init__(self, name: str):
+        super().__init__(f"Circuit breaker for {name} is open")
+        self.name = name
+
+
+class CircuitBreaker:
+    """Предохранитель для внешнего API
+
+    Смотрит на исходы последних window_size запросов. Ошибка или ответ дольше
+    slow_call_seconds считаются неудачей; если доля неудач не меньше failure_rate,
+    предохранитель размыкается и следующие open_seconds запросы сразу отклоняются.
+    Затем пропускается half_open_probes пробных запросов: успех замыкает цепь,
+    неудача снова размыкает ее.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_rate: float = 0.5, slow_call_seconds: float = 10.0,
+                 window_size: int = 20, min_calls: int = 10, open_seconds: float = 30.0, half_open_probes: int = 1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min(min_calls, window_size)
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self.state = self.CLOSED
+        self._outcomes: Deque[bool] = deque(maxlen=window_size)  # True - неудача
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+
+        # Метрики
+        self.rejected = 0
+        self.opened = 0
+        OPENAI_CIRCUIT_STATE.set(0, model=name)
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос сейчас"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                return False
+            self._set_state(self.HALF_OPEN)
+            self._probes = 0
+        if self.state == self.HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                self.rejected += 1
+                return False
+            self._probes += 1
+        return True
+
+    def record(self, ok: bool, latency: float):
+        """Учитывает исход запроса"""
+        failure = not ok or latency >= self.slow_call_seconds
+        if self.state == self.HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+            if failure:
+                self._open()
+            else:
+                self._close()
+            return
+        if self.state == self.OPEN:
+            # Ответ на запрос, отправленный до размыкания
+            return
+
+        if len(self._outcomes) == self._outcomes.maxlen and self._outcomes[0]:
+            self._failures -= 1
+        self._outcomes.append(failure)
+        self._failures += failure
+        if len(self._outcomes) >= self.min_calls and self._failures / len(self._outcomes) >= self.failure_rate:
+            self._open()
+
+    def release(self):
+        """Запрос отменен без результата - освобождает пробный слот"""
+        if self.state == self.HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+
+    def _open(self):
+        self.opened += 1
+        self._opened_at = time.monotonic()
+        logger.warning(f"Circuit breaker {self.name} opened "
+                       f"({self._failures}/{len(self._outcomes)} failed), failing fast for {self.open_seconds}s")
+        self._set_state(self.OPEN)
+
+    def _close(self):
+        self._outcomes.clear()
+        self._failures = 0
+        logger.info(f"Circuit breaker {self.name} closed")
+        self._set_state(self.CLOSED)
+
+    def _set_state(self, state: str):
+        self.state = state
+        OPENAI_CIRCUIT_STATE.set(self._STATE_VALUES[state], model=self.name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": self._failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,95 @@
+import asyncio
+from typing import List, Optional, Tuple
+from loguru import logger
+
+from bot.metrics import COMMENT_BATCH_SIZE
+
+
+class CommentBatcher:
+    """Собирает запросы комментариев из разных чатов и генерирует их одним запросом
+
+    Запрос ждет в очереди не дольше max_wait секунд: за это время к нему могут
+    присоединиться другие чаты, и все их комментарии генерируются одним вызовом
+    ChatGPTClient.generate_comments. Если модель вернула не все комментарии,
+    недостающие догенерируются по одному.
+    """
+
+    def __init__(self, client, max_batch: int = 5, max_wait: float = 0.5):
+        self.client = client
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+        # Метрики
+        self.batches = 0
+        self.requests = 0
+        self.fallbacks = 0
+
+    async def generate(self, conversation_context: str) -> Optional[str]:
+        """Комментарий к обсуждению (None, если OpenAI перегружен)"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((conversation_context, future))
+        self.requests += 1
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]):
+        self.batches += 1
+        COMMENT_BATCH_SIZE.observe(len(batch))
+        try:
+            if len(batch) == 1:
+                comments = [await self.client.generate_comment(batch[0][0])]
+            else:
+                comments = await self.client.generate_comments([context for context, _ in batch])
+                if comments is None:
+                    # Перегрузка - все комментарии пропускаются
+                    comments = [None] * len(batch)
+                else:
+                    missing = [index for index, comment in enumerate(comments) if comment is None]
+                    if missing:
+                        self.fallbacks += len(missing)
+                        logger.debug("Batch returned {}/{} comments, generating the rest one by one",
+                                     len(batch) - len(missing), len(batch))
+                        singles = await asyncio.gather(*(self.client.generate_comment(batch[i][0]) for i in missing))
+                        for index, comment in zip(missing, singles):
+                            comments[index] = comment
+        except Exception as e:
+            logger.error(f"Error generating comment batch: {e}")
+            comments = [None] * len(batch)
+
+        for (_, future), comment in zip(batch, comments):
+            if not future.done():
+                future.set_result(comment)
+
+    async def close(self):
+        """Отправляет накопленные запросы, не дожидаясь таймера, и ждет их завершения"""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "fallbacks": self.fallbacks,
+        }
@@ -1,17 +1,27 @@
 import os
-from dotenv import load_dotenv
 from loguru import logger
 
-load_dotenv()
+# .env загружает точка входа (bot.main) до импорта этого модуля; здесь только чтение окружения
 
 # Telegram settings
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 CHANNEL_ID = os.getenv("TELEGRAM_CHANNEL_ID")
 
+# Адрес Bot API (для локального сервера Bot API или заглушки в нагрузочных тестах)
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL")  # Например http://127.0.0.1:8081/bot
+
+# Дополнительные чаты через запятую (ID или @username), в которых работает бот
+CHAT_IDS = [c.strip() for c in os.getenv("TELEGRAM_CHAT_IDS", "").split(",") if c.strip()]
+# Прозвища через запятую, на которые бот отзывается как на @username (например "пидарбот,бот")
+BOT_ALIASES = [a.strip() for a in os.getenv("BOT_ALIASES", "").split(",") if a.strip()]
+# Работать во всех чатах, куда добавлен бот, а не только в перечисленных
+ALLOW_ALL_CHATS = os.getenv("ALLOW_ALL_CHATS", "false").lower() in ("1", "true", "yes")
+
 # OpenAI settings
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # По умолчанию - api.openai.com
 
-# Валидация обязательных переменных окружения
+# Валидация обязательных переменных окружения (вызывается из bot.main после настройки логов)
 def validate_config():
     """Проверяет наличие всех обязательных переменных окружения"""
     errors = []
@@ -41,25 +51,123 @@ def validate_config():
     logger.debug(f"CHANNEL_ID: {CHANNEL_ID}")
     logger.debug(f"OPENAI_API_KEY: {'*' * 10 if OPENAI_API_KEY else 'НЕ УСТАНОВЛЕН'}")
 
-# Выполняем валидацию при импорте
-try:
-    validate_config()
-except ValueError:
-    # Не прерываем выполнение, но логируем ошибку
-    pass
-
 # Bot behavior settings
 MESSAGE_THRESHOLD_MIN = 5  # Минимальное количество сообщений для ответа
 MESSAGE_THRESHOLD_MAX = 9  # Максимальное количество сообщений для ответа
 
 ACTIVITY_TIMEOUT = 3600  # 1 час в секундах (время до объявления канала "тихим")
 
+# Модель активности чата: скорость и участники за окно, долгосрочная скорость (EWMA)
+ACTIVITY_WINDOW = int(os.getenv("ACTIVITY_WINDOW", "300"))  # Окно подсчета скорости и участников (секунды)
+ACTIVITY_BUCKET = int(os.getenv("ACTIVITY_BUCKET", "10"))  # Шаг кольцевого буфера окна (секунды)
+ACTIVITY_EWMA_TAU = int(os.getenv("ACTIVITY_EWMA_TAU", "1800"))  # Постоянная времени долгосрочной скорости (секунды)
+CONVERSATION_MIN_RATE = float(os.getenv("CONVERSATION_MIN_RATE", "1"))  # Минимум сообщений в минуту для комментария
+CONVERSATION_MIN_PARTICIPANTS = int(os.getenv("CONVERSATION_MIN_PARTICIPANTS", "2"))  # Минимум собеседников за окно
+COMMENT_MIN_INTERVAL = int(os.getenv("COMMENT_MIN_INTERVAL", "60"))  # Не комментировать чаще раза в столько секунд
+QUIET_GAP_FACTOR = float(os.getenv("QUIET_GAP_FACTOR", "10"))  # Чат тихий, если пауза во столько раз длиннее обычной
+QUIET_MIN_SECONDS = int(os.getenv("QUIET_MIN_SECONDS", "600"))  # Но не раньше, чем через столько секунд
+
+# Состояние чатов (мультичат)
+MAX_CONTEXT_MESSAGES = int(os.getenv("MAX_CONTEXT_MESSAGES", "3"))  # Сколько последних сообщений держать для контекста (больше - длиннее и дороже промпт)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "250"))  # Максимум токенов контекста в промпте комментария
+CONTEXT_MESSAGE_MAX_TOKENS = int(os.getenv("CONTEXT_MESSAGE_MAX_TOKENS", "80"))  # До скольких токенов обрезать одно сообщение
+CHAT_IDLE_TIMEOUT = int(os.getenv("CHAT_IDLE_TIMEOUT", str(ACTIVITY_TIMEOUT * 2)))  # Через сколько секунд без сообщений забывать чат
+MAX_TRACKED_CHATS = int(os.getenv("MAX_TRACKED_CHATS", "5000"))  # Максимум чатов в памяти одновременно
+
+# Кулдауны ответов на упоминания
+MENTION_COOLDOWN = float(os.getenv("MENTION_COOLDOWN", "30"))  # Секунд между ответами одному пользователю в чате
+MENTION_CHAT_COOLDOWN = float(os.getenv("MENTION_CHAT_COOLDOWN", "0"))  # Секунд между ответами на упоминания в одном чате (0 - без ограничения)
+COOLDOWN_MAX_ENTRIES = int(os.getenv("COOLDOWN_MAX_ENTRIES", "100000"))  # Максимум одновременно хранимых кулдаунов
+
+# Потоковые ответы на упоминания: ответ отправляется сразу и дописывается правками сообщения
+STREAMING_REPLIES = os.getenv("STREAMING_REPLIES", "false").lower() in ("1", "true", "yes")
+STREAM_FIRST_CHUNK_CHARS = int(os.getenv("STREAM_FIRST_CHUNK_CHARS", "30"))  # Сколько символов набрать перед первой отправкой
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))  # Не чаще одной правки в столько секунд
+
+# Пакетная генерация комментариев: запросы из разных чатов за короткое окно идут в OpenAI одним запросом
+COMMENT_BATCHING_ENABLED = os.getenv("COMMENT_BATCHING_ENABLED", "false").lower() in ("1", "true", "yes")
+COMMENT_BATCH_MAX_SIZE = int(os.getenv("COMMENT_BATCH_MAX_SIZE", "5"))  # Максимум комментариев в одном запросе
+COMMENT_BATCH_MAX_WAIT = float(os.getenv("COMMENT_BATCH_MAX_WAIT", "0.5"))  # Сколько секунд ждать других чатов
+
+# Кэш ответов на одинаковые обращения
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "5000"))  # Максимум разных обращений в памяти
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600)))  # Сколько секунд хранить ответы
+RESPONSE_CACHE_REUSE_PROBABILITY = float(os.getenv("RESPONSE_CACHE_REUSE_PROBABILITY", "0.7"))  # Доля попаданий, отданных из кэша
+RESPONSE_CACHE_VARIANTS = int(os.getenv("RESPONSE_CACHE_VARIANTS", "3"))  # Сколько разных ответов хранить на обращение
+RESPONSE_CACHE_DB_PATH = os.getenv("RESPONSE_CACHE_DB_PATH", "")  # SQLite-файл дискового уровня, пусто - только память
+
+# Локальное хранилище состояния (SQLite) для быстрого перезапуска
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "data/state.db")  # Пустое значение отключает сохранение
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "2"))  # Как часто сбрасывать изменения на диск (секунды)
+STATE_RETENTION = int(os.getenv("STATE_RETENTION", str(7 * 24 * 3600)))  # Через сколько секунд удалять состояние неактивного чата
+STATE_UPDATE_ID_MAX_AGE = int(os.getenv("STATE_UPDATE_ID_MAX_AGE", str(24 * 3600)))  # Сколько секунд сохраненный update_id отсекает повторы (Telegram хранит обновления сутки)
+
+# Запись входящих обновлений для воспроизведения (python -m bench.replay); в журнале тексты сообщений
+RECORD_UPDATES_PATH = os.getenv("RECORD_UPDATES_PATH", "")  # Файл журнала (.jsonl.gz), пусто - не записывать
+RECORD_UPDATES_FLUSH_INTERVAL = float(os.getenv("RECORD_UPDATES_FLUSH_INTERVAL", "5"))  # Как часто дописывать журнал (секунды)
+RECORD_UPDATES_MAX_MB = int(os.getenv("RECORD_UPDATES_MAX_MB", "512"))  # После этого размера запись прекращается
+
+# Остановка: сколько секунд доделывать начатые ответы и отправки после SIGTERM
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "20"))
+
+# Несколько процессов: супервизор получает обновления и раздает чаты воркерам по консистентному хешу
+WORKERS = int(os.getenv("WORKERS", "1"))  # Больше 1 - запустить супервизор с таким числом воркеров
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "-1"))  # Номер воркера (задает супервизор), -1 - обычный режим
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "10000"))  # Сколько обновлений копить для медленного воркера
+WORKER_RESTART_MAX_DELAY = float(os.getenv("WORKER_RESTART_MAX_DELAY", "30"))  # Потолок паузы перед перезапуском упавшего воркера
+
+# Получение обновлений: "polling" (long polling), "webhook" (встроенный HTTP-сервер)
+# или "stdin" (воркер: обновления по одному JSON на строку от супервизора)
+UPDATE_MODE = os.getenv("UPDATE_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Публичный адрес, например https://my-bot.up.railway.app
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", "8080")))  # Railway передает порт в PORT
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")  # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # Сколько соединений Telegram открывает к вебхуку
+WEBHOOK_MAX_BODY_SIZE = 1024 * 1024  # Обновления больше этого размера отбрасываются
+
+# Логирование
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # "text" или "json" (одна JSON-запись на строку)
+LOG_FILE = os.getenv("LOG_FILE", "logs/bot_{time:YYYY-MM-DD}.log")  # Пустая строка - не писать в файл
+LOG_ENQUEUE = os.getenv("LOG_ENQUEUE", "true").lower() in ("1", "true", "yes")  # Писать логи из фонового потока
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))  # Доля записей, которые пишутся для событий на каждое обновление
+LOG_MAX_PER_SECOND = float(os.getenv("LOG_MAX_PER_SECOND", "5"))  # Не больше стольких таких записей в секунду на событие
+
+# Метрики в формате Prometheus на локальном HTTP-эндпоинте /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Параллельная обработка обновлений: чаты обрабатываются одновременно, сообщения внутри чата - по порядку
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "32"))  # 1 - обрабатывать все обновления последовательно; запросы к OpenAI ограничивает допуск
+
+# Лимиты исходящих сообщений (ограничения Bot API)
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))  # Сообщений в секунду на всего бота
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))  # Сообщений в секунду в личный чат
+TELEGRAM_GROUP_RATE_PER_MINUTE = float(os.getenv("TELEGRAM_GROUP_RATE_PER_MINUTE", "20"))  # Сообщений в минуту в группу/канал
+TELEGRAM_CHAT_BURST = 3  # Сколько сообщений подряд можно отправить в один чат без ожидания
+SEND_MAX_RETRIES = 3  # Повторы отправки при 429 и сетевых ошибках
+
 # Scheduled posts (3 раза в день с рандомом ±30 минут)
 SCHEDULED_POSTS = [
     {"hour": 9, "minute": 0},   # Утро: 9:00 ±30 минут
     {"hour": 14, "minute": 0},  # День: 14:00 ±30 минут
     {"hour": 20, "minute": 0},  # Вечер: 20:00 ±30 минут
 ]
+POST_JITTER_MINUTES = float(os.getenv("POST_JITTER_MINUTES", "30"))  # Сдвиг каждого поста, случайный для каждого чата и дня
+POST_QUIET_HOURS = os.getenv("POST_QUIET_HOURS", "")  # Часы без постов, например "1-7" или "23-8"; пусто - без ограничений
+POST_SCHEDULE_SYNC_INTERVAL = 60  # Как часто (сек) подхватывать новые и убирать ушедшие чаты
+
+# Пул заранее сгенерированного контента для запланированных постов
+CONTENT_POOL_ENABLED = os.getenv("CONTENT_POOL_ENABLED", "true").lower() in ("1", "true", "yes")
+CONTENT_POOL_SIZE = int(os.getenv("CONTENT_POOL_SIZE", "6"))  # Сколько текстов каждого типа держать наготове
+CONTENT_POOL_LOW_WATER = 2  # При каком остатке запускать догенерацию
+CONTENT_POOL_TTL = 24 * 3600  # Через сколько секунд текст считается устаревшим
+CONTENT_POOL_RECENT = 100  # Сколько опубликованных текстов помнить для защиты от повторов
+CONTENT_POOL_REFILL_HOUR = 4  # Плановая догенерация ночью, когда бот почти ничего не делает
 
 # ChatGPT prompts
 JOKE_PROMPT = """Ты - гопник-матершинник из плохого района. Сгенерируй пошлую шутку или анекдот с матерной лексикой и грубым юмором. 
@@ -88,6 +196,14 @@ STETHEM_QUOTES = [
     "Твоя мать в отпуске, а я тут думаю - а что если мы все галлюцинации?"
 ]
 
+# Заготовленные ответы на упоминания, когда OpenAI недоступен или перегружен
+MENTION_FALLBACKS = [
+    "Ясно, понятно. Короче, решил я тут пофилософствовать с вами, интеллигентами...",
+    "Слышь, я занят. Подожди, потом поговорим.",
+    "Ща, братан, очередь ко мне как в поликлинику. Попозже.",
+    "Короче, не до тебя сейчас. Твоя мать в отпуске, так что и я тоже.",
+]
+
 COMMENT_PROMPT_TEMPLATE = """Ты - гопник-матершинник из плохого района. В канале идет обсуждение следующей темы:
 
 {conversation_context}
@@ -100,6 +216,18 @@ COMMENT_PROMPT_TEMPLATE = """Ты - гопник-матершинник из п
 
 Ответь ТОЛЬКО текстом комментария, без пояснений."""
 
+COMMENT_BATCH_PROMPT_TEMPLATE = """Ты - гопник-матершинник из плохого района. В нескольких каналах идут обсуждения, темы пронумерованы:
+
+{topics}
+
+Для КАЖДОЙ темы напиши отдельный грубый, циничный и матерный комментарий в стиле гопника. Каждый комментарий должен быть:
+- Кратким (1-2 предложения)
+- С матерной лексикой
+- Циничным и грубым
+- Без политкорректности
+
+Ответь ровно {count} строками в формате "номер. комментарий", без пояснений."""
+
 MENTION_PROMPT_TEMPLATE = """Ты - гопник-матершинник из плохого района. К тебе обратился пользователь {username} со следующим сообщением:
 
 "{message_text}"
@@ -115,3 +243,31 @@ MENTION_PROMPT_TEMPLATE = """Ты - гопник-матершинник из п
 # OpenAI model
 OPENAI_MODEL = "gpt-4o-mini"
 
+# Транспорт OpenAI: общий пул HTTP-соединений и лимит одновременных запросов
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))  # Размер пула соединений
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "10"))  # Сколько соединений держать открытыми
+OPENAI_MAX_CONCURRENT_REQUESTS = int(os.getenv("OPENAI_MAX_CONCURRENT_REQUESTS", "8"))  # Максимум запросов в полете
+OPENAI_REQUEST_TIMEOUT = float(os.getenv("OPENAI_REQUEST_TIMEOUT", "20"))  # Таймаут одного запроса, секунд
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))  # Таймаут установки соединения, секунд
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "1"))  # Повторы внутри SDK при сетевых ошибках
+
+# Предохранитель OpenAI: при массовых ошибках или медленных ответах сразу отдаем заготовки
+OPENAI_CIRCUIT_FAILURE_RATE = float(os.getenv("OPENAI_CIRCUIT_FAILURE_RATE", "0.5"))  # Доля неудачных запросов для размыкания
+OPENAI_CIRCUIT_SLOW_CALL = float(os.getenv("OPENAI_CIRCUIT_SLOW_CALL", "10"))  # Ответ дольше стольких секунд считается неудачей
+OPENAI_CIRCUIT_WINDOW = int(os.getenv("OPENAI_CIRCUIT_WINDOW", "20"))  # По скольким последним запросам считать долю
+OPENAI_CIRCUIT_MIN_CALLS = int(os.getenv("OPENAI_CIRCUIT_MIN_CALLS", "10"))  # Минимум запросов в окне для решения
+OPENAI_CIRCUIT_OPEN_SECONDS = float(os.getenv("OPENAI_CIRCUIT_OPEN_SECONDS", "30"))  # Сколько секунд не ходить в OpenAI после размыкания
+
+# Дублирующие запросы: если ответа нет дольше обычного (p95), параллельно отправляется второй
+OPENAI_HEDGE_ENABLED = os.getenv("OPENAI_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+OPENAI_HEDGE_KINDS = [k.strip() for k in os.getenv("OPENAI_HEDGE_KINDS", "mention").split(",") if k.strip()]  # Для каких классов запросов
+OPENAI_HEDGE_PERCENTILE = float(os.getenv("OPENAI_HEDGE_PERCENTILE", "95"))  # Задержка второго запроса - этот перцентиль задержек
+OPENAI_HEDGE_MIN_DELAY = float(os.getenv("OPENAI_HEDGE_MIN_DELAY", "0.5"))  # Но не меньше стольких секунд
+OPENAI_HEDGE_MIN_SAMPLES = 20  # Сколько замеров нужно, прежде чем дублировать запросы
+
+# Допуск запросов к OpenAI: при таком числе запросов в полете и в очереди новые запросы класса отклоняются
+ADMISSION_MENTION_LIMIT = int(os.getenv("ADMISSION_MENTION_LIMIT", "64"))  # Ответы на упоминания (вместо ответа - заготовка)
+ADMISSION_CONVERSATION_LIMIT = int(os.getenv("ADMISSION_CONVERSATION_LIMIT", "16"))  # Комментарии к обсуждению (пропускаются)
+ADMISSION_SCHEDULED_LIMIT = int(os.getenv("ADMISSION_SCHEDULED_LIMIT", "12"))  # Генерация поста на месте (вместо нее - заготовка)
+ADMISSION_BACKGROUND_LIMIT = int(os.getenv("ADMISSION_BACKGROUND_LIMIT", "6"))  # Догенерация пула контента (откладывается)
+
@@ -0,0 +1,201 @@
+import asyncio
+import random
+import re
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+from loguru import logger
+
+
+_NORMALIZE_RE = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize_text(text: str) -> str:
+    """Приводит текст к виду для сравнения дубликатов (регистр, пунктуация, пробелы)"""
+    return _NORMALIZE_RE.sub(" ", text.lower()).strip()
+
+
+class PooledItem:
+    __slots__ = ("text", "created_at")
+
+    def __init__(self, text: str, created_at: float):
+        self.text = text
+        self.created_at = created_at
+
+
+class ContentPool:
+    """Пул заранее сгенерированного контента для запланированных постов
+
+    Для каждого типа контента держит до target_size готовых текстов. Когда запас
+    опускается до low_water, в фоне запускается догенерация. Тексты старше ttl
+    выбрасываются, а тексты, совпадающие с недавно опубликованными, не берутся в пул.
+    snapshot/restore переносят пул и недавние посты через перезапуск (StateStore).
+    """
+
+    def __init__(self, generators: Dict[str, Callable[[], Awaitable[Optional[str]]]], target_size: int = 6,
+                 low_water: int = 2, ttl: float = 12 * 3600, recent_size: int = 100, refill_concurrency: int = 2):
+        self.generators = generators
+        self.target_size = target_size
+        self.low_water = low_water
+        self.ttl = ttl
+        self.refill_concurrency = refill_concurrency
+        self._items: Dict[str, Deque[PooledItem]] = {name: deque() for name in generators}
+        self._recent: Deque[str] = deque(maxlen=recent_size)
+        self._recent_set: Set[str] = set()
+        self._refill_tasks: Dict[str, asyncio.Task] = {}
+        self._stopped = False
+        self.on_change: Optional[Callable[[], None]] = None  # Вызывается, когда меняется снимок (StateStore.mark_meta_dirty)
+
+        # Метрики
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.expired = 0
+
+    def size(self, content_type: Optional[str] = None) -> int:
+        """Сколько готовых текстов в пуле (всего или для одного типа)"""
+        if content_type is not None:
+            return len(self._items[content_type])
+        return sum(len(items) for items in self._items.values())
+
+    def take(self, content_type: Optional[str] = None) -> Optional[str]:
+        """Забирает готовый текст; None - пул пуст и нужно генерировать на месте"""
+        self._drop_expired()
+        if content_type is None:
+            available = [name for name, items in self._items.items() if items]
+            content_type = random.choice(available) if available else random.choice(list(self._items))
+
+        items = self._items[content_type]
+        text = None
+        while items and text is None:
+            candidate = items.popleft().text
+            # Текст мог быть опубликован после того, как попал в пул
+            if normalize_text(candidate) in self._recent_set:
+                self.duplicates += 1
+            else:
+                text = candidate
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.mark_posted(text)
+
+        if len(items) <= self.low_water:
+            self.schedule_refill(content_type)
+        return text
+
+    def mark_posted(self, text: str):
+        """Запоминает опубликованный текст, чтобы не повторять его"""
+        key = normalize_text(text)
+        if key in self._recent_set:
+            return
+        if len(self._recent) == self._recent.maxlen:
+            self._recent_set.discard(self._recent[0])
+        self._recent.append(key)
+        self._recent_set.add(key)
+        self._changed()
+
+    def schedule_refill(self, content_type: Optional[str] = None):
+        """Запускает догенерацию в фоне, если она еще не идет (после stop - ничего не делает)"""
+        if self._stopped:
+            return
+        for name in ([content_type] if content_type else list(self._items)):
+            task = self._refill_tasks.get(name)
+            if task is None or task.done():
+                self._refill_tasks[name] = asyncio.create_task(self._refill(name))
+
+    async def refill(self, content_type: Optional[str] = None):
+        """Догенерирует контент до target_size и ждет завершения"""
+        self.schedule_refill(content_type)
+        tasks = [task for name, task in self._refill_tasks.items() if content_type in (None, name)]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def stop(self):
+        """Отменяет фоновую догенерацию и не дает запустить новую"""
+        self._stopped = True
+        for task in self._refill_tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._refill_tasks.values(), return_exceptions=True)
+        self._refill_tasks.clear()
+
+    def snapshot(self) -> dict:
+        """Готовые тексты и недавние посты в виде, пригодном для JSON"""
+        return {
+            "items": {name: [[item.text, item.created_at] for item in items] for name, items in self._items.items()},
+            "recent": list(self._recent),
+        }
+
+    def restore(self, snapshot: dict) -> int:
+        """Загружает снимок из snapshot (устаревшие тексты и неизвестные типы пропускаются); возвращает число текстов"""
+        for key in snapshot.get("recent", []):
+            if key not in self._recent_set:
+                if len(self._recent) == self._recent.maxlen:
+                    self._recent_set.discard(self._recent[0])
+                self._recent.append(key)
+                self._recent_set.add(key)
+        cutoff = time.time() - self.ttl
+        restored = 0
+        for name, entries in snapshot.get("items", {}).items():
+            items = self._items.get(name)
+            if items is None:
+                continue
+            for text, created_at in entries[:self.target_size - len(items)]:
+                if created_at >= cutoff and normalize_text(text) not in self._recent_set:
+                    items.append(PooledItem(text, created_at))
+                    restored += 1
+        return restored
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "sizes": {name: len(items) for name, items in self._items.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+            "generated": self.generated,
+            "duplicates": self.duplicates,
+            "expired": self.expired,
+        }
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def _drop_expired(self):
+        cutoff = time.time() - self.ttl
+        for items in self._items.values():
+            while items and items[0].created_at < cutoff:
+                items.popleft()
+                self.expired += 1
+
+    async def _refill(self, content_type: str):
+        generator = self.generators[content_type]
+        items = self._items[content_type]
+        # Ограничиваем число попыток, чтобы дубликаты не зациклили генерацию
+        attempts_left = self.target_size * 2
+        while len(items) < self.target_size and attempts_left > 0:
+            self._drop_expired()
+            batch = min(self.refill_concurrency, self.target_size - len(items), attempts_left)
+            attempts_left -= batch
+            results: List[Optional[str]] = await asyncio.gather(
+                *(generator() for _ in range(batch)), return_exceptions=True
+            )
+
+            known = self._recent_set | {normalize_text(item.text) for item in items}
+            for text in results:
+                if not isinstance(text, str) or not text:
+                    continue
+                key = normalize_text(text)
+                if key in known:
+                    self.duplicates += 1
+                    continue
+                known.add(key)
+                items.append(PooledItem(text, time.time()))
+                self.generated += 1
+            self._changed()
+
+            if all(not isinstance(text, str) for text in results):
+                # Генерация не работает (например, OpenAI недоступен) - попробуем позже
+                logger.warning(f"Content pool refill for {content_type} failed, will retry later")
+                break
+
+        logger.debug(f"Content pool {content_type}: {len(items)}/{self.target_size}")
@@ -0,0 +1,121 @@
+import time
+from typing import Iterator, List, Optional
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов: около 4 байт UTF-8 на токен (кириллица - ~2 символа)"""
+    return len(text.encode("utf-8")) // 4 + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Обрезает текст до max_tokens по оценке estimate_tokens, добавляя многоточие"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    budget = max(0, max_tokens * 4 - 4)  # Байты с запасом под многоточие
+    cut = text.encode("utf-8")[:budget].decode("utf-8", errors="ignore")
+    return cut.rstrip() + "…"
+
+
+class ContextMessage:
+    """Сообщение чата в буфере контекста"""
+
+    __slots__ = ("author", "timestamp", "text")
+
+    def __init__(self, author: str, timestamp: float, text: str):
+        self.author = author
+        self.timestamp = timestamp
+        self.text = text
+
+
+class ContextBuffer:
+    """Кольцевой буфер последних сообщений чата фиксированной емкости
+
+    Добавление перезаписывает самое старое сообщение за O(1). Контекст для промпта
+    собирается от новых сообщений к старым, пока не кончится бюджет токенов.
+    """
+
+    __slots__ = ("capacity", "_slots", "_start", "_size")
+
+    def __init__(self, capacity: int = 3):
+        self.capacity = max(1, capacity)
+        self._slots: List[Optional[ContextMessage]] = [None] * self.capacity
+        self._start = 0  # Индекс самого старого сообщения
+        self._size = 0
+
+    def append(self, author: str, text: str, timestamp: Optional[float] = None):
+        """Добавляет сообщение, вытесняя самое старое при заполнении"""
+        message = ContextMessage(author, time.time() if timestamp is None else timestamp, text)
+        if self._size < self.capacity:
+            self._slots[(self._start + self._size) % self.capacity] = message
+            self._size += 1
+        else:
+            self._slots[self._start] = message
+            self._start = (self._start + 1) % self.capacity
+
+    def clear(self):
+        self._slots = [None] * self.capacity
+        self._start = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[ContextMessage]:
+        """Сообщения от старых к новым"""
+        for offset in range(self._size):
+            yield self._slots[(self._start + offset) % self.capacity]
+
+    def newest(self) -> Iterator[ContextMessage]:
+        """Сообщения от новых к старым"""
+        for offset in range(self._size - 1, -1, -1):
+            yield self._slots[(self._start + offset) % self.capacity]
+
+    def build(self, max_tokens: int, message_max_tokens: Optional[int] = None) -> str:
+        """Собирает контекст "автор: текст" в пределах max_tokens
+
+        Каждое сообщение обрезается до message_max_tokens, чтобы одно длинное не вытеснило
+        остальные. Сообщения, не поместившиеся в бюджет, заменяются строкой-сводкой.
+        """
+        lines: List[str] = []
+        used = 0
+        skipped = 0
+        skipped_authors = set()
+        for message in self.newest():
+            if skipped:
+                skipped += 1
+                skipped_authors.add(message.author)
+                continue
+            line = f"{message.author}: {message.text}" if message.author else message.text
+            if message_max_tokens:
+                line = truncate_to_tokens(line, message_max_tokens)
+            cost = estimate_tokens(line)
+            if used + cost > max_tokens:
+                remaining = max_tokens - used
+                if not lines and remaining > 8:
+                    # Хотя бы последнее сообщение попадает в контекст, пусть и обрезанным
+                    lines.append(truncate_to_tokens(line, remaining))
+                    used = max_tokens
+                    continue
+                skipped = 1
+                skipped_authors.add(message.author)
+                continue
+            lines.append(line)
+            used += cost
+        if skipped:
+            lines.append(f"(и еще {skipped} сообщ. раньше от {len(skipped_authors)} участн.)")
+        lines.reverse()
+        return "\n".join(lines)
+
+    def snapshot(self) -> List[list]:
+        """Сериализуемый снимок для StateStore"""
+        return [[message.author, message.timestamp, message.text] for message in self]
+
+    def restore(self, items: List):
+        """Восстанавливает буфер из снимка (строки - старый формат без автора)"""
+        self.clear()
+        for item in items[-self.capacity:]:
+            if isinstance(item, str):
+                self.append("", item, 0.0)
+            else:
+                author, timestamp, text = item
+                self.append(author, text, timestamp)
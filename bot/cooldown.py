@@ -0,0 +1,81 @@
+import time
+from collections import OrderedDict
+from typing import Hashable, List, Optional
+
+
+class CooldownTracker:
+    """Кулдауны с истечением по TTL и ограничением на число записей
+
+    У всех записей одинаковый TTL, поэтому порядок вставки в OrderedDict совпадает
+    с порядком истечения: просроченные записи снимаются с головы, а проверка
+    с установкой стоит O(1) амортизированно. Память не растет больше max_entries.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, float]" = OrderedDict()  # {ключ: момент истечения (monotonic)}
+
+        # Метрики
+        self.hits = 0
+        self.evicted = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def check_and_set(self, key: Hashable, now: Optional[float] = None) -> bool:
+        """Возвращает True и запускает кулдаун, если для ключа он не активен"""
+        if self.ttl <= 0:
+            return True
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        if key in self._entries:
+            self.hits += 1
+            return False
+        self._entries[key] = now + self.ttl
+        if len(self._entries) > self.max_entries:
+            # Вытесняем запись, которая истекла бы раньше всех
+            self._entries.popitem(last=False)
+            self.evicted += 1
+        return True
+
+    def remaining(self, key: Hashable, now: Optional[float] = None) -> float:
+        """Сколько секунд осталось до конца кулдауна (0 - не активен)"""
+        expires_at = self._entries.get(key)
+        if expires_at is None:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return max(0.0, expires_at - now)
+
+    def reset(self, key: Hashable):
+        """Снимает кулдаун (например, если ответ так и не был отправлен)"""
+        self._entries.pop(key, None)
+
+    def _expire(self, now: float):
+        entries = self._entries
+        while entries:
+            key, expires_at = next(iter(entries.items()))
+            if expires_at > now:
+                break
+            del entries[key]
+
+    def snapshot(self) -> List[list]:
+        """Активные кулдауны в виде [ключ, секунд осталось] для StateStore"""
+        now = time.monotonic()
+        self._expire(now)
+        return [[list(key) if isinstance(key, tuple) else key, expires_at - now]
+                for key, expires_at in self._entries.items()]
+
+    def restore(self, entries: List[list]):
+        """Восстанавливает кулдауны из snapshot"""
+        now = time.monotonic()
+        for key, remaining in sorted(entries, key=lambda entry: entry[1]):
+            if 0 < remaining <= self.ttl:
+                self._entries[tuple(key) if isinstance(key, list) else key] = now + remaining
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.remaining(key) > 0
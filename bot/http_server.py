@@ -0,0 +1,225 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, Union
+from loguru import logger
+
+
+REASONS = {
+    200: "OK",
+    204: "No Content",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    408: "Request Timeout",
+    413: "Payload Too Large",
+    414: "URI Too Long",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class Request:
+    """Разобранный HTTP-запрос"""
+
+    __slots__ = ("method", "path", "query", "headers", "body")
+
+    def __init__(self, method: str, path: str, query: str, headers: Dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers  # Имена заголовков в нижнем регистре
+        self.body = body
+
+
+class Response:
+    """HTTP-ответ обработчика (тело-итератор отправляется по частям, chunked)"""
+
+    __slots__ = ("status", "body", "content_type", "headers")
+
+    def __init__(self, status: int = 200, body: Union[bytes, AsyncIterator[bytes]] = b"",
+                 content_type: str = "text/plain; charset=utf-8",
+                 headers: Optional[Dict[str, str]] = None):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers or {}
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class _RejectRequest(Exception):
+    """Запрос отклоняется с этим статусом, соединение закрывается"""
+
+    def __init__(self, status: int):
+        super().__init__(status)
+        self.status = status
+
+
+class HTTPServer:
+    """Минимальный HTTP/1.1 сервер на asyncio для вебхука и служебных эндпоинтов
+
+    Поддерживает только то, что нужно боту: маршруты по (method, path),
+    тело с Content-Length, keep-alive и ответы по частям (chunked) для потоковых
+    заглушек. Никаких внешних зависимостей.
+
+    Заголовки и тело каждого запроса должны прийти за read_timeout секунд (иначе 408),
+    заголовков - не больше max_headers и max_header_bytes байт (иначе 431), чтобы медленный
+    или бесконечный клиент не держал соединение и буфер на публичном порту.
+    """
+
+    def __init__(self, host: str, port: int, max_body_size: int = 1024 * 1024,
+                 read_timeout: float = 30.0, name: str = "http", max_headers: int = 100,
+                 max_header_bytes: int = 16 * 1024):
+        self.host = host
+        self.port = port
+        self.max_body_size = max_body_size
+        self.read_timeout = read_timeout
+        self.max_headers = max_headers
+        self.max_header_bytes = max_header_bytes
+        self.name = name
+        self._routes: Dict[Tuple[str, str], Handler] = {}
+        self._paths: set = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    def route(self, method: str, path: str, handler: Handler):
+        """Регистрирует обработчик для метода и пути"""
+        self._routes[(method.upper(), path)] = handler
+        self._paths.add(path)
+
+    @property
+    def bound_port(self) -> int:
+        """Фактический порт (полезно, если сервер запущен на порту 0)"""
+        if self._server and self._server.sockets:
+            return self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def start(self):
+        """Начинает принимать соединения"""
+        # Строка длиннее limit не буферизуется целиком: readline бросает ValueError
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                  limit=self.max_header_bytes)
+        logger.info(f"{self.name} server listening on {self.host}:{self.bound_port}")
+
+    async def stop(self):
+        """Перестает принимать соединения и закрывает сервер"""
+        if self._server:
+            self._server.close()
+            # Закрываем keep-alive соединения, чтобы их обработчики завершились сами
+            for writer in list(self._connections):
+                writer.close()
+            if self._connections:
+                await asyncio.wait(list(self._connections.values()), timeout=5)
+            await self._server.wait_closed()
+            self._server = None
+            logger.info(f"{self.name} server stopped")
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), self.read_timeout)
+                except asyncio.TimeoutError:
+                    break
+                except ValueError:
+                    await self._write(writer, Response(414), keep_alive=False)
+                    break
+                if not request_line:
+                    break
+
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3:
+                    await self._write(writer, Response(400), keep_alive=False)
+                    break
+                method, target, version = parts
+
+                try:
+                    headers, body = await asyncio.wait_for(self._read_rest(reader), self.read_timeout)
+                except asyncio.TimeoutError:
+                    await self._write(writer, Response(408), keep_alive=False)
+                    break
+                except _RejectRequest as e:
+                    await self._write(writer, Response(e.status), keep_alive=False)
+                    break
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                path, _, query = target.partition("?")
+                handler = self._routes.get((method, path))
+                if handler is None:
+                    response = Response(405 if path in self._paths else 404)
+                else:
+                    try:
+                        response = await handler(Request(method, path, query, headers, body))
+                    except Exception as e:
+                        logger.error(f"Error in {self.name} handler {method} {path}: {e}")
+                        response = Response(500)
+
+                await self._write(writer, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _read_rest(self, reader: asyncio.StreamReader) -> Tuple[Dict[str, str], bytes]:
+        """Заголовки и тело запроса в пределах лимитов"""
+        headers: Dict[str, str] = {}
+        header_bytes = 0
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                raise _RejectRequest(431)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            header_bytes += len(line)
+            if header_bytes > self.max_header_bytes or len(headers) >= self.max_headers:
+                raise _RejectRequest(431)
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise _RejectRequest(400)
+        if length < 0:
+            raise _RejectRequest(400)
+        if length > self.max_body_size:
+            # Не читаем слишком большое тело, просто закрываем соединение
+            raise _RejectRequest(413)
+        body = await reader.readexactly(length) if length else b""
+        return headers, body
+
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, response: Response, keep_alive: bool):
+        streaming = not isinstance(response.body, bytes)
+        head = [
+            f"HTTP/1.1 {response.status} {REASONS.get(response.status, 'Unknown')}",
+            f"Content-Type: {response.content_type}",
+            "Transfer-Encoding: chunked" if streaming else f"Content-Length: {len(response.body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        head.extend(f"{name}: {value}" for name, value in response.headers.items())
+        head_bytes = ("\r\n".join(head) + "\r\n\r\n").encode("latin-1")
+        if not streaming:
+            writer.write(head_bytes + response.body)
+            await writer.drain()
+            return
+
+        writer.write(head_bytes)
+        async for chunk in response.body:
+            if chunk:
+                writer.write(f"{len(chunk):x}\r\n".encode("latin-1") + chunk + b"\r\n")
+                await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
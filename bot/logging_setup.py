@@ -0,0 +1,105 @@
+import json
+import sys
+import time
+from typing import Dict
+from loguru import logger
+
+
+class LogSampler:
+    """Решает, писать ли очередную строку высоконагруженного события
+
+    Проверка делается до вызова logger, поэтому строка сообщения для отброшенных
+    записей вообще не собирается. Для каждого события пишется каждая N-я запись
+    (N = 1 / sample_rate), но не больше max_per_second в секунду.
+    """
+
+    def __init__(self, min_level: str = "INFO", sample_rate: float = 1.0, max_per_second: float = 0):
+        self.configure(min_level, sample_rate, max_per_second)
+
+    def configure(self, min_level: str, sample_rate: float, max_per_second: float):
+        min_level_no = logger.level(min_level.upper()).no
+        # Заранее считаем, какие уровни включены, чтобы allow не обращался к loguru
+        self._enabled = {name: logger.level(name).no >= min_level_no
+                         for name in ("TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR", "CRITICAL")}
+        self.sample_every = max(1, round(1 / sample_rate)) if sample_rate > 0 else 0
+        self.max_per_second = max_per_second
+        self._seen: Dict[str, int] = {}
+        self._window: Dict[str, list] = {}  # {event: [начало секунды, записей в ней]}
+        self.suppressed: Dict[str, int] = {}
+
+    def allow(self, event: str, level: str = "DEBUG") -> bool:
+        if not self._enabled.get(level, True):
+            return False
+
+        every = self.sample_every
+        if every == 0:
+            return False
+
+        # Вызывается только из event loop, поэтому без блокировок
+        seen = self._seen.get(event, 0)
+        self._seen[event] = seen + 1
+        if seen % every:
+            self.suppressed[event] = self.suppressed.get(event, 0) + 1
+            return False
+
+        if self.max_per_second:
+            now = time.monotonic()
+            window = self._window.get(event)
+            if window is None or now - window[0] >= 1:
+                window = self._window[event] = [now, 0]
+            if window[1] >= self.max_per_second:
+                self.suppressed[event] = self.suppressed.get(event, 0) + 1
+                return False
+            window[1] += 1
+        return True
+
+
+# Общий для процесса сэмплер, настраивается в setup_logging
+log_sampler = LogSampler()
+
+
+def _json_format(record) -> str:
+    """Компактная JSON-строка для одной записи"""
+    payload = {
+        "ts": record["time"].isoformat(),
+        "level": record["level"].name,
+        "logger": record["name"],
+        "func": record["function"],
+        "line": record["line"],
+        "msg": record["message"],
+    }
+    extra = {key: value for key, value in record["extra"].items() if not key.startswith("_")}
+    if extra:
+        payload["extra"] = extra
+    if record["exception"]:
+        payload["exception"] = str(record["exception"].value)
+    record["extra"]["_json"] = json.dumps(payload, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
+
+
+def setup_logging(config):
+    """Настраивает sinks loguru: консоль и файл, оба через неблокирующую очередь"""
+    logger.remove()
+
+    level = config.LOG_LEVEL.upper()
+    fmt = _json_format if config.LOG_FORMAT == "json" else None
+    text_kwargs = {"format": fmt} if fmt else {}
+
+    # enqueue=True: запись в консоль/файл выполняется отдельным потоком, обработчики не ждут диск
+    logger.add(sys.stderr, level=level, enqueue=config.LOG_ENQUEUE, **text_kwargs)
+    if config.LOG_FILE:
+        logger.add(
+            config.LOG_FILE,
+            rotation="00:00",
+            retention="7 days",
+            level=level,
+            enqueue=config.LOG_ENQUEUE,
+            **text_kwargs
+        )
+
+    log_sampler.configure(
+        min_level=level,
+        sample_rate=config.LOG_SAMPLE_RATE,
+        max_per_second=config.LOG_MAX_PER_SECOND,
+    )
+    logger.debug("Logging configured: level={}, format={}, enqueue={}", level, config.LOG_FORMAT, config.LOG_ENQUEUE)
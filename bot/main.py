@@ -1,12 +1,24 @@
 #!/usr/bin/env python3
 """Главный файл запуска бота"""
+import argparse
 import asyncio
 import signal
+import time
+
+from bot.startup import STARTUP
+
+from dotenv import load_dotenv
 from loguru import logger
 
-import bot.config as config
-from bot.telegram_handler import TelegramBotHandler
-from bot.scheduler import SchedulerManager
+with STARTUP.phase("config"):
+    # .env читается до импорта bot.config: значения берутся из окружения при импорте
+    load_dotenv()
+    import bot.config as config
+from bot.metrics import MetricsServer
+from bot.logging_setup import setup_logging
+
+# telegram, openai и apscheduler (большая часть времени импорта) подгружаются в BotApplication.initialize:
+# супервизору они не нужны вовсе
 
 
 class BotApplication:
@@ -16,42 +28,52 @@ class BotApplication:
         self.config = config
         self.telegram_handler = None
         self.scheduler = None
-        self.running = True
+        self.metrics_server = None
+        self._stop_event = asyncio.Event()
         
     async def initialize(self):
         """Инициализация компонентов"""
         logger.info("Initializing bot application...")
         
-        # Инициализируем Telegram handler
-        self.telegram_handler = TelegramBotHandler(self.config)
-        await self.telegram_handler.initialize()
+        # Эндпоинт метрик поднимаем первым, чтобы видеть и время старта
+        if self.config.METRICS_ENABLED:
+            self.metrics_server = MetricsServer(self.config.METRICS_HOST, self.config.METRICS_PORT)
+            await self.metrics_server.start()
         
-        # Инициализируем планировщик
-        self.scheduler = SchedulerManager(self.telegram_handler)
-        self.scheduler.set_channel_id(self.config.CHANNEL_ID)
-        self.scheduler.start(self.config.SCHEDULED_POSTS)
+        with STARTUP.phase("imports"):
+            from bot.telegram_handler import TelegramBotHandler
+            from bot.scheduler import SchedulerManager
+        
+        # Инициализируем Telegram handler (getMe, состояние и кэш ответов загружаются параллельно)
+        with STARTUP.phase("handler_init"):
+            self.telegram_handler = TelegramBotHandler(self.config)
+            await self.telegram_handler.initialize()
+        
+        # Инициализируем планировщик (с тем же клиентом OpenAI)
+        with STARTUP.phase("scheduler"):
+            self.scheduler = SchedulerManager(self.telegram_handler, self.telegram_handler.chatgpt_client)
+            self.scheduler.set_channel_id(self.config.CHANNEL_ID)
+            self.scheduler.start(self.config.SCHEDULED_POSTS)
         
         logger.info("Bot application initialized")
     
-    async def run(self):
-        """Запускает бота"""
+    async def run(self, profile_startup: bool = False):
+        """Запускает бота и ждет сигнала остановки (с profile_startup - печатает этапы запуска и выходит)"""
         try:
             await self.initialize()
             
-            # Создаем задачу для polling
-            polling_task = asyncio.create_task(self.telegram_handler.start_polling())
+            # Получение обновлений (polling, webhook или stdin) работает в фоне внутри PTB
+            with STARTUP.phase("start_updates"):
+                await self.telegram_handler.start_updates()
+            
+            total = STARTUP.finish()
+            logger.info(f"Startup complete in {total * 1000:.0f} ms: {STARTUP.summary()}")
+            if profile_startup:
+                print(STARTUP.format(), flush=True)
+                return
             
-            # Ждем сигнал остановки
-            while self.running:
-                await asyncio.sleep(0.5)
+            await self._stop_event.wait()
             
-            # Отменяем polling при остановке
-            polling_task.cancel()
-            try:
-                await polling_task
-            except asyncio.CancelledError:
-                logger.info("Polling task cancelled")
-                
         except KeyboardInterrupt:
             logger.info("Received keyboard interrupt")
         except Exception as e:
@@ -63,45 +85,85 @@ class BotApplication:
         """Останавливает бота"""
         logger.info("Shutting down...")
         
+        # Новые посты не запускаем, начатые доделываем; затем handler доделывает ответы и отправки.
+        # На все вместе - SHUTDOWN_DRAIN_TIMEOUT, отправку постов handler.stop еще успевает выполнить
+        deadline = time.monotonic() + self.config.SHUTDOWN_DRAIN_TIMEOUT
+        dropped_posts = 0
         if self.scheduler:
-            self.scheduler.shutdown()
+            dropped_posts = await self.scheduler.shutdown(self.config.SHUTDOWN_DRAIN_TIMEOUT)
         
         if self.telegram_handler:
-            await self.telegram_handler.stop()
+            await self.telegram_handler.stop(max(0.0, deadline - time.monotonic()), scheduled_posts=dropped_posts)
+        
+        # Закрываем общий пул соединений OpenAI
+        if self.telegram_handler:
+            from bot.chatgpt_client import close_shared_http_client
+            await close_shared_http_client()
+        
+        if self.metrics_server:
+            await self.metrics_server.stop()
         
         logger.info("Shutdown complete")
+        # Дожидаемся, пока фоновый поток допишет очередь логов
+        await logger.complete()
     
     def stop(self):
-        """Устанавливает флаг остановки"""
-        self.running = False
+        """Будит run для остановки (вызывается из обработчика сигнала в цикле событий)"""
+        self._stop_event.set()
+
+
+def install_signal_handlers(callback):
+    """SIGINT/SIGTERM вызывают callback прямо в цикле событий"""
+    loop = asyncio.get_running_loop()
+    
+    def on_signal(signum):
+        logger.info(f"Received signal {signal.Signals(signum).name}")
+        callback()
+    
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, on_signal, signum)
+        except NotImplementedError:
+            # Windows: обработчик из signal.signal, передаем вызов в цикл событий потокобезопасно
+            signal.signal(signum, lambda sig, frame: loop.call_soon_threadsafe(on_signal, sig))
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Pid0r Bot")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Запустить бота, напечатать время этапов запуска и остановиться")
+    return parser.parse_args(argv)
 
 
 async def main():
     """Главная функция"""
-    # Настройка логирования
-    logger.add(
-        "logs/bot_{time:YYYY-MM-DD}.log",
-        rotation="00:00",
-        retention="7 days",
-        level="INFO"
-    )
+    args = parse_args()
+    # Настройка логирования (неблокирующие sinks, JSON по LOG_FORMAT, сэмплирование)
+    with STARTUP.phase("logging"):
+        setup_logging(config)
+    try:
+        config.validate_config()
+    except ValueError:
+        # Не прерываем выполнение: ошибка уже в логе, а без токена остановится initialize
+        pass
     
     logger.info("=" * 50)
     logger.info("Starting Pid0r Bot...")
     logger.info("=" * 50)
     
-    app = BotApplication()
+    # Супервизор с воркерами: сам только получает обновления и раздает их по чатам
+    if config.WORKERS > 1 and config.WORKER_INDEX < 0:
+        from bot.supervisor import Supervisor
+        supervisor = Supervisor(config)
+        install_signal_handlers(supervisor.request_stop)
+        await supervisor.run()
+        await logger.complete()
+        return
     
+    app = BotApplication()
     # Обработка сигналов для graceful shutdown
-    def signal_handler(signum, frame):
-        logger.info(f"Received signal {signum}")
-        app.stop()
-    
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-    
-    await app.run()
-
+    install_signal_handlers(app.stop)
+    await app.run(profile_startup=args.profile_startup)
 
 if __name__ == "__main__":
     asyncio.run(main())
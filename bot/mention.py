@@ -0,0 +1,79 @@
+import re
+from typing import Iterable, Optional, Pattern
+
+from telegram import Message
+from telegram.constants import MessageEntityType
+
+
+class MentionDetector:
+    """Определяет обращение к боту; собирается один раз после getMe
+
+    Порядок проверок: ответ на сообщение бота, сущности mention/text_mention от Telegram,
+    затем один заранее скомпилированный регэксп по тексту (@username и прозвища из
+    BOT_ALIASES, без учета регистра и только целыми словами). Текст не копируется
+    и не приводится к нижнему регистру.
+    """
+
+    __slots__ = ("bot_id", "username", "aliases", "_mention", "_pattern")
+
+    def __init__(self, bot_id: Optional[int], username: Optional[str], aliases: Iterable[str] = ()):
+        self.bot_id = bot_id
+        self.username = username
+        self.aliases = tuple(alias.strip() for alias in aliases if alias.strip())
+        self._mention = f"@{username}".lower() if username else None
+        self._pattern = self._compile()
+
+    def _compile(self) -> Optional[Pattern]:
+        variants = [re.escape(self._mention)] if self._mention else []
+        variants.extend(re.escape(alias) for alias in self.aliases)
+        if not variants:
+            return None
+        # Длинные варианты первыми, чтобы прозвище не перекрывало более длинное.
+        # Границы слова проверяются в _search: lookbehind на каждой позиции заметно медленнее
+        variants.sort(key=len, reverse=True)
+        return re.compile("|".join(variants), re.IGNORECASE)
+
+    def _search(self, text: str) -> bool:
+        """Есть ли в тексте @username или прозвище целым словом"""
+        position = 0
+        while True:
+            match = self._pattern.search(text, position)
+            if match is None:
+                return False
+            start, end = match.span()
+            if (start == 0 or not (text[start - 1].isalnum() or text[start - 1] in "_@")) \
+                    and (end == len(text) or not (text[end].isalnum() or text[end] == "_")):
+                return True
+            position = start + 1
+
+    def is_mentioned(self, message: Message) -> bool:
+        """Обращается ли сообщение к боту"""
+        text = message.text
+        if not text:
+            return False
+        user = message.from_user
+        if user is not None and user.id == self.bot_id:
+            return False
+
+        reply_to = message.reply_to_message
+        if reply_to is not None and reply_to.from_user is not None and reply_to.from_user.id == self.bot_id:
+            return True
+
+        has_mention_entity = False
+        for entity in message.entities:
+            if entity.type == MessageEntityType.MENTION:
+                has_mention_entity = True
+                # Длина сущности в UTF-16 совпадает с длиной @username (он всегда ASCII)
+                if self._mention and entity.length == len(self._mention) \
+                        and message.parse_entity(entity).lower() == self._mention:
+                    return True
+            elif entity.type == MessageEntityType.TEXT_MENTION:
+                if entity.user is not None and entity.user.id == self.bot_id:
+                    return True
+
+        # Telegram размечает все @упоминания сущностями, так что без прозвищ текст можно не сканировать
+        if self._pattern is None or (has_mention_entity and not self.aliases):
+            return False
+        if not self.aliases and "@" not in text:
+            return False
+        return self._search(text)
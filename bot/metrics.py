@@ -0,0 +1,261 @@
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from loguru import logger
+
+from bot.http_server import HTTPServer, Request, Response
+
+
+# Границы бакетов по умолчанию (секунды): от быстрых локальных операций до медленных ответов OpenAI
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def percentile(values, percent: float) -> Optional[float]:
+    """Перцентиль по замерам (None, если замеров нет): ближайший ранг round((n - 1) * p / 100)
+
+    Один способ для статистики бота и отчетов bench, чтобы p95 везде значил одно и то же.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback: Optional[Callable[[], Dict[LabelValues, float]]] = None
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def set_callback(self, callback: Callable[[], Dict[LabelValues, float]]):
+        """Значения берутся из функции в момент сбора (для счетчиков горячего пути в простых int)"""
+        self._callback = callback
+
+    def _samples(self) -> List[str]:
+        values = self._values
+        if self._callback is not None:
+            try:
+                values = self._callback()
+            except Exception as e:
+                logger.debug(f"Counter {self.name} callback failed: {e}")
+                return []
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Текущее значение; может вычисляться функцией в момент сбора метрик"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels: str):
+        self._values[self._key(labels)] = value
+
+    def set_callback(self, callback: Callable[[], float]):
+        self._callback = callback
+
+    def _samples(self) -> List[str]:
+        if self._callback is not None:
+            try:
+                return [f"{self.name} {_format_value(self._callback())}"]
+            except Exception as e:
+                logger.debug(f"Gauge {self.name} callback failed: {e}")
+                return []
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными бакетами (совместима с форматом Prometheus)"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # {labels: [счетчики по бакетам..., сумма, количество]}
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [0] * (len(self.buckets) + 2)
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state[index] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Замеряет длительность блока"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: str) -> int:
+        state = self._values.get(self._key(labels))
+        return int(state[-1]) if state else 0
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, state in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {int(state[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {int(state[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              callback: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Текст в формате Prometheus exposition"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Метрики горячего пути. Объявлены здесь, чтобы все имена были в одном месте
+UPDATES_RECEIVED = REGISTRY.counter("bot_updates_received_total", "Updates received from Telegram", ["type"])
+UPDATES_FILTERED = REGISTRY.counter("bot_updates_filtered_total", "Updates dropped by the early filter before handling", ["stage"])
+UPDATE_HANDLER_SECONDS = REGISTRY.histogram("bot_update_handler_seconds", "Time spent handling one update")
+OPENAI_REQUEST_SECONDS = REGISTRY.histogram("bot_openai_request_seconds", "OpenAI completion latency", ["method"])
+OPENAI_FIRST_TOKEN_SECONDS = REGISTRY.histogram("bot_openai_first_token_seconds", "Time to the first streamed completion chunk", ["method"])
+OPENAI_TOKENS = REGISTRY.counter("bot_openai_tokens_total", "Tokens used by OpenAI completions", ["method", "kind"])
+OPENAI_ERRORS = REGISTRY.counter("bot_openai_errors_total", "Failed OpenAI completions", ["method", "error"])
+SEND_SECONDS = REGISTRY.histogram("bot_telegram_send_seconds", "Bot API send request latency", ["priority"])
+SEND_QUEUE_SECONDS = REGISTRY.histogram("bot_telegram_send_queue_seconds", "Time a message waits in the send queue", ["priority"])
+SEND_RESULTS = REGISTRY.counter("bot_telegram_send_total", "Outgoing Bot API requests by result", ["priority", "result"])
+SEND_QUEUE_DEPTH = REGISTRY.gauge("bot_telegram_send_queue_depth", "Messages waiting in the send queue")
+COOLDOWN_HITS = REGISTRY.counter("bot_cooldown_hits_total", "Responses skipped because of a cooldown", ["kind"])
+SCHEDULER_SKIPS = REGISTRY.counter("bot_scheduler_skips_total", "Scheduled posts skipped", ["reason"])
+SCHEDULED_POSTS = REGISTRY.counter("bot_scheduled_posts_total", "Scheduled posts sent", ["source"])
+SCHEDULED_CHATS = REGISTRY.gauge("bot_scheduled_chats", "Chats with a pending scheduled post")
+OPENAI_CIRCUIT_STATE = REGISTRY.gauge("bot_openai_circuit_state", "Circuit breaker state per model (0 closed, 1 half-open, 2 open)", ["model"])
+OPENAI_PATHS = REGISTRY.counter("bot_openai_completion_path_total", "How completions were served", ["method", "path"])
+COMMENT_BATCH_SIZE = REGISTRY.histogram("bot_comment_batch_size", "Comments generated per OpenAI request",
+                                        buckets=(1, 2, 3, 4, 5, 8, 10))
+OPENAI_PENDING = REGISTRY.gauge("bot_openai_pending_requests", "OpenAI requests in flight or waiting for a slot")
+ADMISSION_SHED = REGISTRY.counter("bot_admission_shed_total", "OpenAI requests rejected by admission control", ["kind"])
+SUPERVISOR_ROUTED = REGISTRY.counter("bot_supervisor_routed_total", "Updates forwarded to worker processes", ["worker"])
+SUPERVISOR_DROPPED = REGISTRY.counter("bot_supervisor_dropped_total", "Updates the supervisor could not forward", ["reason"])
+WORKER_RESTARTS = REGISTRY.counter("bot_worker_restarts_total", "Worker processes restarted after a crash", ["worker"])
+RESPONSE_CACHE = REGISTRY.counter("bot_response_cache_total", "Response cache lookups by result (hit, miss, refresh)", ["method", "result"])
+
+
+class MetricsServer:
+    """HTTP-эндпоинт для сбора метрик (GET /metrics)"""
+
+    def __init__(self, host: str, port: int, registry: MetricsRegistry = REGISTRY):
+        self.registry = registry
+        self.server = HTTPServer(host, port, name="metrics")
+        self.server.route("GET", "/metrics", self._handle_metrics)
+        self.server.route("GET", "/healthz", self._handle_health)
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
+
+    async def _handle_metrics(self, request: Request) -> Response:
+        return Response(200, self.registry.render().encode(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+    async def _handle_health(self, request: Request) -> Response:
+        return Response(200, b"ok")
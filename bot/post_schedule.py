@@ -0,0 +1,155 @@
+import heapq
+import itertools
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+
+def parse_quiet_hours(value: str) -> Optional[Tuple[int, int]]:
+    """"1-7" -> (1, 7): часы [1:00, 7:00) без постов; "23-6" переходит через полночь, пусто - None"""
+    value = value.strip()
+    if not value:
+        return None
+    start, end = (int(part) for part in value.split("-", 1))
+    return start % 24, end % 24
+
+
+class PostSchedule:
+    """Расписание постов каждого чата в одной куче по времени срабатывания
+
+    У каждого чата свое следующее время: ближайший слот из SCHEDULED_POSTS плюс случайный
+    сдвиг в пределах jitter_minutes, заново для каждого дня и слота, поэтому чаты не постят
+    одновременно. Вставка и срабатывание - O(log n); при перепланировании или удалении
+    чата старая запись в куче не ищется, а пропускается при извлечении. Слоты, попавшие
+    в тихие часы, отбрасываются сразу при расчете, а не при срабатывании.
+    """
+
+    def __init__(self, slots: Iterable[Tuple[int, int]], jitter_minutes: float = 30,
+                 quiet_hours: Optional[Tuple[int, int]] = None, rng: Optional[random.Random] = None):
+        self.slots: List[Tuple[int, int]] = sorted(set(slots))
+        self.jitter = jitter_minutes * 60
+        self.quiet_hours = quiet_hours
+        self._rng = rng or random.Random()
+        self._heap: List[Tuple[float, int, Hashable]] = []  # (время, seq, чат)
+        # {чат: (время, seq, (день, номер слота))} - актуальная запись; в куче могут быть устаревшие
+        self._entries: Dict[Hashable, Tuple[float, int, Tuple[int, int]]] = {}
+        self._seq = itertools.count()
+
+        # Метрики
+        self.fired = 0
+        self.quiet_skipped = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, chat_id: Hashable) -> bool:
+        return chat_id in self._entries
+
+    def add(self, chat_id: Hashable, now: Optional[float] = None):
+        """Планирует чат на ближайший слот (уже запланированный чат не трогает)"""
+        if chat_id not in self._entries and self.slots:
+            self._push(chat_id, time.time() if now is None else now, None)
+
+    def remove(self, chat_id: Hashable):
+        self._entries.pop(chat_id, None)
+
+    def sync(self, chat_ids: Iterable[Hashable], now: Optional[float] = None) -> Tuple[int, int]:
+        """Приводит набор чатов к chat_ids; возвращает (добавлено, удалено)"""
+        now = time.time() if now is None else now
+        wanted = set(chat_ids)
+        removed = [chat_id for chat_id in self._entries if chat_id not in wanted]
+        for chat_id in removed:
+            del self._entries[chat_id]
+        added = 0
+        for chat_id in wanted:
+            if chat_id not in self._entries:
+                self.add(chat_id, now)
+                added += 1
+        # Устаревших записей не должно копиться больше, чем живых
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(fire_at, seq, chat_id) for chat_id, (fire_at, seq, _) in self._entries.items()]
+            heapq.heapify(self._heap)
+        return added, len(removed)
+
+    def due(self, now: Optional[float] = None) -> List[Hashable]:
+        """Чаты, которым пора постить; каждый сразу планируется на следующий слот"""
+        now = time.time() if now is None else now
+        fired = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            fire_at, seq, chat_id = heapq.heappop(heap)
+            entry = self._entries.get(chat_id)
+            if entry is None or entry[1] != seq:
+                continue
+            fired.append(chat_id)
+            # После простоя (сон, перезапуск цикла) пропущенные слоты не догоняются пачкой
+            self._push(chat_id, now, entry[2])
+        self.fired += len(fired)
+        return fired
+
+    def next_wakeup(self) -> Optional[float]:
+        """Время ближайшего срабатывания (unix), None - чатов нет"""
+        heap = self._heap
+        while heap:
+            fire_at, seq, chat_id = heap[0]
+            entry = self._entries.get(chat_id)
+            if entry is not None and entry[1] == seq:
+                return fire_at
+            heapq.heappop(heap)
+        return None
+
+    def next_fire_at(self, chat_id: Hashable) -> Optional[float]:
+        entry = self._entries.get(chat_id)
+        return entry[0] if entry else None
+
+    def next_fire_times(self) -> Dict[Hashable, float]:
+        """{чат: unix-время следующего поста}"""
+        return {chat_id: entry[0] for chat_id, entry in self._entries.items()}
+
+    def _push(self, chat_id: Hashable, after: float, last_key: Optional[Tuple[int, int]]):
+        fire_at, key = self._next_fire(after, last_key)
+        seq = next(self._seq)
+        self._entries[chat_id] = (fire_at, seq, key)
+        heapq.heappush(self._heap, (fire_at, seq, chat_id))
+
+    def _next_fire(self, after: float, last_key: Optional[Tuple[int, int]]) -> Tuple[float, Tuple[int, int]]:
+        """Первый слот позже last_key (день, слот), срабатывающий после after и не в тихие часы"""
+        # Начинаем со вчера: слот 23:50 со сдвигом может сработать уже после полуночи
+        day = date.fromtimestamp(after) - timedelta(days=1)
+        for _ in range(9):
+            for index, (hour, minute) in enumerate(self.slots):
+                key = (day.toordinal(), index)
+                if last_key is not None and key <= last_key:
+                    continue
+                base = datetime(day.year, day.month, day.day, hour, minute).timestamp()
+                fire_at = base + self._rng.uniform(-self.jitter, self.jitter)
+                if fire_at <= after:
+                    continue
+                if self._is_quiet(fire_at):
+                    self.quiet_skipped += 1
+                    continue
+                return fire_at, key
+            day += timedelta(days=1)
+        # Все слоты в тихих часах: чат проверяется раз в сутки, пока настройки не поменяют
+        return after + 24 * 3600, (date.fromtimestamp(after).toordinal() + 1, -1)
+
+    def _is_quiet(self, timestamp: float) -> bool:
+        if self.quiet_hours is None:
+            return False
+        start, end = self.quiet_hours
+        hour = datetime.fromtimestamp(timestamp).hour
+        return start <= hour < end if start <= end else hour >= start or hour < end
+
+    def stats(self) -> dict:
+        return {
+            "chats": len(self._entries),
+            "heap": len(self._heap),
+            "fired": self.fired,
+            "quiet_skipped": self.quiet_skipped,
+        }
+
+
+def slots_from_config(posts: Sequence[dict]) -> List[Tuple[int, int]]:
+    """SCHEDULED_POSTS ([{"hour", "minute"}]) -> [(час, минута)]"""
+    return [(post["hour"], post["minute"]) for post in posts]
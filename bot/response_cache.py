@@ -0,0 +1,199 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+from loguru import logger
+
+from bot.content_pool import normalize_text
+from bot.metrics import RESPONSE_CACHE
+
+
+def make_key(method: str, template: str, message_text: str, username: str = "") -> str:
+    """Ключ кэша: метод, контрольная сумма шаблона промпта, нормализованное сообщение и имя
+
+    Сумма шаблона нужна, чтобы после правки промпта старые ответы с диска не подсовывались.
+    Имя входит в ключ, если оно есть в промпте: модель склоняет и перефразирует его в ответе,
+    поэтому подставить другое имя в готовый текст нельзя.
+    """
+    return f"{method}:{zlib.crc32(template.encode()):08x}:{normalize_text(message_text)}:{normalize_text(username)}"
+
+
+class ResponseCache:
+    """Кэш ответов OpenAI на одинаковые обращения (LRU + TTL)
+
+    На каждый ключ хранится до max_variants разных ответов. При попадании готовый
+    вариант выдается с вероятностью reuse_probability, иначе запрос идет в OpenAI
+    и новый ответ пополняет варианты - так бот реже повторяется слово в слово.
+    Если задан disk_path, записи сохраняются в SQLite фоновым flush и читаются при старте.
+    """
+
+    def __init__(self, max_entries: int = 5000, ttl: float = 24 * 3600, reuse_probability: float = 0.7,
+                 max_variants: int = 3, disk_path: str = "", flush_interval: float = 5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.reuse_probability = reuse_probability
+        self.max_variants = max_variants
+        self.disk_path = disk_path
+        self.flush_interval = flush_interval
+        # key -> (варианты ответа, время первой записи)
+        self._entries: "OrderedDict[str, Tuple[List[str], float]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._dirty: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+
+        # Метрики
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evicted = 0
+
+    def get(self, method: str, key: str) -> Optional[str]:
+        """Готовый ответ или None, если нужно спросить OpenAI"""
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry[1] >= self.ttl:
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            RESPONSE_CACHE.inc(method=method, result="miss")
+            return None
+
+        self._entries.move_to_end(key)
+        if random.random() >= self.reuse_probability:
+            # Осознанно идем за свежим ответом, он станет еще одним вариантом
+            self.refreshes += 1
+            RESPONSE_CACHE.inc(method=method, result="refresh")
+            return None
+        self.hits += 1
+        RESPONSE_CACHE.inc(method=method, result="hit")
+        return random.choice(entry[0])
+
+    def put(self, key: str, text: str):
+        """Добавляет ответ OpenAI как вариант для ключа"""
+        entry = self._entries.get(key)
+        if entry is None or time.time() - entry[1] >= self.ttl:
+            entry = ([], time.time())
+            self._entries[key] = entry
+        variants = entry[0]
+        if text not in variants:
+            variants.append(text)
+            if len(variants) > self.max_variants:
+                variants.pop(0)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+        if self._conn is not None:
+            self._dirty.add(key)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def open(self):
+        """Открывает дисковый уровень и загружает из него свежие записи"""
+        if not self.disk_path:
+            return
+        directory = os.path.dirname(self.disk_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.disk_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, variants TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        rows = self._conn.execute(
+            "SELECT key, variants, created_at FROM response_cache WHERE created_at >= ? "
+            "ORDER BY created_at DESC LIMIT ?",
+            (time.time() - self.ttl, self.max_entries)
+        ).fetchall()
+        # Самые свежие должны оказаться в конце LRU
+        for key, variants, created_at in reversed(rows):
+            try:
+                self._entries[key] = (json.loads(variants)[-self.max_variants:], created_at)
+            except ValueError:
+                logger.warning(f"Corrupted response cache entry {key!r}, skipping")
+        logger.info(f"Response cache opened: {self.disk_path} ({len(self._entries)} entries loaded)")
+
+    def start(self):
+        """Запускает фоновую запись на диск"""
+        if self._conn is not None and (self._task is None or self._task.done()):
+            self._stop.clear()
+            self._task = asyncio.create_task(self._run(), name="response-cache-flush")
+
+    async def close(self):
+        """Сбрасывает изменения на диск и закрывает базу (фоновый цикл доводит начатую запись до конца)"""
+        if self._task:
+            self._stop.set()
+            try:
+                await self._task
+            except Exception as e:
+                logger.error(f"Response cache flush loop failed: {e}")
+            self._task = None
+        if self._conn is not None:
+            await self.flush()
+            self._conn.close()
+            self._conn = None
+
+    async def flush(self):
+        """Пишет измененные записи одной транзакцией в отдельном потоке"""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        rows = []
+        for key in dirty:
+            entry = self._entries.get(key)
+            if entry is not None:
+                rows.append((key, json.dumps(entry[0], ensure_ascii=False), entry[1]))
+        write = asyncio.ensure_future(asyncio.to_thread(self._write, rows, time.time() - self.ttl))
+        try:
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            # Поток не отменить: соединение должно пережить его транзакцию
+            await asyncio.wait({write})
+            if write.exception() is not None:
+                self._dirty |= dirty
+            raise
+        except Exception as e:
+            self._dirty |= dirty
+            logger.error(f"Error flushing response cache: {e}")
+
+    def _write(self, rows: List[tuple], expired_before: float):
+        conn = self._conn
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT INTO response_cache (key, variants, created_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET variants = excluded.variants, created_at = excluded.created_at",
+                rows
+            )
+            conn.execute("DELETE FROM response_cache WHERE created_at < ?", (expired_before,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                await self.flush()
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.hits + self.misses + self.refreshes
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "evicted": self.evicted,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
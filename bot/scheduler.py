@@ -1,90 +1,221 @@
 import asyncio
-import random
-from datetime import datetime, time as dt_time
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set
 from loguru import logger
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
 from bot.chatgpt_client import ChatGPTClient
+from bot.admission import KIND_BACKGROUND
+from bot.content_pool import ContentPool
+from bot.metrics import SCHEDULER_SKIPS, SCHEDULED_POSTS, SCHEDULED_CHATS
+from bot.config import (
+    CONTENT_POOL_ENABLED, CONTENT_POOL_SIZE, CONTENT_POOL_LOW_WATER, CONTENT_POOL_TTL,
+    CONTENT_POOL_RECENT, CONTENT_POOL_REFILL_HOUR,
+    POST_JITTER_MINUTES, POST_QUIET_HOURS, POST_SCHEDULE_SYNC_INTERVAL,
+)
+from bot.post_schedule import PostSchedule, parse_quiet_hours, slots_from_config
+from bot.send_queue import PRIORITY_SCHEDULED
 
 
 class SchedulerManager:
     """Управляет запланированными постами бота"""
     
-    def __init__(self, bot_instance):
+    def __init__(self, bot_instance, chatgpt_client: Optional[ChatGPTClient] = None):
         self.bot_instance = bot_instance
         self.scheduler = AsyncIOScheduler()
-        self.chatgpt_client = ChatGPTClient()
+        # Клиент OpenAI общий с обработчиком (свой пул соединений и допуск не нужны)
+        self.chatgpt_client = chatgpt_client or getattr(bot_instance, "chatgpt_client", None) or ChatGPTClient()
         self.channel_id = None
         
+        # Посты по чатам: одна куча и один таймер на все чаты (создаются в start)
+        self.post_schedule: Optional[PostSchedule] = None
+        self._timer_task: Optional[asyncio.Task] = None
+        self._post_tasks: Set[asyncio.Task] = set()
+        
+        # Готовые шутки и цитаты, чтобы пост уходил сразу, без ожидания OpenAI
+        self.content_pool = None
+        if CONTENT_POOL_ENABLED:
+            self.content_pool = ContentPool(
+                {
+                    "joke": lambda: self.chatgpt_client.generate_joke(use_fallback=False, kind=KIND_BACKGROUND),
+                    "meme": lambda: self.chatgpt_client.generate_meme_quote(use_fallback=False, kind=KIND_BACKGROUND),
+                },
+                target_size=CONTENT_POOL_SIZE,
+                low_water=CONTENT_POOL_LOW_WATER,
+                ttl=CONTENT_POOL_TTL,
+                recent_size=CONTENT_POOL_RECENT,
+            )
+        
     def set_channel_id(self, channel_id: str):
         """Устанавливает ID канала"""
         self.channel_id = channel_id
     
+    def _target_chat_ids(self) -> List:
+        chat_ids = self.bot_instance.get_target_chat_ids() if hasattr(self.bot_instance, 'get_target_chat_ids') else []
+        # Воркеру супервизора достаются только его чаты, основной канал может принадлежать другому
+        if not chat_ids and self.channel_id and getattr(self.bot_instance, 'worker_ring', None) is None:
+            chat_ids = [self.channel_id]
+        return chat_ids
+    
     async def post_random_content(self):
-        """Отправляет рандомный пост в канал"""
-        if not self.channel_id:
+        """Отправляет рандомный пост во все тихие чаты сразу (вне расписания)"""
+        chat_ids = self._target_chat_ids()
+        if not chat_ids:
+            SCHEDULER_SKIPS.inc(reason="no_chats")
             logger.error("Channel ID not set!")
             return
         
+        await asyncio.gather(*(self.post_to_chat(chat_id) for chat_id in chat_ids))
+    
+    async def post_to_chat(self, chat_id):
+        """Отправляет рандомный пост в один чат"""
         try:
             # Проверяем, действительно ли канал тихий
-            if self.bot_instance.monitor.is_channel_active():
-                logger.info("Channel is active, skipping scheduled post")
+            if self.bot_instance.is_chat_active(chat_id):
+                logger.info(f"Chat {chat_id} is active, skipping scheduled post")
+                SCHEDULER_SKIPS.inc(reason="active")
                 return
             
-            logger.info("Posting random content to channel")
-            content = await self.chatgpt_client.generate_random_content()
+            logger.info(f"Posting random content to chat {chat_id}")
+            content = await self.get_content()
             
-            # Используем метод бота для отправки сообщения
+            # Отправляем через общую очередь бота с низким приоритетом
             if hasattr(self.bot_instance, 'application'):
-                bot = self.bot_instance.application.bot
-                await bot.send_message(
-                    chat_id=self.channel_id,
-                    text=content
+                await self.bot_instance.sender.send_message(
+                    self.bot_instance.application.bot,
+                    chat_id=chat_id,
+                    text=content,
+                    priority=PRIORITY_SCHEDULED
                 )
-                logger.success("Scheduled post sent successfully")
+                logger.success(f"Scheduled post sent successfully to {chat_id}")
             
         except Exception as e:
-            logger.error(f"Error posting scheduled content: {e}")
+            logger.error(f"Error posting scheduled content to {chat_id}: {e}")
+    
+    async def get_content(self) -> str:
+        """Берет контент из пула, а если он пуст - генерирует на месте"""
+        if self.content_pool:
+            content = self.content_pool.take()
+            if content:
+                SCHEDULED_POSTS.inc(source="pool")
+                return content
+            logger.info("Content pool is empty, generating on demand")
+        
+        content = await self.chatgpt_client.generate_random_content()
+        SCHEDULED_POSTS.inc(source="generated")
+        if self.content_pool:
+            self.content_pool.mark_posted(content)
+        return content
+    
+    async def refill_content_pool(self):
+        """Плановая догенерация пула"""
+        if self.content_pool:
+            await self.content_pool.refill()
+            logger.info(f"Content pool refilled: {self.content_pool.stats()['sizes']}")
+    
+    def _restore_content_pool(self):
+        state_store = getattr(self.bot_instance, "state_store", None)
+        if state_store is None:
+            return
+        restored = self.content_pool.restore(state_store.load_meta_json("content_pool", {}))
+        state_store.add_meta_provider("content_pool", self.content_pool.snapshot)
+        self.content_pool.on_change = state_store.mark_meta_dirty
+        logger.info(f"Restored {restored} pooled posts")
     
     def schedule_posts(self, posts_config):
-        """Настраивает расписание постов"""
-        for post in posts_config:
-            hour = post["hour"]
-            minute = post["minute"]
-            
-            # Добавляем рандомный offset ±30 минут
-            offset = random.randint(-30, 30)
-            final_minute = minute + offset
-            
-            # Обрабатываем переполнение
-            if final_minute < 0:
-                final_minute += 60
-                hour -= 1
-            elif final_minute >= 60:
-                final_minute -= 60
-                hour += 1
-            
-            hour = max(0, min(23, hour))
-            final_minute = max(0, min(59, final_minute))
+        """Настраивает расписание постов: у каждого чата свои времена со сдвигом, новым каждый день"""
+        self.post_schedule = PostSchedule(
+            slots_from_config(posts_config),
+            jitter_minutes=POST_JITTER_MINUTES,
+            quiet_hours=parse_quiet_hours(POST_QUIET_HOURS),
+        )
+        self.post_schedule.sync(self._target_chat_ids())
+        SCHEDULED_CHATS.set_callback(lambda: len(self.post_schedule))
+        
+        next_fire = self.post_schedule.next_wakeup()
+        if next_fire is None:
+            SCHEDULER_SKIPS.inc(reason="no_chats")
+            logger.warning("No chats to schedule posts for yet")
+        else:
+            logger.info(f"Scheduled posts for {len(self.post_schedule)} chats, "
+                        f"next at {datetime.fromtimestamp(next_fire):%H:%M:%S}")
+        self._timer_task = asyncio.create_task(self._run_post_timer())
+    
+    async def _run_post_timer(self):
+        """Один таймер на все чаты: спит до ближайшего поста или до пересинхронизации списка чатов"""
+        schedule = self.post_schedule
+        next_sync = time.time() + POST_SCHEDULE_SYNC_INTERVAL
+        while True:
+            now = time.time()
+            if now >= next_sync:
+                try:
+                    added, removed = schedule.sync(self._target_chat_ids(), now)
+                    if added or removed:
+                        logger.info(f"Post schedule updated: +{added} -{removed} chats, {len(schedule)} total")
+                except Exception as e:
+                    logger.error(f"Error updating post schedule: {e}")
+                next_sync = now + POST_SCHEDULE_SYNC_INTERVAL
             
-            logger.info(f"Scheduling post at {hour:02d}:{final_minute:02d}")
+            for chat_id in schedule.due(now):
+                task = asyncio.create_task(self.post_to_chat(chat_id))
+                self._post_tasks.add(task)
+                task.add_done_callback(self._post_tasks.discard)
             
-            self.scheduler.add_job(
-                self.post_random_content,
-                CronTrigger(hour=hour, minute=final_minute),
-                id=f"post_{hour}_{final_minute}"
-            )
+            wakeup = schedule.next_wakeup()
+            deadline = next_sync if wakeup is None else min(wakeup, next_sync)
+            await asyncio.sleep(max(0.0, deadline - time.time()))
+    
+    def next_post_times(self) -> Dict:
+        """{чат: время следующего запланированного поста}"""
+        if self.post_schedule is None:
+            return {}
+        return {chat_id: datetime.fromtimestamp(fire_at)
+                for chat_id, fire_at in self.post_schedule.next_fire_times().items()}
+    
+    def stats(self) -> dict:
+        stats = self.post_schedule.stats() if self.post_schedule else {}
+        stats["posting"] = len(self._post_tasks)
+        return stats
     
     def start(self, posts_config):
         """Запускает планировщик"""
         self.schedule_posts(posts_config)
+        if self.content_pool:
+            # Пул не генерируется заново при каждом старте (и в каждом воркере): он переживает
+            # перезапуск в StateStore, а пустой пул дозаполняется при первом посте и каждую ночь
+            self._restore_content_pool()
+            self.scheduler.add_job(
+                self.refill_content_pool,
+                CronTrigger(hour=CONTENT_POOL_REFILL_HOUR, minute=0),
+                id="content_pool_refill"
+            )
         self.scheduler.start()
         logger.info("Scheduler started")
     
-    def shutdown(self):
-        """Останавливает планировщик"""
-        self.scheduler.shutdown()
-        logger.info("Scheduler stopped")
+    async def shutdown(self, timeout: float = 0) -> int:
+        """Останавливает планировщик и фоновую догенерацию пула
 
+        Новые посты больше не начинаются, начатые (генерация и постановка в очередь отправки)
+        доделываются не дольше timeout секунд. Возвращает, сколько постов пришлось отменить.
+        """
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        if self._timer_task is not None:
+            self._timer_task.cancel()
+            await asyncio.gather(self._timer_task, return_exceptions=True)
+        
+        cancelled = 0
+        if self._post_tasks:
+            _, pending = await asyncio.wait(set(self._post_tasks), timeout=max(0.0, timeout))
+            cancelled = len(pending)
+            if pending:
+                logger.warning(f"Cancelling {cancelled} scheduled posts still in progress")
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+        if self.content_pool:
+            await self.content_pool.stop()
+        logger.info("Scheduler stopped")
+        return cancelled
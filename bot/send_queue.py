@@ -0,0 +1,318 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Union
+from loguru import logger
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from bot.metrics import SEND_SECONDS, SEND_QUEUE_SECONDS, SEND_RESULTS, SEND_QUEUE_DEPTH, percentile
+
+
+# Приоритеты отправки: чем меньше число, тем раньше уходит сообщение
+PRIORITY_MENTION = 0
+PRIORITY_CONVERSATION = 1
+PRIORITY_SCHEDULED = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_MENTION: "mention",
+    PRIORITY_CONVERSATION: "conversation",
+    PRIORITY_SCHEDULED: "scheduled",
+}
+
+
+class TokenBucket:
+    """Token bucket: не более rate операций в секунду с всплесками до capacity"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0  # Запрет отправки после 429 от Telegram
+
+    def _refill(self, now: float):
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def delay(self, now: float) -> float:
+        """Сколько секунд ждать до появления токена (0 - можно отправлять)"""
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_idle(self, now: float) -> bool:
+        """Bucket полон и не заблокирован - его можно выбросить без потери информации"""
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+
+class _OutboundItem:
+    __slots__ = ("priority", "seq", "chat_id", "call", "future", "enqueued_at", "attempts", "idempotent", "max_retries")
+
+    def __init__(self, priority: int, seq: int, chat_id, call: Callable[[], Awaitable[Any]], future: asyncio.Future,
+                 idempotent: bool = True, max_retries: Optional[int] = None):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.call = call
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+        self.idempotent = idempotent  # Повтор после таймаута не создаст дубль (правка, а не новое сообщение)
+        self.max_retries = max_retries  # None - общий max_retries очереди
+
+    def __lt__(self, other: "_OutboundItem") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundDispatcher:
+    """Центральная очередь исходящих запросов к Bot API
+
+    Все отправки проходят через общий token bucket и token bucket своего чата,
+    упорядочены по приоритету (ответы на упоминания раньше запланированных постов),
+    а при 429 от Telegram чат блокируется на retry_after и запрос повторяется.
+
+    Сетевые ошибки повторяются с растущей паузой, но таймаут send_message не повторяется:
+    первый запрос мог дойти, и повтор задублировал бы сообщение. Отказы Telegram (BadRequest,
+    Forbidden) не исправятся повтором и сразу возвращаются вызывающему.
+    """
+
+    def __init__(self, global_rate: float = 25, chat_rate: float = 1, group_rate_per_minute: float = 20,
+                 chat_burst: int = 3, max_retries: int = 3, max_chat_buckets: int = 10000):
+        self.global_bucket = TokenBucket(global_rate, max(1.0, global_rate))
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate_per_minute / 60
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chat_buckets = max_chat_buckets
+
+        self._chat_buckets: "OrderedDict[Any, TokenBucket]" = OrderedDict()
+        self._ready: List[_OutboundItem] = []  # Куча готовых к отправке по (priority, seq)
+        self._delayed: List[Tuple[float, int, _OutboundItem]] = []  # Куча ожидающих лимита чата по времени
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: set = set()
+
+        # Метрики
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.rate_limited = 0
+        self.queue_latencies: Deque[float] = deque(maxlen=1000)  # От постановки в очередь до отправки
+        self.send_latencies: Deque[float] = deque(maxlen=1000)  # Длительность самого запроса к Bot API
+
+    def start(self):
+        """Запускает цикл отправки"""
+        if self._task is None or self._task.done():
+            SEND_QUEUE_DEPTH.set_callback(lambda: self.queue_depth)
+            self._task = asyncio.create_task(self._run(), name="outbound-dispatcher")
+            logger.info("Outbound dispatcher started")
+
+    async def stop(self, timeout: float = 5.0) -> int:
+        """Дожидается отправки очереди (не дольше timeout), останавливает цикл и возвращает число брошенных сообщений"""
+        deadline = time.monotonic() + timeout
+        while (self._ready or self._delayed or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        dropped = 0
+        for item in [*self._ready, *(entry[2] for entry in self._delayed)]:
+            if not item.future.done():
+                item.future.cancel()
+                dropped += 1
+        self._ready.clear()
+        self._delayed.clear()
+        if dropped:
+            logger.warning(f"Outbound dispatcher stopped, dropped {dropped} queued messages")
+        logger.info("Outbound dispatcher stopped")
+        return dropped
+
+    def submit(self, chat_id, call: Callable[[], Awaitable[Any]], priority: int = PRIORITY_CONVERSATION,
+               idempotent: bool = True, max_retries: Optional[int] = None) -> asyncio.Future:
+        """Ставит запрос в очередь и возвращает future с его результатом"""
+        future = asyncio.get_running_loop().create_future()
+        item = _OutboundItem(priority, next(self._seq), chat_id, call, future, idempotent, max_retries)
+        heapq.heappush(self._ready, item)
+        self._wakeup.set()
+        return future
+
+    async def send_message(self, bot, chat_id: Union[int, str], text: str,
+                           priority: int = PRIORITY_CONVERSATION, **kwargs):
+        """Отправляет сообщение через очередь и ждет результата"""
+        return await self.submit(
+            chat_id,
+            lambda: bot.send_message(chat_id=chat_id, text=text, **kwargs),
+            priority,
+            idempotent=False
+        )
+
+    async def edit_message_text(self, bot, chat_id: Union[int, str], message_id: int, text: str,
+                                priority: int = PRIORITY_CONVERSATION, max_retries: Optional[int] = None, **kwargs):
+        """Редактирует сообщение через очередь (правки считаются в те же лимиты чата)
+
+        max_retries=0 - для промежуточных правок, которые все равно перекроет следующая.
+        """
+        return await self.submit(
+            chat_id,
+            lambda: bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id, **kwargs),
+            priority,
+            max_retries=max_retries
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._ready) + len(self._delayed)
+
+    def stats(self) -> Dict[str, Any]:
+        """Снимок метрик очереди"""
+        depth_by_priority: Dict[str, int] = {name: 0 for name in PRIORITY_NAMES.values()}
+        for item in [*self._ready, *(entry[2] for entry in self._delayed)]:
+            depth_by_priority[PRIORITY_NAMES.get(item.priority, str(item.priority))] += 1
+        return {
+            "queue_depth": self.queue_depth,
+            "queue_depth_by_priority": depth_by_priority,
+            "in_flight": len(self._in_flight),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "rate_limited": self.rate_limited,
+            "queue_latency_p50": percentile(self.queue_latencies, 50),
+            "queue_latency_p95": percentile(self.queue_latencies, 95),
+            "send_latency_p50": percentile(self.send_latencies, 50),
+            "send_latency_p95": percentile(self.send_latencies, 95),
+        }
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Группы и каналы имеют отрицательные ID и более строгий лимит Telegram
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            bucket = TokenBucket(self.group_rate if is_group else self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+            self._prune_chat_buckets()
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    def _prune_chat_buckets(self):
+        """Выбрасывает самые старые полные buckets, чтобы словарь не рос бесконечно"""
+        now = time.monotonic()
+        while len(self._chat_buckets) > self.max_chat_buckets:
+            chat_id, bucket = next(iter(self._chat_buckets.items()))
+            if not bucket.is_idle(now):
+                break
+            del self._chat_buckets[chat_id]
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                heapq.heappush(self._ready, heapq.heappop(self._delayed)[2])
+
+            if not self._ready:
+                self._wakeup.clear()
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            item = heapq.heappop(self._ready)
+            if item.future.done():
+                continue
+
+            chat_bucket = self._chat_bucket(item.chat_id)
+            chat_delay = chat_bucket.delay(now)
+            if chat_delay > 0:
+                # Лимит чата не должен задерживать сообщения в другие чаты
+                heapq.heappush(self._delayed, (now + chat_delay, item.seq, item))
+                continue
+
+            global_delay = self.global_bucket.delay(now)
+            if global_delay > 0:
+                heapq.heappush(self._ready, item)
+                await asyncio.sleep(global_delay)
+                continue
+
+            chat_bucket.consume(now)
+            self.global_bucket.consume(now)
+            task = asyncio.create_task(self._send(item, chat_bucket))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, item: _OutboundItem, chat_bucket: TokenBucket):
+        started = time.monotonic()
+        item.attempts += 1
+        priority = PRIORITY_NAMES.get(item.priority, str(item.priority))
+        try:
+            result = await item.call()
+        except RetryAfter as e:
+            self.rate_limited += 1
+            SEND_RESULTS.inc(priority=priority, result="rate_limited")
+            retry_after = float(e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after)
+            chat_bucket.blocked_until = time.monotonic() + retry_after
+            logger.warning(f"Flood limit for chat {item.chat_id}, retry after {retry_after}s")
+            self._retry_or_fail(item, e, retry_after)
+        except (BadRequest, Forbidden) as e:
+            # BadRequest - подкласс NetworkError, но повтор его не исправит
+            self._fail(item, e, priority, "rejected")
+        except TimedOut as e:
+            if not item.idempotent:
+                self._fail(item, e, priority, "timed_out")
+            else:
+                SEND_RESULTS.inc(priority=priority, result="network_error")
+                self._retry_or_fail(item, e, min(2 ** item.attempts, 30))
+        except NetworkError as e:
+            SEND_RESULTS.inc(priority=priority, result="network_error")
+            self._retry_or_fail(item, e, min(2 ** item.attempts, 30))
+        except Exception as e:
+            self._fail(item, e, priority, "error")
+        else:
+            finished = time.monotonic()
+            self.sent += 1
+            self.send_latencies.append(finished - started)
+            self.queue_latencies.append(started - item.enqueued_at)
+            SEND_RESULTS.inc(priority=priority, result="sent")
+            SEND_SECONDS.observe(finished - started, priority=priority)
+            SEND_QUEUE_SECONDS.observe(started - item.enqueued_at, priority=priority)
+            if not item.future.done():
+                item.future.set_result(result)
+
+    def _fail(self, item: _OutboundItem, error: Exception, priority: str, result: str):
+        self.failed += 1
+        SEND_RESULTS.inc(priority=priority, result=result)
+        if not item.future.done():
+            item.future.set_exception(error)
+
+    def _retry_or_fail(self, item: _OutboundItem, error: Exception, delay: float):
+        max_retries = self.max_retries if item.max_retries is None else item.max_retries
+        if item.attempts > max_retries:
+            self.failed += 1
+            logger.error(f"Giving up sending to chat {item.chat_id} after {item.attempts} attempts: {error}")
+            if not item.future.done():
+                item.future.set_exception(error)
+            return
+        self.retried += 1
+        heapq.heappush(self._delayed, (time.monotonic() + delay, item.seq, item))
+        self._wakeup.set()
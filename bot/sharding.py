@@ -0,0 +1,50 @@
+import bisect
+import hashlib
+from typing import Dict, Iterable, List, Optional, Union
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class ConsistentHashRing:
+    """Консистентное хеширование чатов по воркерам
+
+    Каждый воркер занимает replicas точек на кольце; чат достается ближайшей точке
+    по часовой стрелке. При удалении воркера переезжают только его чаты, остальные
+    остаются на месте вместе со своим состоянием.
+    """
+
+    def __init__(self, nodes: Iterable[int] = (), replicas: int = 64):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, int] = {}
+        self.nodes: set = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: int):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for replica in range(self.replicas):
+            point = _hash(f"worker-{node}-{replica}")
+            self._owners[point] = node
+            bisect.insort(self._points, point)
+
+    def remove(self, node: int):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        self._points = [point for point in self._points if self._owners[point] != node]
+        self._owners = {point: owner for point, owner in self._owners.items() if owner != node}
+
+    def node_for(self, chat_id: Union[int, str]) -> Optional[int]:
+        """Воркер, которому принадлежит чат (None, если воркеров нет)"""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(str(chat_id)))
+        return self._owners[self._points[index % len(self._points)]]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
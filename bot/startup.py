@@ -0,0 +1,44 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+
+class StartupProfile:
+    """Этапы запуска: когда каждый начался (от импорта bot.main) и сколько длился
+
+    Независимые этапы идут параллельно, поэтому сумма длительностей может быть больше общего времени.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.phases: List[Tuple[str, float, float]] = []  # (этап, начало, длительность) в секундах
+        self.finished_at = 0.0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, started - self.origin, time.perf_counter() - started))
+
+    def finish(self) -> float:
+        """Отмечает конец запуска и возвращает его общую длительность"""
+        self.finished_at = time.perf_counter() - self.origin
+        return self.finished_at
+
+    def summary(self) -> Dict[str, float]:
+        """{этап: миллисекунды} для лога"""
+        return {name: round(duration * 1000, 1) for name, _, duration in self.phases}
+
+    def format(self) -> str:
+        """Таблица этапов по времени начала для --profile-startup"""
+        lines = [f"{'phase':<20}{'start ms':>10}{'duration ms':>13}"]
+        for name, start, duration in sorted(self.phases, key=lambda phase: phase[1]):
+            lines.append(f"{name:<20}{start * 1000:>10.1f}{duration * 1000:>13.1f}")
+        lines.append(f"{'total':<20}{'':>10}{self.finished_at * 1000:>13.1f}")
+        return "\n".join(lines)
+
+
+# Общий профиль процесса: этапы отмечают main, TelegramBotHandler и планировщик
+STARTUP = StartupProfile()
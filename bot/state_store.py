@@ -0,0 +1,233 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+from loguru import logger
+
+
+class StateStore:
+    """Локальное хранилище состояния чатов в SQLite (WAL) с отложенной записью
+
+    Обработчики только помечают чат как измененный. Раз в flush_interval секунд
+    снимки всех измененных чатов и последний обработанный update_id пишутся одной
+    транзакцией в отдельном потоке, поэтому event loop не ждет диск.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 2.0, retention: float = 7 * 24 * 3600,
+                 update_id_max_age: float = 24 * 3600):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.retention = retention
+        # Telegram хранит недоставленные обновления не дольше суток, а после недели без обновлений
+        # может начать update_id заново с меньшего числа: старый update_id ничего не отсекает
+        self.update_id_max_age = update_id_max_age
+        self._conn: Optional[sqlite3.Connection] = None
+        self._snapshot: Optional[Callable[[int], Optional[dict]]] = None
+        self._meta_providers: Dict[str, Callable[[], object]] = {}
+        self._dirty: Set[int] = set()
+        self._meta_dirty = False  # Изменилось состояние вне чатов, без нового update_id
+        self._last_update_id: Optional[int] = None
+        self._last_update_at: Optional[float] = None  # Когда update_id последний раз вырос
+        self._saved_update_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+        self._write_lock = asyncio.Lock()
+
+        # Метрики
+        self.flushes = 0
+        self.rows_written = 0
+        self.last_flush_seconds = 0.0
+
+    def open(self):
+        """Открывает базу и создает таблицы"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_state ("
+            "chat_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        logger.info(f"State store opened: {self.path}")
+
+    def set_snapshot_provider(self, snapshot: Callable[[int], Optional[dict]]):
+        """Функция, возвращающая снимок состояния чата (None - чат больше не отслеживается)"""
+        self._snapshot = snapshot
+
+    def add_meta_provider(self, key: str, provider: Callable[[], object]):
+        """Дополнительное состояние вне чатов, сохраняемое целиком при каждом flush"""
+        self._meta_providers[key] = provider
+
+    def load_meta_json(self, key: str, default=None):
+        value = self.get_meta(key)
+        if value is None:
+            return default
+        try:
+            return json.loads(value)
+        except ValueError:
+            logger.warning(f"Corrupted state for {key}, skipping")
+            return default
+
+    def load_chats(self, max_age: Optional[float] = None, limit: Optional[int] = None) -> Dict[int, dict]:
+        """Читает сохраненные состояния чатов, самые свежие первыми"""
+        query = "SELECT chat_id, data FROM chat_state"
+        params: Tuple = ()
+        if max_age is not None:
+            query += " WHERE updated_at >= ?"
+            params = (time.time() - max_age,)
+        query += " ORDER BY updated_at DESC"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+
+        chats: Dict[int, dict] = {}
+        for chat_id, data in self._conn.execute(query, params):
+            try:
+                chats[chat_id] = json.loads(data)
+            except ValueError:
+                logger.warning(f"Corrupted state for chat {chat_id}, skipping")
+        return chats
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def load_last_update_id(self) -> Optional[int]:
+        """Последний обработанный update_id; None, если его нет или он старше update_id_max_age"""
+        value = self.get_meta("last_update_id")
+        saved_at = self.get_meta("last_update_at")
+        self._saved_update_id = int(value) if value is not None else None
+        self._last_update_at = float(saved_at) if saved_at is not None else None
+        if self._saved_update_id is not None and not self._update_id_fresh(time.time()):
+            logger.info(f"Saved update_id {self._saved_update_id} is stale, not skipping updates by it")
+            self._saved_update_id = None
+            self._last_update_at = None
+        self._last_update_id = self._saved_update_id
+        return self._saved_update_id
+
+    def update_id_expires_at(self) -> Optional[float]:
+        """Unix-время, после которого загруженный update_id уже не отсекает повторы"""
+        if self._last_update_at is None:
+            return None
+        return self._last_update_at + self.update_id_max_age
+
+    def mark_dirty(self, chat_id: int):
+        """Помечает чат для записи при ближайшем flush"""
+        self._dirty.add(chat_id)
+
+    def mark_meta_dirty(self):
+        """Помечает состояние из add_meta_provider для записи при ближайшем flush"""
+        self._meta_dirty = True
+
+    def record_update_id(self, update_id: int):
+        """Запоминает update_id, до которого включительно все обновления обработаны
+
+        update_id только растет, пока прошлый не устарел: после этого принимается и меньший.
+        """
+        now = time.time()
+        if self._last_update_id is None or update_id > self._last_update_id or not self._update_id_fresh(now):
+            self._last_update_id = update_id
+            self._last_update_at = now
+
+    def _update_id_fresh(self, now: float) -> bool:
+        return self._last_update_at is not None and now - self._last_update_at < self.update_id_max_age
+
+    def start(self):
+        """Запускает фоновую запись"""
+        if self._task is None or self._task.done():
+            self._stop.clear()
+            self._task = asyncio.create_task(self._run(), name="state-store-flush")
+
+    async def close(self):
+        """Останавливает фоновую запись, сбрасывает остаток на диск и закрывает базу
+
+        Фоновый цикл не отменяется, а получает сигнал и выходит сам: начатая им запись в потоке
+        должна закончиться до последнего flush и закрытия соединения.
+        """
+        if self._task:
+            self._stop.set()
+            try:
+                await self._task
+            except Exception as e:
+                logger.error(f"State store flush loop failed: {e}")
+            self._task = None
+        if self._conn:
+            await self.flush()
+            self._conn.close()
+            self._conn = None
+            logger.info(f"State store closed ({self.flushes} flushes, {self.rows_written} rows written)")
+
+    async def flush(self):
+        """Пишет все измененные чаты одной транзакцией"""
+        if not self._dirty and not self._meta_dirty and self._last_update_id == self._saved_update_id:
+            return
+
+        # Снимки делаются в event loop, чтобы состояние не менялось во время записи
+        now = time.time()
+        dirty, self._dirty = self._dirty, set()
+        self._meta_dirty = False
+        rows = []
+        for chat_id in dirty:
+            snapshot = self._snapshot(chat_id) if self._snapshot else None
+            if snapshot is not None:
+                rows.append((chat_id, json.dumps(snapshot, ensure_ascii=False), now))
+        update_id = self._last_update_id
+        update_at = self._last_update_at
+        meta = [(key, json.dumps(provider(), ensure_ascii=False)) for key, provider in self._meta_providers.items()]
+
+        started = time.perf_counter()
+        async with self._write_lock:
+            write = asyncio.ensure_future(asyncio.to_thread(self._write, rows, update_id, update_at, meta, now))
+            try:
+                await asyncio.shield(write)
+            except asyncio.CancelledError:
+                # Поток не отменить: блокировку и соединение отпускаем только после его транзакции
+                await asyncio.wait({write})
+                if write.exception() is not None:
+                    self._dirty |= dirty
+                    self._meta_dirty = True
+                raise
+            except Exception as e:
+                # Не теряем изменения: вернем их в очередь на следующий flush
+                self._dirty |= dirty
+                self._meta_dirty = True
+                logger.error(f"Error flushing state store: {e}")
+                return
+        self._saved_update_id = update_id
+        self.flushes += 1
+        self.rows_written += len(rows)
+        self.last_flush_seconds = time.perf_counter() - started
+
+    def _write(self, rows: Iterable[tuple], update_id: Optional[int], update_at: Optional[float],
+               meta: Iterable[tuple], now: float):
+        conn = self._conn
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT INTO chat_state (chat_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(chat_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                rows
+            )
+            if update_id is not None:
+                meta = [*meta, ("last_update_id", str(update_id)), ("last_update_at", str(update_at))]
+            conn.executemany(
+                "INSERT INTO meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                meta
+            )
+            conn.execute("DELETE FROM chat_state WHERE updated_at < ?", (now - self.retention,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                await self.flush()
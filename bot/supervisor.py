@@ -0,0 +1,388 @@
+import asyncio
+import json
+import math
+import os
+import signal
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from loguru import logger
+
+from bot.metrics import SUPERVISOR_ROUTED, SUPERVISOR_DROPPED, WORKER_RESTARTS, MetricsServer
+from bot.sharding import ConsistentHashRing
+from bot.webhook import ALLOWED_UPDATES, WebhookServer, extract_chat_id
+
+# Без ID чата (редкие типы обновлений) все уходит одному воркеру
+_NO_CHAT = 0
+POLL_MAX_BACKOFF = 60  # Максимальная пауза (сек) между повторами getUpdates после ошибок
+
+
+def _with_suffix(path: str, suffix: str) -> str:
+    """data/state.db -> data/state.worker1.db (пустой путь остается пустым)"""
+    if not path:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{suffix}{ext}"
+
+
+def _update_chat_id(update: dict) -> Optional[int]:
+    for kind in ALLOWED_UPDATES:
+        message = update.get(kind)
+        if message is not None:
+            return message.get("chat", {}).get("id")
+    return None
+
+
+class WorkerProcess:
+    """Дочерний процесс bot.main в режиме UPDATE_MODE=stdin
+
+    Обновления копятся в ограниченной очереди и пишутся в stdin воркера по одному JSON
+    на строку отдельной задачей, чтобы медленный воркер не тормозил раздачу остальным.
+    """
+
+    def __init__(self, index: int, count: int, config, queue_size: int = 10000):
+        self.index = index
+        self.count = count
+        self.config = config
+        self.queue: "asyncio.Queue[Tuple[int, bytes]]" = asyncio.Queue(queue_size)
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self._writer: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.forwarded = 0
+        self.dropped = 0
+        self.restarts = 0
+        self.started_at = 0.0
+
+    def env(self) -> Dict[str, str]:
+        """Окружение воркера: свой номер, свои файлы и порт метрик, доля общих лимитов"""
+        env = dict(os.environ)
+        suffix = f"worker{self.index}"
+        env.update({
+            "WORKER_INDEX": str(self.index),
+            "WORKERS": str(self.count),
+            "UPDATE_MODE": "stdin",
+            "STATE_DB_PATH": _with_suffix(self.config.STATE_DB_PATH, suffix),
+            "RESPONSE_CACHE_DB_PATH": _with_suffix(self.config.RESPONSE_CACHE_DB_PATH, suffix),
+            "LOG_FILE": _with_suffix(self.config.LOG_FILE, suffix),
+            "RECORD_UPDATES_PATH": _with_suffix(self.config.RECORD_UPDATES_PATH, suffix),
+            "METRICS_PORT": str(self.config.METRICS_PORT + 1 + self.index),
+            # Лимиты Bot API и OpenAI действуют на весь бот, поэтому делятся между воркерами
+            "TELEGRAM_GLOBAL_RATE": str(self.config.TELEGRAM_GLOBAL_RATE / self.count),
+            "OPENAI_MAX_CONCURRENT_REQUESTS": str(math.ceil(self.config.OPENAI_MAX_CONCURRENT_REQUESTS / self.count)),
+        })
+        return env
+
+    async def start(self):
+        self.stop_writer()
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "bot.main", stdin=asyncio.subprocess.PIPE, env=self.env()
+        )
+        self.started_at = time.monotonic()
+        self._writer = asyncio.create_task(self._write_loop(), name=f"worker-{self.index}-writer")
+        logger.info(f"Worker {self.index} started (pid {self.process.pid})")
+
+    def stop_writer(self):
+        if self._writer:
+            self._writer.cancel()
+            self._writer = None
+
+    def send(self, chat_id: int, line: bytes) -> bool:
+        """Ставит обновление в очередь воркера (False, если очередь переполнена)"""
+        try:
+            self.queue.put_nowait((chat_id, line))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    def take_pending(self) -> List[Tuple[int, bytes]]:
+        """Забирает неотправленные обновления (для передачи другим воркерам)"""
+        pending = []
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+            self.queue.task_done()
+        return pending
+
+    async def _write_loop(self):
+        stdin = self.process.stdin
+        try:
+            while True:
+                chat_id, line = await self.queue.get()
+                try:
+                    stdin.write(line)
+                    await stdin.drain()
+                    self.forwarded += 1
+                finally:
+                    self.queue.task_done()
+        except (BrokenPipeError, ConnectionResetError):
+            # Воркер упал; недописанное обновление потеряно, остальные в очереди раздаст супервизор
+            pass
+
+    def send_control(self, payload: dict):
+        """Служебное сообщение воркеру в обход очереди обновлений (строка пишется целиком, не разрывая соседние)"""
+        if self.process is None or self.process.returncode is not None:
+            return
+        try:
+            self.process.stdin.write(json.dumps(payload, separators=(",", ":")).encode() + b"\n")
+        except (BrokenPipeError, ConnectionResetError, RuntimeError):
+            pass
+
+    async def wait(self) -> int:
+        return await self.process.wait()
+
+    async def stop(self, timeout: float = 30):
+        """Дописывает очередь в stdin и закрывает его: воркер сам доделывает начатое и завершается
+
+        Все это не дольше timeout секунд, затем SIGTERM и SIGKILL. Возвращает число брошенных обновлений.
+        """
+        if self.process is None or self.process.returncode is not None:
+            self.stop_writer()
+            return len(self.take_pending())
+        deadline = time.monotonic() + timeout
+        try:
+            await asyncio.wait_for(self.queue.join(), min(5.0, timeout / 2))
+        except asyncio.TimeoutError:
+            pass
+        self.stop_writer()
+        dropped = len(self.take_pending())
+        try:
+            self.process.stdin.close()
+        except Exception:
+            pass
+        try:
+            await asyncio.wait_for(self.process.wait(), max(0.0, deadline - time.monotonic()))
+            return dropped
+        except asyncio.TimeoutError:
+            logger.warning(f"Worker {self.index} did not exit after EOF, sending SIGTERM")
+        self.process.send_signal(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(self.process.wait(), 5)
+        except asyncio.TimeoutError:
+            logger.error(f"Worker {self.index} did not stop, killing")
+            self.process.kill()
+            await self.process.wait()
+        return dropped
+
+    def stats(self) -> dict:
+        return {
+            "pid": self.process.pid if self.process else None,
+            "alive": self.process is not None and self.process.returncode is None,
+            "queued": self.queue.qsize(),
+            "forwarded": self.forwarded,
+            "dropped": self.dropped,
+            "restarts": self.restarts,
+        }
+
+
+class Supervisor:
+    """Один процесс получает обновления и раздает их WORKERS воркерам
+
+    Чат закреплен за воркером консистентным хешем, поэтому его состояние живет в одном
+    процессе. Если воркер падает, он убирается с кольца (его чаты переходят к соседям,
+    туда же уходят неотправленные обновления) и перезапускается с растущей паузой.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.workers = [WorkerProcess(index, config.WORKERS, config, config.WORKER_QUEUE_SIZE)
+                        for index in range(config.WORKERS)]
+        self.ring = ConsistentHashRing()
+        self.webhook_server: Optional[WebhookServer] = None
+        self.metrics_server: Optional[MetricsServer] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stop_event = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+
+        # Метрики
+        self.routed = 0
+        self.rebalanced = 0
+        self.unroutable = 0
+
+    @property
+    def api_url(self) -> str:
+        return (self.config.TELEGRAM_API_BASE_URL or "https://api.telegram.org/bot") + self.config.BOT_TOKEN
+
+    def route(self, chat_id: Optional[int], line: bytes) -> bool:
+        """Отправляет обновление воркеру, владеющему чатом"""
+        node = self.ring.node_for(chat_id if chat_id is not None else _NO_CHAT)
+        if node is None:
+            self.unroutable += 1
+            SUPERVISOR_DROPPED.inc(reason="no_workers")
+            return False
+        if not self.workers[node].send(chat_id, line):
+            SUPERVISOR_DROPPED.inc(reason="queue_full")
+            return False
+        self.routed += 1
+        SUPERVISOR_ROUTED.inc(worker=str(node))
+        return True
+
+    def _broadcast_ring(self):
+        """Сообщает живым воркерам состав кольца: по нему они выбирают свои чаты для запланированных постов"""
+        nodes = sorted(self.ring.nodes)
+        for node in nodes:
+            self.workers[node].send_control({"ring": nodes})
+
+    async def _route_raw(self, body: bytes):
+        # В JSON перевод строки вне строковых значений - только форматирование
+        self.route(extract_chat_id(body), body.replace(b"\n", b"") + b"\n")
+
+    async def start(self):
+        if self.config.METRICS_ENABLED:
+            self.metrics_server = MetricsServer(self.config.METRICS_HOST, self.config.METRICS_PORT)
+            await self.metrics_server.start()
+
+        await asyncio.gather(*(worker.start() for worker in self.workers))
+        for worker in self.workers:
+            self.ring.add(worker.index)
+            self._tasks.append(asyncio.create_task(self._watch(worker), name=f"worker-{worker.index}-watch"))
+
+        if self.config.UPDATE_MODE == "webhook":
+            await self._start_webhook()
+        else:
+            self._tasks.append(asyncio.create_task(self._poll(), name="supervisor-polling"))
+        logger.info(f"Supervisor started with {len(self.workers)} workers ({self.config.UPDATE_MODE})")
+
+    async def _start_webhook(self):
+        self.webhook_server = WebhookServer(
+            None,
+            host=self.config.WEBHOOK_LISTEN,
+            port=self.config.WEBHOOK_PORT,
+            path=self.config.WEBHOOK_PATH,
+            secret_token=self.config.WEBHOOK_SECRET_TOKEN,
+            max_body_size=self.config.WEBHOOK_MAX_BODY_SIZE,
+            raw_sink=self._route_raw,
+        )
+        await self.webhook_server.start()
+        if self.config.WEBHOOK_URL:
+            params = {
+                "url": self.config.WEBHOOK_URL.rstrip("/") + self.config.WEBHOOK_PATH,
+                "allowed_updates": ALLOWED_UPDATES,
+                "max_connections": self.config.WEBHOOK_MAX_CONNECTIONS,
+            }
+            if self.config.WEBHOOK_SECRET_TOKEN:
+                params["secret_token"] = self.config.WEBHOOK_SECRET_TOKEN
+            async with httpx.AsyncClient(timeout=30) as client:
+                response = await client.post(f"{self.api_url}/setWebhook", json=params)
+            # Как в _poll: raise_for_status включил бы в текст ошибки URL с токеном бота
+            try:
+                data = response.json()
+            except ValueError:
+                data = {}
+            if response.status_code != 200 or not data.get("ok"):
+                description = data.get("description", "")
+                raise RuntimeError(f"setWebhook failed with {response.status_code}: {description}")
+            logger.info("Supervisor webhook registered")
+
+    async def _poll(self):
+        """Long polling getUpdates без разбора обновлений в объекты PTB"""
+        offset: Optional[int] = None
+        timeout = 30
+        delay = 1.0  # Пауза после ошибки, растет до POLL_MAX_BACKOFF
+        async with httpx.AsyncClient(timeout=timeout + 10) as client:
+            while True:
+                params = {"timeout": timeout, "allowed_updates": ALLOWED_UPDATES}
+                if offset is not None:
+                    params["offset"] = offset
+                try:
+                    response = await client.post(f"{self.api_url}/getUpdates", json=params)
+                    data = response.json()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Supervisor polling error: {e}")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, POLL_MAX_BACKOFF)
+                    continue
+
+                if response.status_code != 200 or not data.get("ok"):
+                    description = data.get("description", "")
+                    if response.status_code == 401:
+                        logger.critical(f"getUpdates rejected the bot token ({description}), stopping supervisor")
+                        self._stop_event.set()
+                        return
+                    if response.status_code == 409:
+                        logger.error(f"getUpdates conflict: a webhook is set or another poller is running ({description})")
+                    else:
+                        logger.error(f"getUpdates failed with {response.status_code}: {description}")
+                    retry_after = (data.get("parameters") or {}).get("retry_after")
+                    await asyncio.sleep(max(delay, retry_after or 0))
+                    delay = min(delay * 2, POLL_MAX_BACKOFF)
+                    continue
+
+                delay = 1.0
+                for update in data.get("result", []):
+                    offset = update["update_id"] + 1
+                    line = json.dumps(update, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+                    self.route(_update_chat_id(update), line)
+
+    async def _watch(self, worker: WorkerProcess):
+        """Перезапускает упавший воркер, пока его чаты обслуживают остальные"""
+        delay = 1.0
+        while True:
+            code = await worker.wait()
+            if self._stopping:
+                return
+            self.ring.remove(worker.index)
+            self._broadcast_ring()
+            worker.stop_writer()
+            pending = worker.take_pending()
+            logger.error(f"Worker {worker.index} exited with code {code}, "
+                         f"rebalancing its chats and {len(pending)} queued updates")
+            for chat_id, line in pending:
+                self.route(chat_id, line)
+            self.rebalanced += len(pending)
+
+            # Воркер, проработавший долго, перезапускаем сразу, падающий на старте - все реже
+            if time.monotonic() - worker.started_at > self.config.WORKER_RESTART_MAX_DELAY:
+                delay = 1.0
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.config.WORKER_RESTART_MAX_DELAY)
+            if self._stopping:
+                return
+            worker.restarts += 1
+            WORKER_RESTARTS.inc(worker=str(worker.index))
+            await worker.start()
+            self.ring.add(worker.index)
+            self._broadcast_ring()
+
+    def request_stop(self):
+        """Можно вызывать из обработчика сигнала"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        await self.start()
+        await self._stop_event.wait()
+        await self.stop()
+
+    async def stop(self):
+        """Прекращает прием обновлений, отдает воркерам уже принятые и ждет, пока они доделают свои"""
+        logger.info("Stopping supervisor...")
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.webhook_server:
+            await self.webhook_server.stop()
+        # Воркеру нужно SHUTDOWN_DRAIN_TIMEOUT на собственную остановку, плюс запас на дописывание очереди
+        timeout = self.config.SHUTDOWN_DRAIN_TIMEOUT + 10
+        dropped = await asyncio.gather(*(worker.stop(timeout) for worker in self.workers))
+        if any(dropped):
+            SUPERVISOR_DROPPED.inc(sum(dropped), reason="shutdown")
+            logger.warning(f"Supervisor dropped {sum(dropped)} queued updates on shutdown")
+        logger.info(f"Supervisor stats: {self.stats()}")
+        if self.metrics_server:
+            await self.metrics_server.stop()
+
+    def stats(self) -> dict:
+        return {
+            "routed": self.routed,
+            "rebalanced": self.rebalanced,
+            "unroutable": self.unroutable,
+            "workers": {worker.index: worker.stats() for worker in self.workers},
+        }
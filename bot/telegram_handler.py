@@ -1,35 +1,124 @@
 import time
 import asyncio
-from typing import List, Optional
+import json
+import os
+import signal
+import sys
+import zlib
+from typing import Dict, List, Optional, Set, Union
 from loguru import logger
-from telegram import Update, Message
+from telegram import Update, Message, Chat
 from telegram.ext import Application, ContextTypes, MessageHandler, filters
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, TelegramError
 
 from bot.chatgpt_client import ChatGPTClient
-from bot.channel_monitor import ChannelMonitor
+from bot.chat_state import ChatState, ChatStateRegistry
+from bot.channel_monitor import ActivitySettings
+from bot.update_processor import PerChatUpdateProcessor
+from bot.state_store import StateStore
+from bot.cooldown import CooldownTracker
+from bot.update_filter import UpdateFilter
+from bot.update_recorder import UpdateRecorder
+from bot.mention import MentionDetector
+from bot.sharding import ConsistentHashRing
+from bot.comment_batcher import CommentBatcher
+from bot.webhook import WebhookServer, ALLOWED_UPDATES, make_chat_prefilter
+from bot.metrics import UPDATES_RECEIVED, UPDATES_FILTERED, UPDATE_HANDLER_SECONDS, COOLDOWN_HITS
+from bot.logging_setup import log_sampler
+from bot.startup import STARTUP
+from bot.send_queue import OutboundDispatcher, PRIORITY_MENTION, PRIORITY_CONVERSATION, PRIORITY_SCHEDULED
 from bot.config import MESSAGE_THRESHOLD_MIN, MESSAGE_THRESHOLD_MAX
 
 
 class TelegramBotHandler:
     """Главный обработчик Telegram бота"""
     
-    def __init__(self, config):
+    def __init__(self, config, chatgpt_client: Optional[ChatGPTClient] = None):
         self.config = config
         self.application = None
-        self.chatgpt_client = ChatGPTClient()
-        self.monitor = ChannelMonitor(activity_timeout=config.ACTIVITY_TIMEOUT)
+        # Один клиент OpenAI на процесс: его же берут планировщик и пакетные комментарии
+        self.chatgpt_client = chatgpt_client or ChatGPTClient()
+        # Комментарии из разных чатов, совпавшие по времени, генерируются одним запросом
+        self.comment_batcher: Optional[CommentBatcher] = None
+        if config.COMMENT_BATCHING_ENABLED:
+            self.comment_batcher = CommentBatcher(
+                self.chatgpt_client,
+                max_batch=config.COMMENT_BATCH_MAX_SIZE,
+                max_wait=config.COMMENT_BATCH_MAX_WAIT,
+            )
         self.bot_id = None
         self.bot_username = None
+        self.mention_detector: Optional[MentionDetector] = None
         self.channel_id = None
         
-        # История последних сообщений для контекста
-        self.recent_messages: List[str] = []
-        self.max_context_messages = 3
+        # Состояние каждого чата (мониторинг, контекст) хранится отдельно
+        self.chats = ChatStateRegistry(
+            activity_timeout=config.ACTIVITY_TIMEOUT,
+            threshold_min=MESSAGE_THRESHOLD_MIN,
+            threshold_max=MESSAGE_THRESHOLD_MAX,
+            max_context_messages=config.MAX_CONTEXT_MESSAGES,
+            idle_timeout=config.CHAT_IDLE_TIMEOUT,
+            max_chats=config.MAX_TRACKED_CHATS,
+            activity=ActivitySettings(
+                window=config.ACTIVITY_WINDOW,
+                bucket=config.ACTIVITY_BUCKET,
+                ewma_tau=config.ACTIVITY_EWMA_TAU,
+                min_rate=config.CONVERSATION_MIN_RATE,
+                min_participants=config.CONVERSATION_MIN_PARTICIPANTS,
+                min_interval=config.COMMENT_MIN_INTERVAL,
+                quiet_factor=config.QUIET_GAP_FACTOR,
+                quiet_min=config.QUIET_MIN_SECONDS,
+            ),
+        )
+        
+        # Разрешенные чаты: числовые ID и @username (для каналов, заданных по имени)
+        self.allow_all_chats = config.ALLOW_ALL_CHATS
+        self.allowed_chat_ids: Set[int] = set()
+        self.allowed_chat_usernames: Set[str] = set()
+        self.username_chat_ids: Dict[str, int] = {}  # {username: chat_id}, заполняется по мере получения сообщений
+        
+        self.webhook_server: Optional[WebhookServer] = None
+        self._stdin_task: Optional[asyncio.Task] = None
+        
+        # Воркер супервизора отвечает только за свои чаты (то же кольцо, что у супервизора)
+        self.worker_ring: Optional[ConsistentHashRing] = None
+        if config.WORKER_INDEX >= 0:
+            self.worker_ring = ConsistentHashRing(range(config.WORKERS))
+        
+        # Состояние чатов и последний update_id переживают перезапуск
+        self.state_store: Optional[StateStore] = None
+        if config.STATE_DB_PATH:
+            self.state_store = StateStore(
+                config.STATE_DB_PATH,
+                flush_interval=config.STATE_FLUSH_INTERVAL,
+                retention=config.STATE_RETENTION,
+                update_id_max_age=config.STATE_UPDATE_ID_MAX_AGE,
+            )
+        self.resume_update_id: Optional[int] = None  # Обновления с ID не больше этого уже обработаны
+        self.resume_until: Optional[float] = None  # До какого unix-времени resume_update_id отсекает повторы
+        
+        # Журнал входящих обновлений для воспроизведения нагрузки (bench.replay), по умолчанию выключен
+        self.update_recorder: Optional[UpdateRecorder] = None
+        if config.RECORD_UPDATES_PATH:
+            self.update_recorder = UpdateRecorder(
+                config.RECORD_UPDATES_PATH,
+                flush_interval=config.RECORD_UPDATES_FLUSH_INTERVAL,
+                max_bytes=config.RECORD_UPDATES_MAX_MB * 1024 * 1024,
+            )
+        
+        # Для защиты от спама: кулдаун на пользователя в чате и (опционально) на весь чат
+        self.mention_cooldowns = CooldownTracker(config.MENTION_COOLDOWN, max_entries=config.COOLDOWN_MAX_ENTRIES)
+        self.mention_chat_cooldowns = CooldownTracker(config.MENTION_CHAT_COOLDOWN, max_entries=config.COOLDOWN_MAX_ENTRIES)
         
-        # Для защиты от спама - последнее время ответа на упоминание
-        self.last_mention_responses = {}  # {user_id: timestamp}
-        self.mention_cooldown = 30  # секунд между ответами одному пользователю
+        # Все исходящие сообщения идут через общую очередь с лимитами Telegram
+        self.sender = OutboundDispatcher(
+            global_rate=config.TELEGRAM_GLOBAL_RATE,
+            chat_rate=config.TELEGRAM_CHAT_RATE,
+            group_rate_per_minute=config.TELEGRAM_GROUP_RATE_PER_MINUTE,
+            chat_burst=config.TELEGRAM_CHAT_BURST,
+            max_retries=config.SEND_MAX_RETRIES,
+        )
         
     async def initialize(self):
         """Инициализация бота"""
@@ -45,179 +134,361 @@ class TelegramBotHandler:
             raise ValueError(error_msg)
         
         logger.info("Создание приложения Telegram...")
-        self.application = Application.builder().token(self.config.BOT_TOKEN).build()
+        builder = Application.builder().token(self.config.BOT_TOKEN)
+        if self.config.TELEGRAM_API_BASE_URL:
+            builder = builder.base_url(self.config.TELEGRAM_API_BASE_URL)
+        # Свой процессор и при одном воркере: при остановке он считает и отменяет недоделанные обновления
+        builder = builder.concurrent_updates(PerChatUpdateProcessor(self.config.UPDATE_WORKERS))
+        self.application = builder.build()
         self.channel_id = self.config.CHANNEL_ID
+        self._build_chat_allowlist()
+        self.sender.start()
         
-        # Получаем информацию о боте
-        try:
-            logger.info("Проверка токена бота...")
-            bot_info = await self.application.bot.get_me()
-            self.bot_id = bot_info.id
-            self.bot_username = bot_info.username
-            self.monitor.set_bot_id(self.bot_id)
-            
-            logger.info(f"Bot initialized: @{bot_info.username} (ID: {self.bot_id})")
-            logger.info(f"Channel ID: {self.channel_id}")
-        except Exception as e:
-            error_msg = f"Ошибка авторизации бота: {e}\n"
-            error_msg += "Проверьте:\n"
-            error_msg += "1. TELEGRAM_BOT_TOKEN установлен в переменных окружения Railway\n"
-            error_msg += "2. Токен правильный и не истек\n"
-            error_msg += "3. Токен принадлежит боту, который не был удален"
-            logger.error(error_msg)
-            raise
+        # Независимые шаги идут одновременно: getMe ждет сеть, а SQLite читается в потоках
+        await asyncio.gather(self._connect_bot(), self._restore_state(), self._open_response_cache())
+        # После загрузки состояния: восстановленные чаты тоже должны знать ID бота
+        self.chats.set_bot_id(self.bot_id)
+        if self.update_recorder is not None:
+            # Пишется все, что пришло от Telegram, в момент поступления (до фильтра и очереди чата)
+            self.update_recorder.start(self.bot_id, self.bot_username)
+            self.application.update_processor.recorder = self.update_recorder
+        if self.state_store:
+            # Сохраняется непрерывно законченный префикс update_id, а не наибольший законченный:
+            # иначе обновления, не доделанные до падения, после перезапуска отбросились бы как повторы
+            self.application.update_processor.on_watermark = self.state_store.record_update_id
         
         # Регистрируем обработчик через application для всех типов обновлений
         # Обработчик поддерживает и каналы и группы
+        # Лишние обновления (чужие чаты, личка, свои сообщения, медиа без текста, повторы
+        # после перезапуска) отбрасываются в check_update, еще до обработчика
+        self.update_filter = UpdateFilter(
+            allowed_chat_ids=self.allowed_chat_ids,
+            allowed_usernames=self.allowed_chat_usernames,
+            allow_all=self.allow_all_chats,
+            bot_id=self.bot_id,
+            resume_update_id=self.resume_update_id,
+            resume_until=self.resume_until,
+            resolved_usernames=self.username_chat_ids,
+        )
+        UPDATES_FILTERED.set_callback(self.update_filter.drop_counts)
+        
         async def all_updates_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-            # Логируем ВСЕ обновления
             has_channel_post = update.channel_post is not None
             has_edited = update.edited_channel_post is not None
             has_message = update.message is not None
             has_edited_message = update.edited_message is not None
             
-            logger.info(f"ALL UPDATES: channel_post={has_channel_post}, message={has_message}, edited={has_edited}, edited_msg={has_edited_message}")
+            # Строка на каждое обновление - пишем только выборочно
+            if log_sampler.allow("update_received"):
+                logger.debug("ALL UPDATES: channel_post={}, message={}, edited={}, edited_msg={}",
+                             has_channel_post, has_message, has_edited, has_edited_message)
             
-            # Обрабатываем сообщения из группы
-            if update.message and update.message.chat.type in ['group', 'supergroup']:
-                logger.info(f"Processing message from group: {update.message.chat.id}")
-                await self.handle_channel_message(update, context)
-            # Обрабатываем сообщения из канала
-            elif update.channel_post:
-                logger.info(f"Processing channel_post from chat: {update.channel_post.chat.id}")
-                await self.handle_channel_message(update, context)
-            elif update.edited_message and update.edited_message.chat.type in ['group', 'supergroup']:
-                logger.info(f"Processing edited message from group")
-                update.message = update.edited_message
-                await self.handle_channel_message(update, context)
-            elif update.edited_channel_post:
-                logger.info(f"Processing edited_channel_post")
-                update.channel_post = update.edited_channel_post
+            if has_message:
+                UPDATES_RECEIVED.inc(type="message")
+            elif has_channel_post:
+                UPDATES_RECEIVED.inc(type="channel_post")
+            elif has_edited_message:
+                UPDATES_RECEIVED.inc(type="edited_message")
+            elif has_edited:
+                UPDATES_RECEIVED.inc(type="edited_channel_post")
+            else:
+                UPDATES_RECEIVED.inc(type="other")
+            
+            # Сюда доходят только сообщения с текстом из разрешенных групп и каналов (см. UpdateFilter);
+            # отредактированные обрабатываются как обычные через update.effective_message
+            with UPDATE_HANDLER_SECONDS.time():
                 await self.handle_channel_message(update, context)
         
         # Используем BaseHandler для обработки всех обновлений  
         from telegram.ext import BaseHandler
         
         class AllUpdatesHandler(BaseHandler):
-            def __init__(self, callback):
+            def __init__(self, callback, update_filter: UpdateFilter):
                 super().__init__(callback)
+                self.update_filter = update_filter
             
             def check_update(self, update):
-                return True
+                return isinstance(update, Update) and self.update_filter.check(update)
         
-        self.application.add_handler(AllUpdatesHandler(all_updates_handler))
+        self.application.add_handler(AllUpdatesHandler(all_updates_handler, self.update_filter))
+    
+    async def _connect_bot(self):
+        """Проверяет токен (getMe внутри Application.initialize) и запоминает, кто мы"""
+        try:
+            logger.info("Проверка токена бота...")
+            with STARTUP.phase("telegram_get_me"):
+                await self.application.initialize()
+            bot_info = self.application.bot.bot
+            self.bot_id = bot_info.id
+            self.bot_username = bot_info.username
+            self.mention_detector = MentionDetector(self.bot_id, self.bot_username, self.config.BOT_ALIASES)
+            
+            logger.info(f"Bot initialized: @{bot_info.username} (ID: {self.bot_id})")
+            logger.info(f"Channel ID: {self.channel_id}")
+            if self.allow_all_chats:
+                logger.info("Allowed chats: all")
+            else:
+                logger.info(f"Allowed chats: {sorted(self.allowed_chat_ids)} {sorted(self.allowed_chat_usernames)}")
+        except Exception as e:
+            error_msg = f"Ошибка авторизации бота: {e}\n"
+            error_msg += "Проверьте:\n"
+            error_msg += "1. TELEGRAM_BOT_TOKEN установлен в переменных окружения Railway\n"
+            error_msg += "2. Токен правильный и не истек\n"
+            error_msg += "3. Токен принадлежит боту, который не был удален"
+            logger.error(error_msg)
+            raise
+    
+    async def _restore_state(self):
+        """Загружает состояние чатов из локального хранилища (теплый старт)"""
+        if not self.state_store:
+            return
+        started = time.perf_counter()
+        try:
+            with STARTUP.phase("state_restore"):
+                restored = await asyncio.to_thread(self._load_state)
+        except Exception as e:
+            logger.error(f"Error restoring state, starting cold: {e}")
+            self.state_store = None
+            return
+        self.state_store.set_snapshot_provider(self.chats.snapshot)
+        self.state_store.add_meta_provider("mention_cooldowns", self.mention_cooldowns.snapshot)
+        self.state_store.add_meta_provider("mention_chat_cooldowns", self.mention_chat_cooldowns.snapshot)
+        self.state_store.start()
+        logger.info(f"Restored {restored} chat states, last update_id {self.resume_update_id} "
+                    f"({(time.perf_counter() - started) * 1000:.1f} ms)")
+    
+    def _load_state(self) -> int:
+        """Чтение SQLite для _restore_state (в потоке, пока обработчики еще не запущены)"""
+        self.state_store.open()
+        snapshots = self.state_store.load_chats(max_age=self.config.CHAT_IDLE_TIMEOUT, limit=self.config.MAX_TRACKED_CHATS)
+        restored = self.chats.restore(snapshots)
+        self.resume_update_id = self.state_store.load_last_update_id()
+        self.resume_until = self.state_store.update_id_expires_at()
+        self.mention_cooldowns.restore(self.state_store.load_meta_json("mention_cooldowns", []))
+        self.mention_chat_cooldowns.restore(self.state_store.load_meta_json("mention_chat_cooldowns", []))
+        return restored
+    
+    async def _open_response_cache(self):
+        """Загружает дисковый уровень кэша ответов, если он настроен"""
+        cache = self.chatgpt_client.response_cache
+        if cache is None:
+            return
+        try:
+            with STARTUP.phase("response_cache"):
+                await asyncio.to_thread(cache.open)
+        except Exception as e:
+            logger.error(f"Error opening response cache disk tier, using memory only: {e}")
+            return
+        cache.start()
+    
+    def _mark_dirty(self, chat_id: int):
+        if self.state_store:
+            self.state_store.mark_dirty(chat_id)
+    
+    def _build_chat_allowlist(self):
+        """Разбирает TELEGRAM_CHANNEL_ID и TELEGRAM_CHAT_IDS в множества ID и username"""
+        for raw in [self.config.CHANNEL_ID, *self.config.CHAT_IDS]:
+            if not raw:
+                continue
+            raw = str(raw).strip()
+            try:
+                self.allowed_chat_ids.add(int(raw))
+            except ValueError:
+                self.allowed_chat_usernames.add(raw.lstrip("@").lower())
+    
+    def is_chat_allowed(self, chat: Chat) -> bool:
+        """Проверяет, должен ли бот работать в этом чате"""
+        if self.allow_all_chats or chat.id in self.allowed_chat_ids:
+            return True
+        if chat.username and chat.username.lower() in self.allowed_chat_usernames:
+            self.username_chat_ids[chat.username.lower()] = chat.id
+            return True
+        return False
+    
+    def resolve_chat_id(self, chat_id: Union[int, str]) -> Optional[int]:
+        """Переводит ID или @username чата в числовой ID (если он уже известен)"""
+        try:
+            return int(chat_id)
+        except (TypeError, ValueError):
+            return self.username_chat_ids.get(str(chat_id).lstrip("@").lower())
+    
+    def is_chat_active(self, chat_id: Union[int, str]) -> bool:
+        """Проверяет, идет ли сейчас обсуждение в чате"""
+        resolved = self.resolve_chat_id(chat_id)
+        state = self.chats.get(resolved) if resolved is not None else None
+        return state is not None and state.monitor.is_channel_active()
+    
+    def get_target_chat_ids(self) -> List[Union[int, str]]:
+        """Возвращает чаты для запланированных постов"""
+        targets: List[Union[int, str]] = sorted(self.allowed_chat_ids)
+        for username in sorted(self.allowed_chat_usernames):
+            targets.append(self.username_chat_ids.get(username, f"@{username}"))
+        if self.allow_all_chats:
+            known = set(targets)
+            targets.extend(state.chat_id for state in self.chats if state.chat_id not in known)
+        if self.worker_ring is not None:
+            targets = [chat_id for chat_id in targets if self.worker_ring.node_for(chat_id) == self.config.WORKER_INDEX]
+        return targets
     
     def is_bot_mentioned(self, message: Message) -> bool:
         """Проверяет, обращается ли пользователь к боту"""
-        if not message.text:
-            return False
-        
-        # Проверяем, не от бота ли сообщение
-        if message.from_user and message.from_user.id == self.bot_id:
-            return False
-        
-        text_lower = message.text.lower()
-        
-        # Проверяем упоминание через @username
-        if self.bot_username:
-            bot_mentions = [
-                f"@{self.bot_username}",
-                f"@{self.bot_username.lower()}",
-                f"@{(self.bot_username.lower())}",
-            ]
-            for mention in bot_mentions:
-                if mention in text_lower:
-                    logger.info(f"Bot mentioned via @username: {mention}")
-                    return True
-        
-        # Проверяем, является ли это ответом на сообщение бота
-        if message.reply_to_message:
-            reply_to = message.reply_to_message
-            # Проверяем, что ответ на сообщение от бота
-            if reply_to.from_user and reply_to.from_user.id == self.bot_id:
-                logger.info("Bot mentioned via reply to bot's message")
-                return True
-        
-        # Проверяем упоминание в entities (если есть)
-        if message.entities:
-            for entity in message.entities:
-                if entity.type == "mention" and self.bot_username:
-                    mention_text = message.text[entity.offset:entity.offset + entity.length].lower()
-                    if f"@{self.bot_username.lower()}" in mention_text:
-                        logger.info("Bot mentioned via entity")
-                        return True
-        
-        return False
+        if self.mention_detector is None:
+            self.mention_detector = MentionDetector(self.bot_id, self.bot_username, self.config.BOT_ALIASES)
+        return self.mention_detector.is_mentioned(message)
     
-    async def respond_to_mention(self, update: Update, message: Message):
+    async def respond_to_mention(self, update: Update, message: Message, state: Optional[ChatState] = None):
         """Отвечает на обращение к боту"""
+        user_key = None
         try:
+            if state is None:
+                state = self.chats.get_or_create(message.chat.id)
+            
             # Получаем информацию о пользователе
             user_id = message.from_user.id if message.from_user else None
             username = message.from_user.username if message.from_user and message.from_user.username else "пользователь"
             first_name = message.from_user.first_name if message.from_user and message.from_user.first_name else "пользователь"
             display_name = f"@{username}" if username != "пользователь" else first_name
             
-            # Проверка на спам - не отвечаем слишком часто одному пользователю
-            current_time = time.time()
-            if user_id and user_id in self.last_mention_responses:
-                time_since_last = current_time - self.last_mention_responses[user_id]
-                if time_since_last < self.mention_cooldown:
-                    logger.debug(f"Skipping mention response - cooldown active ({time_since_last:.1f}s < {self.mention_cooldown}s)")
-                    return
+            # Проверка на спам - не отвечаем слишком часто одному пользователю и в один чат
+            key = (state.chat_id, user_id)
+            if user_id and not self.mention_cooldowns.check_and_set(key):
+                COOLDOWN_HITS.inc(kind="mention")
+                logger.debug("Skipping mention response - user cooldown active ({:.1f}s left)", self.mention_cooldowns.remaining(key))
+                return
+            if not self.mention_chat_cooldowns.check_and_set(state.chat_id):
+                COOLDOWN_HITS.inc(kind="mention_chat")
+                logger.debug("Skipping mention response - chat cooldown active ({:.1f}s left)", self.mention_chat_cooldowns.remaining(state.chat_id))
+                self.mention_cooldowns.reset(key)
+                return
+            user_key = key
+            self._mark_dirty(state.chat_id)
             
             logger.info(f"Responding to mention from {display_name}: {message.text[:50]}")
             
-            # Генерируем ответ
-            response_text = await self.chatgpt_client.generate_mention_response(
-                message_text=message.text,
-                username=display_name
-            )
-            
-            # Небольшая задержка для естественности
-            await asyncio.sleep(1)
-            
-            # Отправляем ответ как reply на исходное сообщение
-            await self.application.bot.send_message(
-                chat_id=message.chat.id,
-                text=response_text,
-                reply_to_message_id=message.message_id
-            )
-            
-            # Обновляем время последнего ответа
-            if user_id:
-                self.last_mention_responses[user_id] = current_time
+            if self.config.STREAMING_REPLIES:
+                response_text = await self.stream_mention_reply(message, display_name)
+            else:
+                response_text = await self.send_mention_reply(message, display_name)
             
             logger.success(f"Replied to mention: {response_text[:50]}...")
             
         except Exception as e:
             logger.error(f"Error responding to mention: {e}")
+            # Ответ не ушел - кулдаун не должен мешать следующей попытке
+            if user_key is not None:
+                self.mention_cooldowns.reset(user_key)
+                self.mention_chat_cooldowns.reset(user_key[0])
+    
+    async def send_mention_reply(self, message: Message, display_name: str) -> str:
+        """Генерирует ответ целиком и отправляет его reply на исходное сообщение"""
+        response_text = await self.chatgpt_client.generate_mention_response(
+            message_text=message.text,
+            username=display_name
+        )
+        
+        # Небольшая задержка для естественности
+        await asyncio.sleep(1)
+        
+        await self.sender.send_message(
+            self.application.bot,
+            chat_id=message.chat.id,
+            text=response_text,
+            priority=PRIORITY_MENTION,
+            reply_to_message_id=message.message_id
+        )
+        return response_text
+    
+    async def stream_mention_reply(self, message: Message, display_name: str) -> str:
+        """Отправляет начало ответа, как только оно сгенерировано, и дописывает его правками"""
+        chat_id = message.chat.id
+        text = ""
+        shown = ""
+        sent: Optional[Message] = None
+        edit_task: Optional[asyncio.Task] = None
+        last_edit = 0.0
+        
+        async for delta in self.chatgpt_client.stream_mention_response(message.text, display_name):
+            text += delta
+            if sent is None:
+                if len(text.strip()) >= self.config.STREAM_FIRST_CHUNK_CHARS:
+                    shown = text.strip()
+                    sent = await self.sender.send_message(
+                        self.application.bot,
+                        chat_id=chat_id,
+                        text=shown,
+                        priority=PRIORITY_MENTION,
+                        reply_to_message_id=message.message_id
+                    )
+                    last_edit = time.monotonic()
+                continue
+            
+            # Следующая правка - только когда прошла предыдущая и выдержан интервал
+            now = time.monotonic()
+            if (edit_task is None or edit_task.done()) and now - last_edit >= self.config.STREAM_EDIT_INTERVAL:
+                shown = text.strip()
+                edit_task = asyncio.create_task(self._edit_reply(chat_id, sent.message_id, shown, final=False))
+                last_edit = now
+        
+        text = text.strip()
+        if sent is None:
+            # Ответ короче первого порога - отправляем целиком
+            await self.sender.send_message(
+                self.application.bot,
+                chat_id=chat_id,
+                text=text,
+                priority=PRIORITY_MENTION,
+                reply_to_message_id=message.message_id
+            )
+            return text
+        
+        if edit_task is not None:
+            await edit_task
+        if text != shown:
+            await self._edit_reply(chat_id, sent.message_id, text)
+        return text
+    
+    async def _edit_reply(self, chat_id: int, message_id: int, text: str, final: bool = True):
+        """Правка потокового ответа; промежуточные не повторяются, и их ошибки не мешают финальной"""
+        try:
+            await self.sender.edit_message_text(
+                self.application.bot, chat_id=chat_id, message_id=message_id, text=text, priority=PRIORITY_MENTION,
+                max_retries=None if final else 0
+            )
+        except BadRequest as e:
+            # "message is not modified" и подобное не мешает показать ответ (очередь отдает его сразу, без повторов)
+            logger.debug("Reply edit skipped: {}", e)
+        except TelegramError as e:
+            if final:
+                raise
+            logger.debug("Intermediate reply edit failed: {}", e)
     
     async def handle_channel_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка сообщений из группы или канала"""
         try:
-            # Поддерживаем и сообщения из группы и из канала
-            message = update.message if update.message else update.channel_post
+            # Поддерживаем сообщения из группы и из канала, в том числе отредактированные
+            message = update.effective_message
             if not message:
                 logger.warning("handle_channel_message called but message is None")
                 return
             
-            # Проверяем, что это сообщение из нужной группы/канала
-            chat_id = str(message.chat.id)
-            channel_id_str = str(self.channel_id)
-            logger.info(f"Received message from chat_id: {chat_id}, expected: {channel_id_str}")
+            # Проверяем, что бот работает в этой группе/канале
+            chat_id = message.chat.id
+            if log_sampler.allow("message_chat"):
+                logger.debug("Received message from chat_id: {}", chat_id)
             
-            if chat_id != channel_id_str and channel_id_str != chat_id:
-                logger.debug(f"Message from different chat, skipping. Got: {chat_id}, Expected: {channel_id_str}")
+            if not self.is_chat_allowed(message.chat):
+                logger.debug("Message from not allowed chat, skipping: {}", chat_id)
                 return
             
+            state = self.chats.get_or_create(chat_id)
+            
             # Получаем информацию об авторе сообщения
             user_id = None
             if message.from_user:
                 user_id = message.from_user.id
             elif message.author_signature:
-                # Для каналов без автора
-                user_id = hash(message.author_signature)
+                # Для каналов без автора: устойчивый хэш, участники переживают перезапуск через StateStore
+                user_id = zlib.crc32(message.author_signature.encode())
             
             if user_id is None:
                 user_id = message.chat.id  # Fallback
@@ -225,45 +496,57 @@ class TelegramBotHandler:
             # ПРОВЕРКА УПОМИНАНИЯ БОТА - приоритетная функция
             if self.is_bot_mentioned(message):
                 logger.info("Bot mentioned - responding immediately")
-                await self.respond_to_mention(update, message)
+                await self.respond_to_mention(update, message, state)
                 # Не продолжаем обычную логику - возвращаемся
                 return
             
             # Обновляем мониторинг активности
-            self.monitor.update_last_activity(user_id)
+            state.monitor.update_last_activity(user_id)
             
             # Добавляем текст сообщения в историю (только от пользователей, не от бота)
             if user_id != self.bot_id and message.text:
-                self.recent_messages.append(message.text)
-                if len(self.recent_messages) > self.max_context_messages:
-                    self.recent_messages.pop(0)
+                author = message.from_user.first_name if message.from_user else (message.author_signature or "")
+                state.add_context_message(message.text, author, message.date.timestamp() if message.date else None)
             
-            logger.info(f"Message received. User: {user_id}, Text: {message.text[:50] if message.text else 'No text'}")
+            if log_sampler.allow("message_received"):
+                logger.debug("Message received. User: {}, Text: {}", user_id, message.text[:50] if message.text else 'No text')
             
             # Проверяем, должен ли бот ответить (обычная логика обсуждения)
-            if self.monitor.should_bot_respond(MESSAGE_THRESHOLD_MIN, MESSAGE_THRESHOLD_MAX):
-                await self.respond_to_conversation()
-                self.monitor.reset_counter()
-                self.recent_messages.clear()
+            if state.should_respond(single_author=message.chat.type == Chat.CHANNEL):
+                await self.respond_to_conversation(state)
+                state.monitor.mark_responded()
+                state.context.clear()
+            
+            self._mark_dirty(chat_id)
                 
         except Exception as e:
             logger.error(f"Error handling channel message: {e}")
     
-    async def respond_to_conversation(self):
-        """Отвечает на активное обсуждение в канале"""
+    async def respond_to_conversation(self, state: ChatState):
+        """Отвечает на активное обсуждение в чате"""
         try:
-            logger.info("Bot responding to conversation")
+            logger.info(f"Bot responding to conversation in {state.chat_id}")
             
             # Формируем контекст из последних сообщений
-            context = "\n".join(self.recent_messages[-3:]) if self.recent_messages else "Общая болтовня"
+            context = state.context.build(
+                self.config.CONTEXT_TOKEN_BUDGET, self.config.CONTEXT_MESSAGE_MAX_TOKENS
+            ) or "Общая болтовня"
             
             # Генерируем комментарий
-            comment = await self.chatgpt_client.generate_comment(context)
+            if self.comment_batcher:
+                comment = await self.comment_batcher.generate(context)
+            else:
+                comment = await self.chatgpt_client.generate_comment(context)
+            if comment is None:
+                logger.info(f"Skipping comment in {state.chat_id}: OpenAI is overloaded")
+                return
             
             # Отправляем сообщение
-            await self.application.bot.send_message(
-                chat_id=self.channel_id,
-                text=comment
+            await self.sender.send_message(
+                self.application.bot,
+                chat_id=state.chat_id,
+                text=comment,
+                priority=PRIORITY_CONVERSATION
             )
             
             logger.success(f"Bot responded: {comment[:50]}...")
@@ -271,47 +554,173 @@ class TelegramBotHandler:
         except Exception as e:
             logger.error(f"Error responding to conversation: {e}")
     
-    async def send_message_to_channel(self, text: str):
-        """Отправляет сообщение в канал"""
+    async def send_message_to_channel(self, text: str, chat_id: Optional[Union[int, str]] = None,
+                                      priority: int = PRIORITY_SCHEDULED):
+        """Отправляет сообщение в канал (по умолчанию - в основной)"""
         try:
-            await self.application.bot.send_message(
-                chat_id=self.channel_id,
-                text=text
+            await self.sender.send_message(
+                self.application.bot,
+                chat_id=chat_id if chat_id is not None else self.channel_id,
+                text=text,
+                priority=priority
             )
             logger.info("Message sent to channel")
         except Exception as e:
             logger.error(f"Error sending message to channel: {e}")
     
+    async def start_updates(self):
+        """Запускает получение обновлений в режиме из UPDATE_MODE"""
+        if self.config.UPDATE_MODE == "webhook":
+            await self.start_webhook()
+        elif self.config.UPDATE_MODE == "stdin":
+            await self.start_stdin()
+        else:
+            await self.start_polling()
+    
     async def start_polling(self):
         """Запускает long polling"""
         logger.info("Starting bot polling...")
-        await self.application.initialize()
         await self.application.start()
         await self.application.updater.start_polling(
-            allowed_updates=["channel_post", "edited_channel_post", "message", "edited_message"]
+            allowed_updates=ALLOWED_UPDATES
         )
         logger.info("Bot polling started")
     
-    async def stop(self):
-        """Останавливает бота"""
-        logger.info("Stopping bot...")
+    async def start_stdin(self):
+        """Режим воркера: обновления приходят от супервизора в stdin, по одному JSON на строку"""
+        logger.info(f"Starting worker {self.config.WORKER_INDEX}/{self.config.WORKERS} on stdin...")
+        await self.application.start()
+        
+        reader = asyncio.StreamReader(limit=self.config.WEBHOOK_MAX_BODY_SIZE * 2)
+        loop = asyncio.get_running_loop()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        self._stdin_task = asyncio.create_task(self._read_stdin(reader), name="stdin-updates")
+    
+    async def _read_stdin(self, reader: asyncio.StreamReader):
+        while True:
+            line = await reader.readline()
+            if not line:
+                # Супервизор закрыл поток (остановка или его падение) - завершаемся штатно
+                logger.info("Update stream closed, stopping worker")
+                os.kill(os.getpid(), signal.SIGTERM)
+                return
+            try:
+                payload = json.loads(line)
+                if "ring" in payload:
+                    self.set_worker_nodes(payload["ring"])
+                    continue
+                update = Update.de_json(payload, self.application.bot)
+            except Exception as e:
+                logger.warning(f"Invalid update from supervisor: {e}")
+                continue
+            await self.application.update_queue.put(update)
+    
+    def set_worker_nodes(self, nodes: List[int]):
+        """Супервизор изменил состав воркеров (падение или перезапуск): пересобираем кольцо своих чатов"""
+        if self.worker_ring is None or set(nodes) == self.worker_ring.nodes:
+            return
+        self.worker_ring = ConsistentHashRing(nodes)
+        logger.info(f"Worker {self.config.WORKER_INDEX} ring updated: workers {sorted(nodes)}")
+    
+    async def start_webhook(self):
+        """Поднимает встроенный HTTP-сервер и регистрирует вебхук в Telegram"""
+        logger.info("Starting bot webhook...")
+        await self.application.start()
+        
+        # Фильтр по сырым байтам возможен, только если все разрешенные чаты заданы числовыми ID
+        prefilter = None
+        if not self.allow_all_chats and not self.allowed_chat_usernames:
+            prefilter = make_chat_prefilter(self.allowed_chat_ids)
+        
+        self.webhook_server = WebhookServer(
+            self.application,
+            host=self.config.WEBHOOK_LISTEN,
+            port=self.config.WEBHOOK_PORT,
+            path=self.config.WEBHOOK_PATH,
+            secret_token=self.config.WEBHOOK_SECRET_TOKEN,
+            prefilter=prefilter,
+            max_body_size=self.config.WEBHOOK_MAX_BODY_SIZE,
+        )
+        await self.webhook_server.start()
+        
+        if self.config.WEBHOOK_URL:
+            await self.application.bot.set_webhook(
+                url=self.config.WEBHOOK_URL.rstrip("/") + self.config.WEBHOOK_PATH,
+                allowed_updates=ALLOWED_UPDATES,
+                secret_token=self.config.WEBHOOK_SECRET_TOKEN,
+                max_connections=self.config.WEBHOOK_MAX_CONNECTIONS,
+            )
+            logger.info("Bot webhook started")
+        else:
+            # Локальный режим: обновления присылаются на сервер вручную (например, bench.webhook_load)
+            logger.warning("WEBHOOK_URL not set, webhook is not registered in Telegram")
+    
+    async def stop(self, timeout: Optional[float] = None, scheduled_posts: int = 0) -> Dict[str, int]:
+        """Останавливает бота: прекращает прием обновлений и доделывает начатое не дольше timeout секунд
+
+        Возвращает, сколько обновлений, запросов к OpenAI и сообщений пришлось бросить; scheduled_posts -
+        посты, отмененные планировщиком до этого, попадают в тот же отчет.
+        """
+        if timeout is None:
+            timeout = self.config.SHUTDOWN_DRAIN_TIMEOUT
+        started = time.monotonic()
+        deadline = started + timeout
+        logger.info(f"Stopping bot, draining in-flight work for up to {timeout:g}s...")
+        dropped = {"updates": 0, "openai_requests": 0, "messages": 0, "scheduled_posts": scheduled_posts}
+        
+        # Новые обновления больше не принимаем
+        if self.webhook_server:
+            await self.webhook_server.stop()
+        if self._stdin_task:
+            self._stdin_task.cancel()
+        if self.application and self.application.updater and self.application.updater.running:
+            await self.application.updater.stop()
+        
+        # Обновления из очереди и уже начатые ответы доделываем до дедлайна
+        if self.application and self.application.running:
+            dropped["updates"], dropped["openai_requests"] = await self._drain_updates(deadline)
+        if self.comment_batcher:
+            await self.comment_batcher.close()
+        # Даем очереди отправить то, что уже сгенерировано
+        dropped["messages"] = await self.sender.stop(max(0.0, deadline - time.monotonic()))
+        
+        # Состояние чатов, кэш ответов и журнал обновлений сбрасываем на диск в любом случае
+        if self.state_store:
+            await self.state_store.close()
+        if self.update_recorder is not None:
+            await self.update_recorder.close()
+        if self.chatgpt_client.response_cache is not None:
+            await self.chatgpt_client.response_cache.close()
         if self.application:
             try:
-                # Проверяем, запущено ли приложение
-                if hasattr(self.application, 'running') and self.application.running:
-                    await self.application.stop()
-                    await self.application.shutdown()
-                else:
-                    # Если приложение не запущено, просто выполняем shutdown
-                    await self.application.shutdown()
-            except RuntimeError as e:
-                # Если приложение уже остановлено, просто продолжаем
-                logger.debug(f"Application already stopped: {e}")
-                try:
-                    await self.application.shutdown()
-                except Exception as e2:
-                    logger.debug(f"Error during shutdown: {e2}")
+                await self.application.shutdown()
             except Exception as e:
-                logger.error(f"Error stopping application: {e}")
-        logger.info("Bot stopped")
+                logger.error(f"Error shutting down application: {e}")
+        
+        elapsed = time.monotonic() - started
+        if any(dropped.values()):
+            logger.warning(f"Bot stopped in {elapsed:.1f}s, dropped: {dropped}")
+        else:
+            logger.info(f"Bot stopped in {elapsed:.1f}s, all in-flight work finished")
+        return dropped
+    
+    async def _drain_updates(self, deadline: float):
+        """Дожидается обработчиков обновлений; к дедлайну отменяет оставшиеся
 
+        Возвращает число брошенных обновлений и запросов к OpenAI, которые они ждали или выполняли.
+        """
+        processor = self.application.update_processor
+        # Application.stop разбирает update_queue и ждет все запущенные обработчики
+        stop_task = asyncio.create_task(self.application.stop())
+        done, _ = await asyncio.wait({stop_task}, timeout=max(0.0, deadline - time.monotonic()))
+        openai_requests = 0
+        if not done and isinstance(processor, PerChatUpdateProcessor):
+            admission = self.chatgpt_client.admission
+            openai_requests = admission.in_flight + admission.stats()["queued"]
+            logger.warning(f"Drain deadline reached with {processor.pending} updates in progress, cancelling them")
+            processor.cancel_pending()
+        try:
+            await stop_task
+        except Exception as e:
+            logger.error(f"Error stopping application: {e}")
+        return getattr(processor, "dropped", 0), openai_requests
@@ -0,0 +1,100 @@
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Этапы фильтра в порядке проверки
+STAGE_DUPLICATE = 0
+STAGE_TYPE = 1
+STAGE_CHAT_TYPE = 2
+STAGE_CHAT = 3
+STAGE_OWN = 4
+STAGE_NO_TEXT = 5
+STAGES = ("duplicate", "type", "chat_type", "chat", "own", "no_text")
+
+_GROUP_TYPES = frozenset(("group", "supergroup"))
+
+
+class UpdateFilter:
+    """Ранний фильтр обновлений для check_update, до запуска обработчика
+
+    Все наборы собираются заранее, а проверка читает только атрибуты обновления и
+    сравнивает числа, без форматирования строк и логов. На каждом этапе считается,
+    сколько обновлений на нем отброшено.
+    """
+
+    __slots__ = ("allow_all", "bot_id", "resume_update_id", "resume_until", "_allowed_ids", "_allowed_usernames",
+                 "_resolved_usernames", "dropped", "passed")
+
+    def __init__(self, allowed_chat_ids: Iterable[int] = (), allowed_usernames: Iterable[str] = (),
+                 allow_all: bool = False, bot_id: Optional[int] = None, resume_update_id: Optional[int] = None,
+                 resume_until: Optional[float] = None, resolved_usernames: Optional[Dict[str, int]] = None):
+        self.allow_all = allow_all
+        self.bot_id = bot_id
+        self.resume_update_id = resume_update_id  # Обновления с update_id не больше этого уже обработаны
+        # До этого unix-времени (None - без срока): позже Telegram повторов не пришлет, а меньший
+        # update_id значит, что нумерация началась заново
+        self.resume_until = resume_until
+        self._allowed_ids = set(allowed_chat_ids)
+        self._allowed_usernames = frozenset(allowed_usernames)
+        # username -> ID чата, узнанный при первом сообщении (общий с обработчиком)
+        self._resolved_usernames = resolved_usernames if resolved_usernames is not None else {}
+        self.dropped: List[int] = [0] * len(STAGES)
+        self.passed = 0
+
+    def check(self, update) -> bool:
+        """Нужно ли обрабатывать обновление"""
+        if self.resume_update_id is not None and update.update_id <= self.resume_update_id:
+            if self.resume_until is None or time.time() < self.resume_until:
+                self.dropped[STAGE_DUPLICATE] += 1
+                return False
+            self.resume_update_id = None
+
+        message = update.message
+        if message is None:
+            message = update.edited_message
+        if message is not None:
+            # В личных чатах бот не работает, из групп принимаем только group/supergroup
+            if message.chat.type not in _GROUP_TYPES:
+                self.dropped[STAGE_CHAT_TYPE] += 1
+                return False
+        else:
+            message = update.channel_post
+            if message is None:
+                message = update.edited_channel_post
+            if message is None:
+                self.dropped[STAGE_TYPE] += 1
+                return False
+
+        chat = message.chat
+        if not self.allow_all and chat.id not in self._allowed_ids and not self._match_username(chat):
+            self.dropped[STAGE_CHAT] += 1
+            return False
+
+        user = message.from_user
+        if user is not None and user.id == self.bot_id:
+            self.dropped[STAGE_OWN] += 1
+            return False
+
+        if message.text is None:
+            self.dropped[STAGE_NO_TEXT] += 1
+            return False
+
+        self.passed += 1
+        return True
+
+    def _match_username(self, chat) -> bool:
+        """Чат, разрешенный по @username: после первого совпадения его ID проверяется через множество"""
+        if not self._allowed_usernames or not chat.username:
+            return False
+        username = chat.username.lower()
+        if username not in self._allowed_usernames:
+            return False
+        self._allowed_ids.add(chat.id)
+        self._resolved_usernames[username] = chat.id
+        return True
+
+    def drop_counts(self) -> Dict[Tuple[str], int]:
+        """Отброшенные обновления по этапам (для метрики bot_updates_filtered_total)"""
+        return {(stage,): count for stage, count in zip(STAGES, self.dropped)}
+
+    def stats(self) -> dict:
+        return {"passed": self.passed, "dropped": dict(zip(STAGES, self.dropped))}
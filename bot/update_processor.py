@@ -0,0 +1,145 @@
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from loguru import logger
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Обрабатывает обновления из разных чатов параллельно, а внутри одного чата - по порядку
+
+    Семафор базового класса ограничивает только число обновлений, ожидающих обработки,
+    а число реально работающих обработчиков ограничивает собственный семафор workers.
+    Он берется уже после блокировки чата, поэтому очередь обновлений одного
+    медленного чата не занимает воркеры и не задерживает остальные чаты.
+
+    При остановке cancel_pending отменяет недоделанные обновления, а пришедшие после
+    этого сразу отбрасываются; и те и другие считаются в dropped.
+
+    Чаты обрабатываются вперемешку, поэтому наибольший законченный update_id не значит, что
+    законченные все меньшие. watermark - update_id, до которого включительно закончено все
+    (до самого раннего еще не законченного); его и стоит сохранять для пропуска повторов.
+    """
+
+    __slots__ = ("_workers", "_max_workers", "_chat_locks", "_tasks", "_closed", "_unfinished", "_finished_max",
+                 "recorder", "on_watermark", "processed", "dropped")
+
+    def __init__(self, max_workers: int, max_pending_updates: int = 4096):
+        super().__init__(max_concurrent_updates=max(max_workers, max_pending_updates))
+        self._max_workers = max_workers
+        self._workers = asyncio.Semaphore(max_workers)
+        # {chat_id: [lock, сколько обновлений его ждут]} - записи удаляются, когда чат простаивает
+        self._chat_locks: Dict[int, List[Any]] = {}
+        self._tasks: Set[asyncio.Task] = set()  # Задачи обновлений в обработке и в очереди
+        self._closed = False
+        # Журнал обновлений (UpdateRecorder): пишем при поступлении, до очереди чата, чтобы время было временем прихода
+        self.recorder = None
+        # update_id начатых, но не законченных обновлений в порядке поступления (Telegram выдает их по возрастанию)
+        self._unfinished: "OrderedDict[int, None]" = OrderedDict()
+        self._finished_max: Optional[int] = None
+        # Вызывается с новым watermark после каждого законченного обновления (StateStore.record_update_id)
+        self.on_watermark: Optional[Callable[[int], None]] = None
+        self.processed = 0
+        self.dropped = 0
+
+    @property
+    def max_workers(self) -> int:
+        return self._max_workers
+
+    @property
+    def active_chats(self) -> int:
+        """Сколько чатов сейчас имеют обновления в обработке или в очереди"""
+        return len(self._chat_locks)
+
+    @property
+    def pending(self) -> int:
+        """Сколько обновлений сейчас обрабатывается или ждет своей очереди"""
+        return len(self._tasks)
+
+    @property
+    def watermark(self) -> Optional[int]:
+        """Наибольший update_id, до которого включительно все обновления закончены"""
+        if self._unfinished:
+            return next(iter(self._unfinished)) - 1
+        return self._finished_max
+
+    @staticmethod
+    def _chat_key(update: object) -> Optional[int]:
+        if isinstance(update, Update) and update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        if self.recorder is not None:
+            self.recorder.record(update)
+        if self._closed:
+            coroutine.close()
+            self.dropped += 1
+            return
+        update_id = getattr(update, "update_id", None)
+        if update_id is not None:
+            if not self._unfinished and self._finished_max is not None and update_id < self._finished_max:
+                # Новое обновление ниже уже законченных: Telegram начал нумерацию заново
+                self._finished_max = None
+            self._unfinished[update_id] = None
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            await self._process(update, coroutine)
+        except asyncio.CancelledError:
+            if not self._closed:
+                raise
+            # Обработчик мог так и не начаться, пока ждал очереди своего чата.
+            # Брошенное обновление остается незаконченным: после перезапуска Telegram пришлет его снова
+            coroutine.close()
+            self.dropped += 1
+            update_id = None
+        finally:
+            self._tasks.discard(task)
+            if update_id is not None:
+                self._finish(update_id)
+
+    def _finish(self, update_id: int):
+        self._unfinished.pop(update_id, None)
+        if self._finished_max is None or update_id > self._finished_max:
+            self._finished_max = update_id
+        if self.on_watermark is not None:
+            watermark = self.watermark
+            if watermark is not None:
+                self.on_watermark(watermark)
+
+    async def _process(self, update: object, coroutine: Awaitable[Any]) -> None:
+        chat_id = self._chat_key(update)
+        if chat_id is None:
+            async with self._workers:
+                await coroutine
+            self.processed += 1
+            return
+
+        entry = self._chat_locks.get(chat_id)
+        if entry is None:
+            entry = self._chat_locks[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._workers:
+                    await coroutine
+            self.processed += 1
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chat_locks[chat_id]
+
+    def cancel_pending(self) -> int:
+        """Отменяет все недоделанные обновления и перестает принимать новые (при остановке)"""
+        self._closed = True
+        for task in self._tasks:
+            task.cancel()
+        return len(self._tasks)
+
+    async def initialize(self) -> None:
+        logger.info(f"Per-chat update processor started with {self._max_workers} workers")
+
+    async def shutdown(self) -> None:
+        logger.info(f"Per-chat update processor stopped, processed {self.processed} updates, dropped {self.dropped}")
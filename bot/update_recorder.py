@@ -0,0 +1,137 @@
+import asyncio
+import gzip
+import json
+import os
+import time
+from typing import Iterator, List, Optional, Tuple
+from loguru import logger
+
+
+class UpdateRecorder:
+    """Запись входящих обновлений в сжатый журнал для воспроизведения (bench.replay)
+
+    Журнал - JSON по строке на запись: {"t": unix-время получения, "u": обновление в формате
+    Bot API}, а при каждом старте - заголовок {"bot": {"id", "username"}}, чтобы при
+    воспроизведении упоминания бота распознавались. Обработчик только кладет обновление
+    в буфер; раз в flush_interval секунд буфер сериализуется и дописывается в файл
+    отдельным gzip-блоком в потоке, так что файл только растет и читается gzip.open целиком.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 5.0, max_bytes: int = 512 * 1024 * 1024,
+                 max_pending: int = 100000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.max_pending = max_pending
+        self._pending: List[Tuple[float, object]] = []
+        self._header: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+        self._write_lock = asyncio.Lock()
+        self._size = 0
+        self._full = False
+
+        # Метрики
+        self.recorded = 0
+        self.dropped = 0
+        self.bytes_written = 0
+
+    def start(self, bot_id: Optional[int] = None, bot_username: Optional[str] = None):
+        """Запускает фоновую запись; заголовок с ботом уйдет первым блоком"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        self._header = {"bot": {"id": bot_id, "username": bot_username}}
+        if self._task is None or self._task.done():
+            self._stop.clear()
+            self._task = asyncio.create_task(self._run(), name="update-recorder-flush")
+        logger.info(f"Recording updates to {self.path}")
+
+    def record(self, update):
+        """Запоминает обновление (сериализация и запись - при flush)"""
+        if self._full or len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append((time.time(), update))
+
+    async def close(self):
+        """Останавливает фоновую запись и дописывает остаток буфера
+
+        Цикл не отменяется, а выходит по сигналу: иначе его блок дописывался бы в файл
+        одновременно с последним и перемешался бы с ним.
+        """
+        if self._task:
+            self._stop.set()
+            try:
+                await self._task
+            except Exception as e:
+                logger.error(f"Update recorder flush loop failed: {e}")
+            self._task = None
+        await self.flush()
+        logger.info(f"Update recorder closed ({self.recorded} recorded, {self.dropped} dropped)")
+
+    async def flush(self):
+        if not self._pending and self._header is None:
+            return
+        pending, self._pending = self._pending, []
+        header, self._header = self._header, None
+        async with self._write_lock:
+            write = asyncio.ensure_future(asyncio.to_thread(self._write, header, pending))
+            try:
+                written = await asyncio.shield(write)
+            except asyncio.CancelledError:
+                # Поток не отменить: блокировку отпускаем только после того, как он допишет блок
+                await asyncio.wait({write})
+                raise
+            except Exception as e:
+                self.dropped += len(pending)
+                logger.error(f"Error writing update log: {e}")
+                return
+        self.recorded += len(pending)
+        self.bytes_written += written
+        self._size += written
+        if self._size >= self.max_bytes and not self._full:
+            self._full = True
+            logger.warning(f"Update log {self.path} reached {self.max_bytes} bytes, recording stopped")
+
+    def _write(self, header: Optional[dict], pending: List[Tuple[float, object]]) -> int:
+        # Обновления PTB неизменяемые, поэтому to_dict в потоке безопасен
+        lines = [json.dumps(header, ensure_ascii=False)] if header is not None else []
+        for received_at, update in pending:
+            lines.append(json.dumps({"t": round(received_at, 3), "u": update.to_dict()},
+                                    ensure_ascii=False, separators=(",", ":")))
+        data = gzip.compress(("\n".join(lines) + "\n").encode(), compresslevel=6)
+        with open(self.path, "ab") as file:
+            file.write(data)
+        return len(data)
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "recorded": self.recorded,
+            "pending": len(self._pending),
+            "dropped": self.dropped,
+            "bytes_written": self.bytes_written,
+        }
+
+
+def read_update_log(path: str) -> Iterator[dict]:
+    """Записи журнала по порядку: {"bot": ...} (заголовки) и {"t": ..., "u": ...}
+
+    Недописанный последний блок (процесс упал во время записи) пропускается.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        try:
+            for line in file:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        except (EOFError, gzip.BadGzipFile, json.JSONDecodeError) as e:
+            logger.warning(f"Update log {path} is truncated, stopping at the damaged block: {e}")
@@ -0,0 +1,126 @@
+import hmac
+import json
+import time
+from typing import Awaitable, Callable, Optional, Set
+from loguru import logger
+
+from bot.http_server import HTTPServer, Request, Response
+
+
+# Типы обновлений, которые обрабатывает бот (совпадает с allowed_updates)
+ALLOWED_UPDATES = ["channel_post", "edited_channel_post", "message", "edited_message"]
+
+_UPDATE_KEYS = tuple(f'"{name}"'.encode() for name in ALLOWED_UPDATES)
+_CHAT_ID_MARKER = b'"chat":{"id":'
+_SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+def extract_chat_id(body: bytes) -> Optional[int]:
+    """Достает ID чата из сырого JSON обновления, не разбирая его целиком
+
+    Telegram сериализует объект чата компактно и всегда начинает его с поля id,
+    так что достаточно найти маркер и прочитать число. Если формат неожиданный,
+    возвращает None, и обновление проходит полную проверку.
+    """
+    start = body.find(_CHAT_ID_MARKER)
+    if start < 0:
+        return None
+    start += len(_CHAT_ID_MARKER)
+    end = start
+    if end < len(body) and body[end] == 0x2D:  # '-'
+        end += 1
+    while end < len(body) and 0x30 <= body[end] <= 0x39:
+        end += 1
+    try:
+        return int(body[start:end])
+    except ValueError:
+        return None
+
+
+def make_chat_prefilter(allowed_chat_ids: Set[int]) -> Callable[[bytes], bool]:
+    """Фильтр по сырому телу: пропускает только обновления из разрешенных чатов"""
+    def prefilter(body: bytes) -> bool:
+        chat_id = extract_chat_id(body)
+        return chat_id is None or chat_id in allowed_chat_ids
+    return prefilter
+
+
+class WebhookServer:
+    """Принимает обновления от Telegram по вебхуку и кладет их в update_queue приложения
+
+    Дешевые проверки идут до разбора JSON: путь, секретный токен, размер тела,
+    наличие нужного типа обновления и (опционально) ID чата по сырым байтам.
+    На отброшенные обновления отвечаем 200, чтобы Telegram не повторял их.
+    """
+
+    def __init__(self, application, host: str, port: int, path: str, secret_token: Optional[str] = None,
+                 prefilter: Optional[Callable[[bytes], bool]] = None, max_body_size: int = 1024 * 1024,
+                 raw_sink: Optional[Callable[[bytes], Awaitable[None]]] = None):
+        self.application = application
+        self.raw_sink = raw_sink  # Если задан, тело передается ему как есть, без разбора (супервизор)
+        self._de_json = None
+        if raw_sink is None:
+            # Супервизору с raw_sink модели PTB не нужны, и telegram он не импортирует
+            from telegram import Update
+            self._de_json = Update.de_json
+        self.path = path
+        self.secret_token = secret_token.encode() if secret_token else None
+        self.prefilter = prefilter
+        self.server = HTTPServer(host, port, max_body_size=max_body_size, name="webhook")
+        self.server.route("POST", path, self._handle_update)
+
+        self.accepted = 0
+        self.rejected_secret = 0
+        self.rejected_type = 0
+        self.rejected_chat = 0
+        self.rejected_invalid = 0
+        self.started_at = time.monotonic()
+
+    async def start(self):
+        self.started_at = time.monotonic()
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
+        logger.info(f"Webhook stats: {self.stats()}")
+
+    def stats(self) -> dict:
+        return {
+            "accepted": self.accepted,
+            "rejected_secret": self.rejected_secret,
+            "rejected_type": self.rejected_type,
+            "rejected_chat": self.rejected_chat,
+            "rejected_invalid": self.rejected_invalid,
+        }
+
+    async def _handle_update(self, request: Request) -> Response:
+        if self.secret_token is not None:
+            received = request.headers.get(_SECRET_HEADER, "").encode()
+            if not hmac.compare_digest(received, self.secret_token):
+                self.rejected_secret += 1
+                return Response(403)
+
+        body = request.body
+        if not any(key in body for key in _UPDATE_KEYS):
+            self.rejected_type += 1
+            return Response(200)
+
+        if self.prefilter is not None and not self.prefilter(body):
+            self.rejected_chat += 1
+            return Response(200)
+
+        if self.raw_sink is not None:
+            await self.raw_sink(body)
+            self.accepted += 1
+            return Response(200)
+
+        try:
+            update = self._de_json(json.loads(body), self.application.bot)
+        except Exception as e:
+            self.rejected_invalid += 1
+            logger.warning(f"Invalid webhook payload: {e}")
+            return Response(400)
+
+        await self.application.update_queue.put(update)
+        self.accepted += 1
+        return Response(200)
@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+from bot.content_pool import ContentPool
+
+
+def make_pool(texts, **kwargs):
+    texts = iter(texts)
+
+    async def generate():
+        return next(texts, None)
+    return ContentPool({"joke": generate}, target_size=3, low_water=1, refill_concurrency=1, **kwargs)
+
+
+def test_snapshot_restores_items_and_recent_posts():
+    pool = make_pool(["раз", "два", "три"])
+    asyncio.run(pool.refill())
+    posted = pool.take("joke")
+
+    restored = make_pool([])
+    assert restored.restore(pool.snapshot()) == 2
+    assert restored.size("joke") == 2
+    # Опубликованный до перезапуска текст не повторяется
+    assert posted not in {item.text for item in restored._items["joke"]}
+    assert restored.snapshot()["recent"][:1] == [posted]
+
+
+def test_restore_skips_expired_and_unknown_types():
+    pool = make_pool([], ttl=60)
+    now = time.time()
+    snapshot = {"items": {"joke": [["старая", now - 120], ["новая", now]], "meme": [["цитата", now]]}}
+    assert pool.restore(snapshot) == 1
+
+    async def scenario():
+        text = pool.take("joke")
+        await pool.stop()
+        return text
+    assert asyncio.run(scenario()) == "новая"
+
+
+def test_changes_are_reported():
+    changes = []
+    pool = make_pool(["раз", "два", "три"])
+    pool.on_change = lambda: changes.append(1)
+
+    async def scenario():
+        await pool.refill()
+        pool.take("joke")
+        await pool.stop()
+
+    asyncio.run(scenario())
+    assert len(changes) >= 2
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from bot.http_server import HTTPServer, Response
+
+
+async def echo(request):
+    return Response(200, request.body)
+
+
+def exchange(raw: bytes, **server_kwargs) -> bytes:
+    """Отправляет серверу сырые байты и возвращает все, что он ответил до закрытия соединения"""
+    async def main():
+        server = HTTPServer("127.0.0.1", 0, **server_kwargs)
+        server.route("POST", "/hook", echo)
+        await server.start()
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.bound_port)
+            writer.write(raw)
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            return response
+        finally:
+            await server.stop()
+    return asyncio.run(main())
+
+
+def status_of(response: bytes) -> int:
+    return int(response.split(b" ", 2)[1])
+
+
+def test_body_is_read_by_content_length():
+    response = exchange(b"POST /hook HTTP/1.1\r\nContent-Length: 5\r\nConnection: close\r\n\r\nhello")
+    assert status_of(response) == 200
+    assert response.endswith(b"\r\n\r\nhello")
+
+
+@pytest.mark.parametrize("length", [b"-5", b"abc"])
+def test_invalid_content_length_is_rejected(length):
+    response = exchange(b"POST /hook HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n")
+    assert status_of(response) == 400
+
+
+def test_body_over_limit_is_rejected():
+    response = exchange(b"POST /hook HTTP/1.1\r\nContent-Length: 11\r\n\r\n", max_body_size=10)
+    assert status_of(response) == 413
+
+
+def test_too_many_headers_are_rejected():
+    headers = b"".join(b"X-H%d: 1\r\n" % i for i in range(5))
+    response = exchange(b"POST /hook HTTP/1.1\r\n" + headers + b"\r\n", max_headers=4)
+    assert status_of(response) == 431
+
+
+def test_too_long_request_line_is_rejected():
+    response = exchange(b"GET /" + b"a" * 2048 + b" HTTP/1.1\r\n\r\n", max_header_bytes=1024)
+    assert status_of(response) == 414
+
+
+def test_slow_headers_time_out():
+    response = exchange(b"POST /hook HTTP/1.1\r\nContent-Le", read_timeout=0.2)
+    assert status_of(response) == 408
+
+
+def test_unknown_path_and_method():
+    assert status_of(exchange(b"GET /missing HTTP/1.1\r\nConnection: close\r\n\r\n")) == 404
+    assert status_of(exchange(b"GET /hook HTTP/1.1\r\nConnection: close\r\n\r\n")) == 405
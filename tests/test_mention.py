@@ -0,0 +1,63 @@
+from datetime import datetime
+
+import pytest
+from telegram import Chat, Message, MessageEntity, User
+
+from bot.mention import MentionDetector
+
+BOT = User(id=42, first_name="bot", is_bot=True, username="pidar_bot")
+USER = User(id=7, first_name="Вася", is_bot=False)
+CHAT = Chat(id=-100, type="supergroup")
+
+
+def make_message(text, from_user=USER, entities=(), reply_to=None):
+    return Message(message_id=1, date=datetime.now(), chat=CHAT, from_user=from_user, text=text,
+                   entities=entities, reply_to_message=reply_to)
+
+
+@pytest.fixture
+def detector():
+    return MentionDetector(BOT.id, BOT.username, ["Бот", "пидарбот"])
+
+
+@pytest.mark.parametrize("text", [
+    "бот, ты где",
+    "эй БОТ!",
+    "ну ты и пидарбот",
+    "привет @Pidar_Bot",
+    "(бот)",
+])
+def test_alias_or_username_as_whole_word(detector, text):
+    assert detector.is_mentioned(make_message(text))
+
+
+@pytest.mark.parametrize("text", [
+    "работа не волк",
+    "боты захватят мир",
+    "ботинки",
+    "@pidar_bot_fan привет",
+    "mail@pidar_bot",
+    "бот_ник",
+    "",
+])
+def test_substrings_are_not_mentions(detector, text):
+    assert not detector.is_mentioned(make_message(text))
+
+
+def test_mention_entity_and_reply_to_bot(detector):
+    text = "@pidar_bot глянь"
+    entity = MessageEntity(MessageEntity.MENTION, 0, len("@pidar_bot"))
+    assert detector.is_mentioned(make_message(text, entities=(entity,)))
+    reply_to = make_message("я бот", from_user=BOT)
+    assert detector.is_mentioned(make_message("согласен", reply_to=reply_to))
+
+
+def test_own_messages_are_ignored(detector):
+    assert not detector.is_mentioned(make_message("бот", from_user=BOT))
+
+
+def test_other_mention_entity_without_aliases():
+    detector = MentionDetector(BOT.id, BOT.username)
+    text = "@someone_else бот"
+    entity = MessageEntity(MessageEntity.MENTION, 0, len("@someone_else"))
+    assert not detector.is_mentioned(make_message(text, entities=(entity,)))
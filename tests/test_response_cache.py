@@ -0,0 +1,54 @@
+import asyncio
+import threading
+import time
+
+from bot.response_cache import ResponseCache, make_key
+
+
+def test_key_depends_on_username_and_normalized_text():
+    assert make_key("m", "tpl", "Ну че, как?", "Вася") == make_key("m", "tpl", "ну че как", "вася")
+    assert make_key("m", "tpl", "ну че как", "Вася") != make_key("m", "tpl", "ну че как", "Петя")
+
+
+def test_cached_reply_is_returned_verbatim():
+    cache = ResponseCache(reuse_probability=1.0)
+    key = make_key("m", "tpl", "привет", "Вася")
+    cache.put(key, "Васе привет")
+    assert cache.get("m", key) == "Васе привет"
+
+
+def test_close_waits_for_write_in_progress(tmp_path):
+    overlaps = []
+    write_started = threading.Event()
+
+    async def scenario():
+        cache = ResponseCache(disk_path=str(tmp_path / "cache.db"), flush_interval=0.01)
+        cache.open()
+        original_write = cache._write
+        active = threading.Lock()
+
+        def slow_write(*args):
+            if not active.acquire(blocking=False):
+                overlaps.append(args)
+                return
+            try:
+                write_started.set()
+                time.sleep(0.2)
+                original_write(*args)
+            finally:
+                active.release()
+
+        cache._write = slow_write
+        cache.start()
+        cache.put("a", "первый")
+        while not write_started.is_set():
+            await asyncio.sleep(0.005)
+        cache.put("b", "второй")
+        await cache.close()
+
+    asyncio.run(scenario())
+    assert overlaps == []
+    reopened = ResponseCache(disk_path=str(tmp_path / "cache.db"), reuse_probability=1.0)
+    reopened.open()
+    assert reopened.get("m", "a") == "первый"
+    assert reopened.get("m", "b") == "второй"
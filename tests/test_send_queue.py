@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+import pytest
+from telegram.error import BadRequest, Forbidden, NetworkError, TimedOut
+
+from bot.send_queue import OutboundDispatcher
+
+
+class FlakyBot:
+    """Bot API, который сначала бросает заданные ошибки, а потом отвечает"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.sends = 0
+        self.edits = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sends += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return text
+
+    async def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        self.edits += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return text
+
+
+def run_with_dispatcher(coro_factory):
+    async def main():
+        # Без лимитов, чтобы тесты не ждали token bucket
+        dispatcher = OutboundDispatcher(global_rate=1000, chat_rate=1000, group_rate_per_minute=60000, chat_burst=100)
+        dispatcher.start()
+        try:
+            return await coro_factory(dispatcher)
+        finally:
+            await dispatcher.stop(0)
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("error", [BadRequest("Message is not modified"), Forbidden("bot was kicked")])
+def test_rejected_request_fails_without_retry(error):
+    bot = FlakyBot(error)
+
+    async def scenario(dispatcher):
+        started = time.monotonic()
+        with pytest.raises(type(error)):
+            await dispatcher.edit_message_text(bot, chat_id=-1, message_id=1, text="x")
+        return time.monotonic() - started, dispatcher
+
+    elapsed, dispatcher = run_with_dispatcher(scenario)
+    assert bot.edits == 1
+    assert dispatcher.retried == 0
+    assert elapsed < 1
+
+
+def test_send_message_timeout_is_not_resent():
+    bot = FlakyBot(TimedOut())
+
+    async def scenario(dispatcher):
+        with pytest.raises(TimedOut):
+            await dispatcher.send_message(bot, chat_id=-1, text="x")
+
+    run_with_dispatcher(scenario)
+    assert bot.sends == 1
+
+
+def test_edit_timeout_is_retried(monkeypatch):
+    bot = FlakyBot(TimedOut())
+
+    async def scenario(dispatcher):
+        # Пауза перед повтором не важна для теста
+        monkeypatch.setattr(dispatcher, "_retry_or_fail", _immediate_retry(dispatcher))
+        return await dispatcher.edit_message_text(bot, chat_id=-1, message_id=1, text="x")
+
+    assert run_with_dispatcher(scenario) == "x"
+    assert bot.edits == 2
+
+
+def test_network_error_is_retried_for_send_message(monkeypatch):
+    bot = FlakyBot(NetworkError("connection reset"))
+
+    async def scenario(dispatcher):
+        monkeypatch.setattr(dispatcher, "_retry_or_fail", _immediate_retry(dispatcher))
+        return await dispatcher.send_message(bot, chat_id=-1, text="x")
+
+    assert run_with_dispatcher(scenario) == "x"
+    assert bot.sends == 2
+
+
+def _immediate_retry(dispatcher):
+    original = dispatcher._retry_or_fail
+
+    def retry(item, error, delay):
+        original(item, error, 0)
+    return retry
+
+
+def test_edit_without_retries_fails_on_first_network_error():
+    bot = FlakyBot(NetworkError("connection reset"))
+
+    async def scenario(dispatcher):
+        with pytest.raises(NetworkError):
+            await dispatcher.edit_message_text(bot, chat_id=-1, message_id=1, text="x", max_retries=0)
+        return dispatcher
+
+    dispatcher = run_with_dispatcher(scenario)
+    assert bot.edits == 1
+    assert dispatcher.retried == 0
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+
+from bot.state_store import StateStore
+
+
+def make_store(tmp_path, states):
+    store = StateStore(str(tmp_path / "state.db"), flush_interval=0.01)
+    store.open()
+    store.set_snapshot_provider(lambda chat_id: states.get(chat_id))
+    return store
+
+
+def test_flush_writes_dirty_chats_and_update_id(tmp_path):
+    states = {1: {"counter": 3}, 2: {"counter": 5}}
+
+    async def scenario():
+        store = make_store(tmp_path, states)
+        store.mark_dirty(1)
+        store.mark_dirty(2)
+        store.record_update_id(42)
+        await store.flush()
+        await store.close()
+
+    asyncio.run(scenario())
+    reopened = StateStore(str(tmp_path / "state.db"))
+    reopened.open()
+    assert reopened.load_chats() == {1: {"counter": 3}, 2: {"counter": 5}}
+    assert reopened.load_last_update_id() == 42
+
+
+def test_close_waits_for_write_in_progress(tmp_path):
+    """close во время записи фонового цикла не начинает вторую транзакцию и не закрывает базу под ней"""
+    states = {1: {"counter": 1}}
+    write_started = threading.Event()
+    overlaps = []
+
+    async def scenario():
+        store = make_store(tmp_path, states)
+        original_write = store._write
+        active = threading.Lock()
+
+        def slow_write(*args):
+            if not active.acquire(blocking=False):
+                overlaps.append(args)
+                return
+            try:
+                write_started.set()
+                time.sleep(0.2)
+                original_write(*args)
+            finally:
+                active.release()
+
+        store._write = slow_write
+        store.start()
+        store.mark_dirty(1)
+        while not write_started.is_set():
+            await asyncio.sleep(0.005)
+        # Пока фоновая запись идет, появляются новые изменения
+        states[2] = {"counter": 2}
+        store.mark_dirty(2)
+        await store.close()
+
+    asyncio.run(scenario())
+    assert overlaps == []
+    reopened = StateStore(str(tmp_path / "state.db"))
+    reopened.open()
+    assert reopened.load_chats() == {1: {"counter": 1}, 2: {"counter": 2}}
+
+
+def test_update_id_only_moves_forward(tmp_path):
+    store = make_store(tmp_path, {})
+    store.record_update_id(10)
+    store.record_update_id(7)
+    asyncio.run(store.close())
+    reopened = StateStore(str(tmp_path / "state.db"))
+    reopened.open()
+    assert reopened.load_last_update_id() == 10
+
+
+def test_stale_update_id_is_not_loaded(tmp_path, monkeypatch):
+    store = make_store(tmp_path, {})
+    store.record_update_id(10)
+    asyncio.run(store.close())
+
+    # Через сутки Telegram уже не пришлет повторов, а нумерация может начаться заново
+    saved_at = time.time()
+    monkeypatch.setattr(time, "time", lambda: saved_at + 25 * 3600)
+    reopened = StateStore(str(tmp_path / "state.db"), update_id_max_age=24 * 3600)
+    reopened.open()
+    assert reopened.load_last_update_id() is None
+    assert reopened.update_id_expires_at() is None
+
+
+def test_update_id_accepts_lower_value_once_stale(tmp_path, monkeypatch):
+    store = make_store(tmp_path, {})
+    store.update_id_max_age = 60
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    store.record_update_id(1000)
+    store.record_update_id(5)
+    assert store._last_update_id == 1000
+
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    store.record_update_id(5)
+    assert store._last_update_id == 5
+    store._conn.close()
+
+
+def test_meta_change_alone_is_flushed(tmp_path):
+    pool = {"items": []}
+
+    async def scenario():
+        store = make_store(tmp_path, {})
+        store.add_meta_provider("content_pool", lambda: pool)
+        pool["items"] = ["шутка"]
+        store.mark_meta_dirty()
+        await store.close()
+
+    asyncio.run(scenario())
+    reopened = StateStore(str(tmp_path / "state.db"))
+    reopened.open()
+    assert reopened.load_meta_json("content_pool") == {"items": ["шутка"]}
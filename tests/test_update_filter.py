@@ -0,0 +1,26 @@
+import time
+from types import SimpleNamespace
+
+from bot.update_filter import STAGE_DUPLICATE, UpdateFilter
+
+
+def group_update(update_id):
+    message = SimpleNamespace(chat=SimpleNamespace(id=-100, type="supergroup", username=None),
+                              from_user=SimpleNamespace(id=1), text="привет")
+    return SimpleNamespace(update_id=update_id, message=message, edited_message=None)
+
+
+def test_drops_updates_up_to_resume_update_id():
+    update_filter = UpdateFilter(allow_all=True, bot_id=2, resume_update_id=10, resume_until=time.time() + 60)
+    assert not update_filter.check(group_update(9))
+    assert not update_filter.check(group_update(10))
+    assert update_filter.check(group_update(11))
+    assert update_filter.dropped[STAGE_DUPLICATE] == 2
+
+
+def test_expired_resume_update_id_is_forgotten():
+    """После срока Telegram может начать нумерацию заново: меньшие update_id уже новые обновления"""
+    update_filter = UpdateFilter(allow_all=True, bot_id=2, resume_update_id=10, resume_until=time.time() - 1)
+    assert update_filter.check(group_update(3))
+    assert update_filter.resume_update_id is None
+    assert update_filter.dropped[STAGE_DUPLICATE] == 0